@@ -0,0 +1,39 @@
+import io
+
+
+class NdjsonStream(io.RawIOBase):
+    """
+    Read-only file-like object over a generator of NDJSON byte chunks, so a load job can
+    upload the rows while they are still being built, without one big in-memory string.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._offset = 0
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # Fills b completely unless the chunks are exhausted: the resumable upload takes a
+        # read shorter than its chunk size as the end of the stream and finalizes the upload.
+        filled = 0
+        while filled < len(b):
+            if self._offset >= len(self._buffer):
+                try:
+                    self._buffer, self._offset = next(self._chunks), 0
+                except StopIteration:
+                    break
+                continue
+            size = min(len(b) - filled, len(self._buffer) - self._offset)
+            b[filled:filled + size] = memoryview(self._buffer)[self._offset:self._offset + size]
+            self._offset += size
+            filled += size
+        self._position += filled
+        return filled
+
+    def tell(self):
+        # The upload checks the stream starts at position 0, seeking is not supported
+        return self._position
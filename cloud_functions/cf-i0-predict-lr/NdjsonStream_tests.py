@@ -0,0 +1,67 @@
+import json
+import re
+import unittest
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import bigquery
+
+from NdjsonStream import NdjsonStream
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body or {}).encode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeSession:
+    """Local stand-in for the HTTP session of the BigQuery client, records the uploaded bytes."""
+    is_mtls = False
+
+    def __init__(self):
+        self.uploaded = b""
+        self.content_ranges = []
+
+    def request(self, method, url, data=None, headers=None, timeout=None, **kwargs):
+        if method == "POST":
+            return FakeResponse(200, {"location": "https://upload.example/session"})
+        self.uploaded += data
+        self.content_ranges.append(headers["content-range"])
+        if re.match(r"bytes \d+-\d+/\d+$", headers["content-range"]):
+            return FakeResponse(200, body={"jobReference": {"projectId": "p", "jobId": "j"},
+                                           "configuration": {"load": {}}})
+        return FakeResponse(308, {"range": f"bytes=0-{len(self.uploaded) - 1}"})
+
+
+def _chunks(count, size):
+    for i in range(count):
+        yield (json.dumps({"i": i, "text": "x" * (size - 20)})[:size - 1] + "\n").encode("utf-8")
+
+
+class TestNdjsonStream(unittest.TestCase):
+
+    def test_read_fills_across_chunks(self):
+        stream = NdjsonStream([b"ab", b"", b"cde", b"f"])
+        self.assertEqual(stream.read(4), b"abcd")
+        self.assertEqual(stream.read(4), b"ef")
+        self.assertEqual(stream.read(4), b"")
+        self.assertEqual(stream.tell(), 6)
+
+    def test_load_table_from_file_uploads_all_chunks(self):
+        session = FakeSession()
+        client = bigquery.Client(project="p", credentials=AnonymousCredentials(), _http=session)
+        expected = b"".join(_chunks(3, 80000))
+
+        client.load_table_from_file(NdjsonStream(_chunks(3, 80000)), "p.d.t", job_config=bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON))
+
+        self.assertEqual(session.uploaded, expected)
+        self.assertEqual(session.content_ranges[-1], f"bytes 0-{len(expected) - 1}/{len(expected)}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import logging
+import pickle
+import threading
+from collections import OrderedDict
+
+import joblib
+
+
+def deserialize(object_fn: str, data: bytes):
+    """Unpickles a model or vectorizer, the save method is given by the file extension."""
+    method = object_fn.split(".")[-1]
+    if method == "pkl":
+        return pickle.loads(data)
+    elif method == "joblib":
+        return joblib.load(io.BytesIO(data))
+    raise Exception(f"No such save method: {method}")
+
+
+class ObjectCache:
+    """
+    In-process LRU cache of models and vectorizers, keyed by (training_dt, object_fn).
+
+    It lives at module level, so it survives across invocations of a warm Cloud Function instance.
+    Every lookup fetches only the blob metadata and compares its generation with the cached one;
+    the object is downloaded and unpickled again only when the blob was overwritten.
+    """
+
+    def __init__(self, bucket, prefix: str = "models/lr", max_size: int = 4):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_size = max_size
+        self._objects = OrderedDict()  # (training_dt, object_fn) -> (generation, object)
+        self._lock = threading.Lock()
+
+    def blob_name(self, training_dt: str, object_fn: str) -> str:
+        return f"{self.prefix}/{training_dt}/{object_fn}"
+
+    def get(self, training_dt: str, object_fn: str):
+        key = (training_dt, object_fn)
+        blob_name = self.blob_name(training_dt, object_fn)
+        blob = self.bucket.get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket.name}/{blob_name} does not exist")
+
+        with self._lock:
+            cached = self._objects.get(key)
+            if cached is not None and cached[0] == blob.generation:
+                self._objects.move_to_end(key)
+                logging.info(f"ObjectCache: hit for {blob_name} (generation {blob.generation})")
+                return cached[1]
+
+        # Download the generation the metadata was read from, so object and generation match
+        data = blob.download_as_bytes(if_generation_match=blob.generation)
+        python_object = deserialize(object_fn, data)
+        logging.info(f"ObjectCache: loaded gs://{self.bucket.name}/{blob_name} (generation {blob.generation})")
+
+        with self._lock:
+            self._objects[key] = (blob.generation, python_object)
+            self._objects.move_to_end(key)
+            while len(self._objects) > self.max_size:
+                evicted_key, _ = self._objects.popitem(last=False)
+                logging.info(f"ObjectCache: evicted {evicted_key}")
+        return python_object
+
+    def latest_training_dt(self) -> str:
+        """Returns the newest training_dt folder below the prefix (the names are sortable timestamps)."""
+        blobs = self.bucket.list_blobs(prefix=f"{self.prefix}/", delimiter="/")
+        list(blobs)  # The prefixes are only filled after iterating the result
+        training_dts = [prefix.rstrip("/").split("/")[-1] for prefix in blobs.prefixes]
+        if not training_dts:
+            raise FileNotFoundError(f"No models found in gs://{self.bucket.name}/{self.prefix}/")
+        return max(training_dts)
+
+    def prefetch(self, object_fns: list, training_dt: str = None) -> None:
+        """Loads the given objects of training_dt (default: the latest) into the cache."""
+        training_dt = training_dt or self.latest_training_dt()
+        for object_fn in object_fns:
+            self.get(training_dt, object_fn)
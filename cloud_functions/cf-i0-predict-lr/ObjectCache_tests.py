@@ -0,0 +1,84 @@
+import pickle
+import unittest
+
+from ObjectCache import ObjectCache
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.generation = bucket.generations[name]
+
+    def download_as_bytes(self, if_generation_match=None):
+        self.bucket.downloads += 1
+        return self.bucket.objects[self.name]
+
+
+class FakeListing(list):
+    def __init__(self, prefixes):
+        super().__init__()
+        self.prefixes = prefixes
+
+
+class FakeBucket:
+    """Local stand-in for google.cloud.storage.Bucket."""
+
+    def __init__(self):
+        self.name = "fake-bucket"
+        self.objects = {}
+        self.generations = {}
+        self.downloads = 0
+
+    def upload(self, name, python_object):
+        self.objects[name] = pickle.dumps(python_object)
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+    def list_blobs(self, prefix, delimiter):
+        return FakeListing({name[:name.index("/", len(prefix)) + 1] for name in self.objects})
+
+
+class TestObjectCache(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket = FakeBucket()
+        self.cache = ObjectCache(self.bucket, max_size=2)
+
+    def test_hit_does_not_download(self):
+        self.bucket.upload("models/lr/20241002/vec.pkl", {"vocabulary": 1})
+        self.cache.get("20241002", "vec.pkl")
+        self.cache.get("20241002", "vec.pkl")
+        self.assertEqual(self.bucket.downloads, 1)
+
+    def test_new_generation_is_reloaded(self):
+        self.bucket.upload("models/lr/20241002/vec.pkl", {"vocabulary": 1})
+        self.cache.get("20241002", "vec.pkl")
+        self.bucket.upload("models/lr/20241002/vec.pkl", {"vocabulary": 2})
+        self.assertEqual(self.cache.get("20241002", "vec.pkl"), {"vocabulary": 2})
+        self.assertEqual(self.bucket.downloads, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        for training_dt in ("1", "2", "3"):
+            self.bucket.upload(f"models/lr/{training_dt}/model.pkl", training_dt)
+        self.cache.get("1", "model.pkl")
+        self.cache.get("2", "model.pkl")
+        self.cache.get("1", "model.pkl")
+        self.cache.get("3", "model.pkl")
+        self.cache.get("1", "model.pkl")
+        self.assertEqual(self.bucket.downloads, 3)
+        self.cache.get("2", "model.pkl")
+        self.assertEqual(self.bucket.downloads, 4)
+
+    def test_prefetch_latest(self):
+        self.bucket.upload("models/lr/20241002/model.pkl", "old")
+        self.bucket.upload("models/lr/20250101/model.pkl", "new")
+        self.cache.prefetch(["model.pkl"])
+        self.assertEqual(self.cache.get("20250101", "model.pkl"), "new")
+        self.assertEqual(self.bucket.downloads, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,7 +8,6 @@ Vectorizes the raw data and performs prediction.
 import logging
 import traceback
 import backoff
-import json
 import google.cloud.logging
 from google.cloud import storage
 from google.cloud import bigquery
@@ -17,11 +16,10 @@ import os
 from datetime import datetime,timezone
 from FeatureEngineering import FeatureEngineering
 from TechInfo import TechInfo
+from ObjectCache import ObjectCache
+from NdjsonStream import NdjsonStream
+import numpy as np
 import pandas as pd
-from pathlib import Path
-import pickle
-import joblib
-from io import StringIO
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
@@ -37,6 +35,22 @@ logging.getLogger('backoff').addHandler(logging.StreamHandler())
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'af-finanzen-banks')
 PRED_TABLE_NAME = os.environ.get('PRED_TABLE_NAME', 'transak.i0_predictions')
 DEBUG_MODE = os.getenv("DEBUG", "false").lower() == "true"
+ROWS_CHUNK_SIZE = int(os.environ.get('ROWS_CHUNK_SIZE', '10000'))
+PROBA_DECIMALS = 6
+OBJECT_CACHE_SIZE = int(os.environ.get('OBJECT_CACHE_SIZE', '4'))
+# Comma separated object file names (e.g. "vec_tfidf.pkl,log_reg_tfidf_acc_0.44.joblib") to load at cold start
+PREFETCH_OBJECT_FNS = [fn for fn in os.environ.get('PREFETCH_OBJECT_FNS', '').split(',') if fn]
+PREFETCH_TRAINING_DT = os.environ.get('PREFETCH_TRAINING_DT')  # Defaults to the latest training_dt
+
+# Created once per instance and reused by all invocations of a warm instance
+storage_client = storage.Client()
+object_cache = ObjectCache(storage_client.bucket(BUCKET_NAME), max_size=OBJECT_CACHE_SIZE)
+if PREFETCH_OBJECT_FNS:
+    try:
+        object_cache.prefetch(PREFETCH_OBJECT_FNS, PREFETCH_TRAINING_DT)
+    except Exception as e:
+        # A failed prefetch must not fail the cold start, the objects are loaded on request then
+        logging.warning(f"Prefetch of {PREFETCH_OBJECT_FNS} failed: {str(e)}")
 
 
 def parse_request(request) -> TechInfo:
@@ -70,28 +84,12 @@ def parse_request(request) -> TechInfo:
 
 @backoff.on_exception(backoff.expo, Exception, max_tries=5)
 def load_from_gcs(training_dt: str = None, object_fn:str = None):
-    """Loads the model or vectorizer from Google Cloud Storage."""
-    bucket_name = "af-finanzen-banks"
-    method = object_fn.split(".")[-1]
-    blob_name = f"models/lr/{training_dt}/{object_fn}"
-
+    """Loads the model or vectorizer from Google Cloud Storage, served from the instance cache while unchanged."""
+    blob_name = object_cache.blob_name(training_dt, object_fn)
     try:
-        gs = storage.Client()
-        bucket = gs.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        file_path = Path("/tmp") / object_fn
-        blob.download_to_filename(file_path)
-        with open(file_path, 'rb') as f:
-            if method == "pkl":
-                python_object = pickle.load(f)
-            elif method == "joblib":
-                python_object = joblib.load(f)
-            else:
-                raise Exception(f"No such save method: {method}")
-        print(f"Loaded object from gs://{bucket_name}/{blob_name}")
-        return python_object
+        return object_cache.get(training_dt, object_fn)
     except Exception as e:
-        raise Exception(f"Error loading object from gs://{bucket_name}/{blob_name}: {str(e)}")
+        raise Exception(f"Error loading object from gs://{BUCKET_NAME}/{blob_name}: {str(e)}")
 
 
 @backoff.on_exception(backoff.expo, Exception, max_tries=5)
@@ -122,40 +120,54 @@ def predict(X_pred, model):
     return y_pred, y_pred_proba
 
 
+def decode_labels(label_decoder, y_pred) -> np.ndarray:
+    """Maps the predicted class ids to their labels in one vectorized lookup."""
+    return pd.Series(y_pred).map(label_decoder).to_numpy()
+
+
 def make_rows(label_decoder, raw_data, y_pred, y_pred_proba, tech_info):
+    """
+    Builds the NDJSON rows column-wise: labels are decoded in bulk, the probabilities are rounded as one
+    2-D array and the constant columns are broadcast. Chunks of ROWS_CHUNK_SIZE rows are serialized by
+    pandas only when the returned stream is read.
+    """
     now_utc = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
     logging.info(f"make_rows: now_utc {now_utc}")
-    json_rows = []
-    for i, row in raw_data.iterrows():
-        json_rows.append({
-            "bank": "Revolut",
-            "description": row['description'],
-            "true_label": None,
-            "pred_label": label_decoder[y_pred[i]],
-            "y_pred": y_pred[i].tolist(),
-            "y_proba": y_pred_proba[i].tolist(),
-            "training_dt": tech_info.training_dt,
-            "vectorizer_fn": tech_info.vectorizer_fn,
-            "model_fn": tech_info.model_fn,
-            "month": tech_info.month,
-            "cre_ts": now_utc # in batch load there is no AUTO, only in streaming,
-            # but then I can not update true labels immediately after load, so this has default value in schema
-            # but this also do not work, so I ended with building timestamp myself
-        })
-    rows_count = len(json_rows)
-    nd_json_rows = "\n".join([json.dumps(row) for row in json_rows])
-    return nd_json_rows, rows_count
+    rows = pd.DataFrame({
+        "bank": "Revolut",
+        "description": raw_data['description'].to_numpy(),
+        "true_label": None,
+        "pred_label": decode_labels(label_decoder, y_pred),
+        "y_pred": y_pred,
+        "y_proba": list(np.round(y_pred_proba, PROBA_DECIMALS)),
+        "training_dt": tech_info.training_dt,
+        "vectorizer_fn": tech_info.vectorizer_fn,
+        "model_fn": tech_info.model_fn,
+        "month": tech_info.month,
+        "cre_ts": now_utc # in batch load there is no AUTO, only in streaming,
+        # but then I can not update true labels immediately after load, so this has default value in schema
+        # but this also do not work, so I ended with building timestamp myself
+    })
+
+    def chunks():
+        for start in range(0, len(rows), ROWS_CHUNK_SIZE):
+            chunk = rows.iloc[start:start + ROWS_CHUNK_SIZE]
+            yield chunk.to_json(orient="records", lines=True, force_ascii=False,
+                                double_precision=PROBA_DECIMALS).rstrip("\n").encode("utf-8") + b"\n"
+
+    return NdjsonStream(chunks()), len(rows)
 
 
 @backoff.on_exception(backoff.expo, Exception, max_tries=5)
 def load2bq(label_decoder, raw_data, y_pred, y_pred_proba, tech_info):
-    nd_json_rows, rows_count = make_rows(label_decoder, raw_data, y_pred, y_pred_proba, tech_info)
+    nd_json_stream, rows_count = make_rows(label_decoder, raw_data, y_pred, y_pred_proba, tech_info)
     bq = bigquery.Client()
     table = bq.get_table(PRED_TABLE_NAME)
 
     logging.info(f"load2bq: Inserting {rows_count} predictions into BigQuery table {PRED_TABLE_NAME}")
     if tech_info.debug:
-        logging.info(f"load2bq: nd_json_rows: {nd_json_rows}")
+        sample_stream, _ = make_rows(label_decoder, raw_data.head(5), y_pred[:5], y_pred_proba[:5], tech_info)
+        logging.info(f"load2bq: first nd_json_rows: {sample_stream.read().decode('utf-8')}")
 
     try:
         # Load the data
@@ -164,7 +176,7 @@ def load2bq(label_decoder, raw_data, y_pred, y_pred_proba, tech_info):
             source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
         )
         job = bq.load_table_from_file(
-            StringIO(nd_json_rows), table, job_config=job_config
+            nd_json_stream, table, job_config=job_config
         )
         job.result()
         if job.errors:
@@ -191,13 +203,10 @@ def start(request):
     errors = job.errors
 
     # Prepare data for return
-    predictions_txt = []
-    for description, pred_class in zip(raw_data['description'], y_pred):
-        pred_label=fe.label_decoder[pred_class]
-        predictions_txt.append({
-            "Description": description,
-            "Predicted Label": pred_label
-        })
+    predictions_txt = pd.DataFrame({
+        "Description": raw_data['description'].to_numpy(),
+        "Predicted Label": decode_labels(fe.label_decoder, y_pred),
+    }).to_dict(orient="records")
     return {"predictions": predictions_txt, "errors": errors, "version": __version__}, 200
 
 
@@ -0,0 +1,129 @@
+__author__ = "artur.fejklowicz@gmail.com"
+__version__ = '0.1.0'
+__doc__ = """
+Page-chunked extraction of the transactions of a long ZAK statement.
+The PDF is split into page ranges, each range is sent to the chat model in its own call
+(concurrently, in a bounded thread pool) and the CSV fragments are merged in page order.
+A single response is no longer cut off at max_tokens and the latency is bounded by the
+slowest page range instead of the whole document.
+"""
+
+import base64
+import csv
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.messages import HumanMessage
+from pypdf import PdfReader, PdfWriter
+
+PAGES_PER_CHUNK = 2
+MAX_WORKERS = 4
+KEY_COLUMN = "buchungsnr"
+CHUNK_MESSAGE = """
+This file contains pages {first_page}-{last_page} of {page_count} of the statement.
+Extract only the transactions on these pages and start with the header row, also if there are no transactions.
+"""
+
+
+class PdfChunk:
+    """Page range of the statement as a PDF of its own"""
+
+    def __init__(self, first_page: int, last_page: int, page_count: int, pdf_bytes: bytes):
+        self.first_page = first_page
+        self.last_page = last_page
+        self.page_count = page_count
+        self.pdf_bytes = pdf_bytes
+
+    def message(self, user_message: str) -> HumanMessage:
+        """The extraction prompt with the page range inlined as base64 PDF"""
+        text_message = {
+            "type": "text",
+            "text": user_message + CHUNK_MESSAGE.format(
+                first_page=self.first_page, last_page=self.last_page, page_count=self.page_count),
+        }
+        pdf_message = {
+            "type": "image_url",
+            "image_url": {"url": "data:application/pdf;base64," + base64.b64encode(self.pdf_bytes).decode("ascii")},
+        }
+        return HumanMessage(content=[text_message, pdf_message])
+
+
+def split_pdf(pdf_bytes: bytes, pages_per_chunk: int = PAGES_PER_CHUNK) -> List[PdfChunk]:
+    """Splits the PDF into chunks of pages_per_chunk pages (page numbers start with 1)"""
+    if pages_per_chunk < 1:
+        raise ValueError(f"pages_per_chunk must be at least 1, got {pages_per_chunk}")
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    chunks = []
+    for start in range(0, page_count, pages_per_chunk):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_chunk]:
+            writer.add_page(page)
+        chunk_bytes = io.BytesIO()
+        writer.write(chunk_bytes)
+        chunks.append(PdfChunk(start + 1, min(start + pages_per_chunk, page_count), page_count, chunk_bytes.getvalue()))
+    logging.info(f"split_pdf: {page_count} pages in {len(chunks)} chunks")
+    return chunks
+
+
+def extract_chunks(chat_model, chunks: List[PdfChunk], user_message: str, max_workers: int = MAX_WORKERS) -> list:
+    """
+    Sends each chunk to the chat model, at most max_workers at the same time.
+    :param chat_model: Chat model with invoke(messages), e.g. ChatVertexAI (which retries failed calls itself)
+    :return: The responses in page order
+    """
+    def extract(chunk: PdfChunk):
+        logging.info(f"extract_chunks: pages {chunk.first_page}-{chunk.last_page} start")
+        response = chat_model.invoke([chunk.message(user_message)])
+        logging.info(f"extract_chunks: pages {chunk.first_page}-{chunk.last_page} done")
+        return response
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map() returns the results in the order of the chunks, whichever call finishes first
+        return list(executor.map(extract, chunks))
+
+
+def _csv_rows(fragment: str) -> List[List[str]]:
+    """Parses a CSV fragment, also if the model wrapped it in a markdown code block"""
+    lines = [line for line in fragment.strip().splitlines() if not line.strip().startswith("```")]
+    return [row for row in csv.reader(lines) if any(field.strip() for field in row)]
+
+
+def merge_csv_fragments(fragments: List[str], key_column: str = KEY_COLUMN) -> str:
+    """
+    Merges the CSV fragments of the chunks in the given (page) order into one CSV.
+    The header row is written once, repeated header rows are dropped and a transaction
+    extracted from two chunks (e.g. at a page break) is kept once, by its key column.
+    Rows that do not match the header are dropped.
+    """
+    header = None
+    seen_keys = set()
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    for i, fragment in enumerate(fragments):
+        for row in _csv_rows(fragment):
+            normalized = [field.strip().lower() for field in row]
+            if header is None:
+                if key_column not in normalized:
+                    logging.warning(f"merge_csv_fragments: dropped row before header in fragment {i}: {row}")
+                    continue
+                header = normalized
+                key_index = header.index(key_column)
+                writer.writerow(header)
+                continue
+            if normalized == header:
+                continue
+            if len(row) != len(header):
+                logging.warning(f"merge_csv_fragments: dropped row with {len(row)} instead of {len(header)} fields in fragment {i}: {row}")
+                continue
+            key = row[key_index].strip()
+            if key:
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+            writer.writerow(row)
+    if header is None:
+        raise ValueError(f"No CSV header with column {key_column} found in the model responses")
+    return output.getvalue()
@@ -0,0 +1,94 @@
+import base64
+import io
+import re
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from pypdf import PdfReader, PdfWriter
+
+from ChunkedExtraction import extract_chunks, merge_csv_fragments, split_pdf
+
+HEADER = "buchungsnr,datum,valuta,empfanger,belastung,gutschrift,saldo,text"
+
+
+def make_pdf(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=595, height=842)
+    pdf_bytes = io.BytesIO()
+    writer.write(pdf_bytes)
+    return pdf_bytes.getvalue()
+
+
+def transaction(page: int) -> str:
+    return f'{1000 + page},2025-01-{page:02d},2025-01-{page:02d},"Empfanger {page}",10.00,0.00,{900 - page}.00,"Text {page}"'
+
+
+class StubChatModel:
+    """
+    Stand-in for ChatVertexAI. Answers with one transaction per page of the chunk, repeats
+    the last transaction of the previous page (as at a page break) and answers the first
+    pages slowest, so the calls finish out of page order.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        text, pdf = messages[0].content
+        first_page, last_page, page_count = map(int, re.search(r"pages (\d+)-(\d+) of (\d+)", text["text"]).groups())
+        pdf_bytes = base64.b64decode(pdf["image_url"]["url"].split(",", 1)[1])
+        assert len(PdfReader(io.BytesIO(pdf_bytes)).pages) == last_page - first_page + 1
+
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01 * (page_count - first_page))
+        with self._lock:
+            self.running -= 1
+
+        rows = [transaction(page) for page in range(max(first_page - 1, 1), last_page + 1)]
+        return SimpleNamespace(id=f"run-{first_page}", content="```csv\n" + "\n".join([HEADER] + rows) + "\n```")
+
+
+class TestChunkedExtraction(unittest.TestCase):
+
+    def test_split_pdf(self):
+        chunks = split_pdf(make_pdf(5), pages_per_chunk=2)
+        self.assertEqual([(chunk.first_page, chunk.last_page) for chunk in chunks], [(1, 2), (3, 4), (5, 5)])
+        self.assertEqual([len(PdfReader(io.BytesIO(chunk.pdf_bytes)).pages) for chunk in chunks], [2, 2, 1])
+
+    def test_extract_and_merge_in_page_order(self):
+        chat_model = StubChatModel()
+        chunks = split_pdf(make_pdf(7), pages_per_chunk=2)
+        responses = extract_chunks(chat_model, chunks, "Extract", max_workers=2)
+
+        self.assertEqual([response.id for response in responses], ["run-1", "run-3", "run-5", "run-7"])
+        self.assertEqual(chat_model.calls, 4)
+        self.assertLessEqual(chat_model.max_running, 2)
+
+        merged = merge_csv_fragments([response.content for response in responses])
+        # One header, each transaction once, in page order
+        self.assertEqual(merged.splitlines(), [HEADER] + [transaction(page).replace('"', "") for page in range(1, 8)])
+
+    def test_merge_drops_rows_not_matching_header(self):
+        merged = merge_csv_fragments([
+            "I found these transactions:\n" + HEADER + "\n" + transaction(1),
+            "There are no transactions on these pages.",
+            HEADER + "\n1002,2025-01-02,only,four",
+        ])
+        self.assertEqual(merged.splitlines(), [HEADER, transaction(1).replace('"', "")])
+
+    def test_merge_without_header(self):
+        with self.assertRaises(ValueError):
+            merge_csv_fragments(["I can not read this file."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+__author__ = "artur.fejklowicz@gmail.com"
+__version__ = '0.1.0'
+__doc__ = """
+Cache of the extracted CSVs, keyed by the PDF content and everything that changes the model answer
+(prompt, model, temperature, top_p, page chunking). The CSV in the bucket is the cache entry,
+so posting the same statement again skips the model call and reloads the same CSV.
+A new CSV is written to a staging name and becomes the cache entry only after it was loaded
+into BigQuery, so a refused, truncated or invalid answer is never served from the cache.
+"""
+
+import hashlib
+import json
+import logging
+import uuid
+
+PREFIX = "cf-pdf2bq/"
+
+
+def pdf_content_hash(pdf_blob) -> str:
+    """MD5 hash of the PDF from the object metadata, the SHA-256 of the content for objects without MD5 (composite)"""
+    if pdf_blob.md5_hash:
+        return pdf_blob.md5_hash
+    return hashlib.sha256(pdf_blob.download_as_bytes()).hexdigest()
+
+
+def extraction_key(pdf_hash: str, **parameters) -> str:
+    """Key of an extraction, e.g. extraction_key(pdf_hash, user_message=..., temperature=0.0, top_p=0.1)"""
+    key_json = json.dumps({"pdf_hash": pdf_hash, **parameters}, sort_keys=True)
+    return hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Extracted CSVs as objects below a prefix in the bucket, one per key"""
+
+    def __init__(self, bucket, prefix: str = PREFIX):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def blob_name(self, key: str) -> str:
+        return f"{self.prefix}bank_zak_transactions_{key}.csv"
+
+    def staging_blob_name(self, key: str) -> str:
+        """Unique name for a new CSV of the key, until it is committed"""
+        return f"{self.prefix}staging/bank_zak_transactions_{key}_{uuid.uuid4().hex}.csv"
+
+    def commit(self, staging_blob_name: str, key: str) -> str:
+        """Copies the loaded CSV to the cache entry of the key and deletes the staging object"""
+        staging_blob = self.bucket.blob(staging_blob_name)
+        blob_name = self.blob_name(key)
+        self.bucket.copy_blob(staging_blob, self.bucket, blob_name)
+        staging_blob.delete()
+        logging.info(f"ExtractionCache: stored gs://{self.bucket.name}/{blob_name}")
+        return blob_name
+
+    def discard(self, staging_blob_name: str) -> None:
+        """Deletes a CSV that could not be loaded"""
+        try:
+            self.bucket.blob(staging_blob_name).delete()
+        except Exception as e:
+            logging.warning(f"ExtractionCache: could not delete {staging_blob_name}: {e}")
+
+    def get(self, key: str):
+        """Returns the blob name of the cached CSV, None on a miss"""
+        blob_name = self.blob_name(key)
+        if self.bucket.get_blob(blob_name) is None:
+            logging.info(f"ExtractionCache: miss for {key}")
+            return None
+        logging.info(f"ExtractionCache: hit for {key}, reusing gs://{self.bucket.name}/{blob_name}")
+        return blob_name
@@ -0,0 +1,70 @@
+import unittest
+from types import SimpleNamespace
+
+from ExtractionCache import ExtractionCache, extraction_key, pdf_content_hash
+
+
+class FakeBucket:
+    """Local stand-in for google.cloud.storage.Bucket"""
+
+    def __init__(self, names=()):
+        self.name = "fake-bucket"
+        self.names = set(names)
+
+    def get_blob(self, name):
+        return SimpleNamespace(name=name) if name in self.names else None
+
+    def blob(self, name):
+        return SimpleNamespace(name=name, delete=lambda: self.names.remove(name))
+
+    def copy_blob(self, blob, destination_bucket, new_name):
+        destination_bucket.names.add(new_name)
+
+
+class TestExtractionCache(unittest.TestCase):
+
+    def test_key_depends_on_content_and_parameters(self):
+        key = extraction_key("md5-a", user_message="Extract", temperature=0.0, top_p=0.1)
+        self.assertEqual(key, extraction_key("md5-a", top_p=0.1, temperature=0.0, user_message="Extract"))
+        self.assertNotEqual(key, extraction_key("md5-b", user_message="Extract", temperature=0.0, top_p=0.1))
+        self.assertNotEqual(key, extraction_key("md5-a", user_message="Extract!", temperature=0.0, top_p=0.1))
+        self.assertNotEqual(key, extraction_key("md5-a", user_message="Extract", temperature=0.5, top_p=0.1))
+
+    def test_pdf_content_hash(self):
+        self.assertEqual(pdf_content_hash(SimpleNamespace(md5_hash="abc==")), "abc==")
+        # Composite objects have no MD5 hash, the content is hashed
+        composite = SimpleNamespace(md5_hash=None, download_as_bytes=lambda: b"%PDF")
+        self.assertEqual(len(pdf_content_hash(composite)), 64)
+
+    def test_get(self):
+        key = extraction_key("md5-a", user_message="Extract")
+        cache = ExtractionCache(FakeBucket())
+        self.assertIsNone(cache.get(key))
+
+        cache.bucket.names.add(cache.blob_name(key))
+        self.assertEqual(cache.get(key), f"cf-pdf2bq/bank_zak_transactions_{key}.csv")
+
+    def test_commit_after_load(self):
+        key = extraction_key("md5-a", user_message="Extract")
+        cache = ExtractionCache(FakeBucket())
+        staging_blob_name = cache.staging_blob_name(key)
+        self.assertNotEqual(staging_blob_name, cache.staging_blob_name(key))
+
+        cache.bucket.names.add(staging_blob_name)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.commit(staging_blob_name, key), cache.blob_name(key))
+        self.assertEqual(cache.bucket.names, {cache.blob_name(key)})
+
+    def test_discard_failed_load(self):
+        key = extraction_key("md5-a", user_message="Extract")
+        cache = ExtractionCache(FakeBucket())
+        staging_blob_name = cache.staging_blob_name(key)
+        cache.bucket.names.add(staging_blob_name)
+
+        cache.discard(staging_blob_name)
+        self.assertEqual(cache.bucket.names, set())
+        self.assertIsNone(cache.get(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
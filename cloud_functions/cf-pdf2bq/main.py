@@ -18,6 +18,8 @@ from google.cloud import storage
 from google.cloud import bigquery
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_google_vertexai import ChatVertexAI
+from ChunkedExtraction import MAX_WORKERS, extract_chunks, merge_csv_fragments, split_pdf
+from ExtractionCache import ExtractionCache, extraction_key, pdf_content_hash
 
 USER_MESSAGE = """Extract bank transactions from this file and put then in csv format please.
 Your response must be only the raw CSV content, without any markdown, formatting, or explanations. Start directly with the header row.
@@ -37,8 +39,11 @@ Here is an example of the required format:
 buchungsnr,datum,valuta,empfanger,belastung,gutschrift,saldo,text
 12345,2025-01-01,2025-01-01,"Example Recipient",50.25,0.00,1000.00,"Example text"
 """
+MODEL = "gemini-2.0-flash-exp"
 TEMPERATURE = 0.0
 TOP_P = 0.1
+# Pages sent to the model per call, 0 sends the whole PDF in one call
+PAGES_PER_CHUNK = int(os.environ.get("PAGES_PER_CHUNK", 2))
 
 
 # setup logging
@@ -47,7 +52,18 @@ log_client.setup_logging()
 logging.basicConfig(level=logging.INFO)
 logging.getLogger('backoff').addHandler(logging.StreamHandler())
 
-def parse_request(request) -> tuple[str, str, float, float]:
+def parse_bool(value) -> bool:
+    """Request flag as bool, also when it is sent as string ("false" is False)"""
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("true", "1"):
+        return True
+    if str(value).strip().lower() in ("false", "0"):
+        return False
+    raise ValueError(f"Not a boolean: {value}")
+
+
+def parse_request(request) -> tuple[str, str, float, float, int, bool]:
     logging.info(f"parse_request: start")
     try:
         request_json = request.get_json()
@@ -60,11 +76,25 @@ def parse_request(request) -> tuple[str, str, float, float]:
     user_message = str(request_json.get('user_message', USER_MESSAGE))
     temperatur = float(request_json.get('temperature', TEMPERATURE))
     top_p = float(request_json.get('top_p', TOP_P))
+    pages_per_chunk = int(request_json.get('pages_per_chunk', PAGES_PER_CHUNK))
+    use_cache = parse_bool(request_json.get('use_cache', True))
     logging.info(f"parse_request: temperatur: {temperatur}" )
     logging.info(f"parse_request: user_message: {user_message}" )
     logging.info(f"parse_request: top_p: {top_p}" )
+    logging.info(f"parse_request: pages_per_chunk: {pages_per_chunk}" )
+    logging.info(f"parse_request: use_cache: {use_cache}" )
+
+    return (pdf_uri, user_message, temperatur, top_p, pages_per_chunk, use_cache)
+
 
-    return (pdf_uri, user_message, temperatur, top_p)
+@backoff.on_exception(backoff.expo, Exception, max_time=60, max_tries=3)
+def get_pdf_blob(pdf_uri):
+    """Returns the blob (with metadata) of the PDF gs://bucket/object"""
+    bucket_name, blob_name = pdf_uri.replace("gs://", "").split("/", 1)
+    pdf_blob = storage.Client().bucket(bucket_name).get_blob(blob_name)
+    if pdf_blob is None:
+        raise FileNotFoundError(f"{pdf_uri} does not exist")
+    return pdf_blob
 
 
 def load_csv_to_bq(bucket_name, blob_name):
@@ -108,15 +138,47 @@ def save_to_gcs(content, blob_name):
     logging.info(f"save_to_gcs: end, bucket_name: {bucket_name}")
     return bucket_name
 
+def load_and_cache(content, cache, key):
+    """
+    Saves the CSV under a staging name and loads it into BigQuery. Only a CSV that BigQuery
+    accepted becomes the cache entry of the key, a rejected one is deleted.
+    """
+    staging_blob_name = cache.staging_blob_name(key)
+    bucket_name = save_to_gcs(content, staging_blob_name)
+    try:
+        load_csv_to_bq(bucket_name, staging_blob_name)
+    except Exception:
+        cache.discard(staging_blob_name)
+        raise
+    cache.commit(staging_blob_name, key)
+
+
 def start(request):
     """Starts loading of model, processing of features and prediction."""
     logging.info(f"start: start")
     
     # Parse request
-    pdf_uri, user_message, temperatur, top_p = parse_request(request)
+    pdf_uri, user_message, temperatur, top_p, pages_per_chunk, use_cache = parse_request(request)
+
+    # The same statement with the same prompt and parameters was already extracted
+    pdf_blob = get_pdf_blob(pdf_uri)
+    bucket_name = os.environ.get("BUCKET_NAME", "af-finanzen")
+    cache = ExtractionCache(storage.Client().bucket(bucket_name))
+    key = extraction_key(
+        pdf_content_hash(pdf_blob),
+        user_message=user_message,
+        model=MODEL,
+        temperature=temperatur,
+        top_p=top_p,
+        pages_per_chunk=pages_per_chunk,
+    )
+    blob_name = cache.get(key) if use_cache else None
+    if blob_name is not None:
+        load_csv_to_bq(bucket_name, blob_name)
+        return "OK", 200
 
     gemini = ChatVertexAI(
-        model="gemini-2.0-flash-exp",
+        model=MODEL,
         temperature=temperatur,
         max_tokens=8192,
         timeout=None,
@@ -130,6 +192,13 @@ If you can not do something or you do not know, you simply says that you can not
     
     system_msg = SystemMessage(content=system_msg)
 
+    if pages_per_chunk > 0:
+        # Page ranges are extracted concurrently, so a long statement is not truncated at max_tokens
+        chunks = split_pdf(pdf_blob.download_as_bytes(if_generation_match=pdf_blob.generation), pages_per_chunk)
+        responses = extract_chunks(gemini, chunks, user_message, max_workers=MAX_WORKERS)
+        load_and_cache(merge_csv_fragments([response.content for response in responses]), cache, key)
+        return "OK", 200
+
     pdf_message = {
         "type": "image_url",
         "image_url": {"url": pdf_uri},
@@ -144,11 +213,8 @@ If you can not do something or you do not know, you simply says that you can not
     logging.info(f"Prompt: {message}")
 
     gemini_msg = gemini.invoke([message])
-    
-    blob_name = f"cf-pdf2bq/bank_zak_transactions_{gemini_msg.id}.csv"
-    bucket_name = save_to_gcs(gemini_msg.content, blob_name)
 
-    load_csv_to_bq(bucket_name, blob_name)
+    load_and_cache(gemini_msg.content, cache, key)
 
     return "OK", 200
 
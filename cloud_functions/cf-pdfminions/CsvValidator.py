@@ -0,0 +1,100 @@
+__author__ = "artur.fejklowicz@gmail.com"
+__version__ = '0.1.0'
+__doc__ = """
+Deterministic validation of the extractor output against the BigQuery schema banks.zak.json
+(kept as a copy of cf-pdf2bq/banks.zak.json, as each Cloud Function is deployed from its own directory).
+Replaces the LLM assessor: the errors are returned as structured data the extractor can fix.
+"""
+
+import csv
+import json
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+from typing_extensions import TypedDict
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "banks.zak.json")
+DATE_FORMAT = "%Y-%m-%d"
+# Digits with an optional decimal part, no thousands separators (1'234.50, 1,234.50 or 1 234.50)
+FLOAT_PATTERN = re.compile(r"-?\d+(\.\d+)?")
+INTEGER_PATTERN = re.compile(r"-?\d+")
+
+
+class ValidationError(TypedDict):
+    row: int  # 0 is the header row
+    column: Optional[str]
+    value: Optional[str]
+    message: str
+
+
+class ValidationResult(TypedDict):
+    valid: bool
+    rows: int
+    errors: List[ValidationError]
+
+
+def load_schema(schema_path: str = SCHEMA_PATH) -> list:
+    with open(schema_path) as f:
+        return json.load(f)
+
+
+def schema_header(schema: list = None) -> str:
+    """The CSV header validate_csv expects: the column names of the schema in schema order"""
+    return ",".join(field["name"] for field in schema or load_schema())
+
+
+def _csv_lines(text: str) -> List[str]:
+    """Lines of the CSV, without a markdown code block around it"""
+    return [line for line in text.strip().splitlines() if not line.strip().startswith("```")]
+
+
+def _field_error(field: dict, value: str) -> Optional[str]:
+    value = value.strip()
+    if value == "":
+        return None if field.get("mode", "NULLABLE") == "NULLABLE" else "Value is required"
+    if field["type"] == "INTEGER" and not INTEGER_PATTERN.fullmatch(value):
+        return "Not an integer"
+    if field["type"] == "FLOAT" and not FLOAT_PATTERN.fullmatch(value):
+        return "Not a float with . as decimal separator and without thousands separators"
+    if field["type"] == "DATE":
+        try:
+            datetime.strptime(value, DATE_FORMAT)
+        except ValueError:
+            return f"Not a date in format {DATE_FORMAT}"
+    return None
+
+
+def validate_csv(text: str, schema: list = None, max_errors: int = 20) -> ValidationResult:
+    """
+    Validates the CSV: header with the column names of the schema in schema order,
+    the number of fields per row and the values of INTEGER, FLOAT and DATE columns.
+    :param max_errors: Validation stops after this many errors, to keep the feedback to the extractor short
+    """
+    schema = schema or load_schema()
+    columns = schema_header(schema).split(",")
+    errors = []
+    rows = list(csv.reader(_csv_lines(text)))
+    if not rows:
+        return ValidationResult(valid=False, rows=0, errors=[
+            ValidationError(row=0, column=None, value=None, message="No CSV found"),
+        ])
+
+    header = [name.strip().lower() for name in rows[0]]
+    if header != columns:
+        errors.append(ValidationError(
+            row=0, column=None, value=",".join(rows[0]), message=f"Header must be {','.join(columns)}"))
+
+    for i, row in enumerate(rows[1:], start=1):
+        if len(errors) >= max_errors:
+            break
+        if len(row) != len(columns):
+            errors.append(ValidationError(
+                row=i, column=None, value=",".join(row), message=f"Row has {len(row)} instead of {len(columns)} fields"))
+            continue
+        for field, value in zip(schema, row):
+            message = _field_error(field, value)
+            if message:
+                errors.append(ValidationError(row=i, column=field["name"], value=value, message=message))
+
+    return ValidationResult(valid=not errors, rows=len(rows) - 1, errors=errors[:max_errors])
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+from CsvValidator import SCHEMA_PATH, load_schema, schema_header, validate_csv
+
+HEADER = "buchungsnr,datum,valuta,empfanger,belastung,gutschrift,saldo,text"
+
+
+class TestCsvValidator(unittest.TestCase):
+
+    def test_valid_csv(self):
+        result = validate_csv(
+            "```csv\n" + HEADER + "\n"
+            '12345,2025-01-01,2025-01-02,"Example Recipient",1050.25,,1000.00,"Example, text"\n'
+            "12346,2025-01-03,2025-01-03,Other,,20,1020,\n```"
+        )
+        self.assertEqual(result, {"valid": True, "rows": 2, "errors": []})
+
+    def test_structured_errors(self):
+        result = validate_csv(
+            "Buchungsnr.,Datum,Valuta,Empfanger,Belastung,Gutschrift,Saldo,Text\n"
+            "12345,01.01.2025,2025-01-01,A,1'050.25,0.00,1000.00,x\n"
+            '12346,2025-01-01,2025-01-01,B,"1,050.25",0.00,1000.00,x\n'
+            "12347,2025-01-01,2025-01-01,C,1.00\n"
+        )
+        self.assertFalse(result["valid"])
+        self.assertEqual([(error["row"], error["column"]) for error in result["errors"]], [
+            (0, None), (1, "datum"), (1, "belastung"), (2, "belastung"), (3, None),
+        ])
+        self.assertEqual(result["errors"][2]["value"], "1'050.25")
+
+    def test_no_csv(self):
+        result = validate_csv("I can not read this file.")
+        self.assertFalse(result["valid"])
+        self.assertEqual(result["errors"][0]["row"], 0)
+
+    def test_schema_columns(self):
+        self.assertEqual(",".join(field["name"] for field in load_schema()), HEADER)
+        self.assertEqual(schema_header(), HEADER)
+
+    def test_schema_copy_is_identical(self):
+        # Each Cloud Function is deployed from its own directory, so the schema is copied
+        other_copy = os.path.join(os.path.dirname(SCHEMA_PATH), "..", "cf-pdf2bq", "banks.zak.json")
+        self.assertEqual(load_schema(), load_schema(other_copy))
+
+
+if __name__ == "__main__":
+    unittest.main()
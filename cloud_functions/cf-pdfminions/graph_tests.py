@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import graph
+
+HEADER = "buchungsnr,datum,valuta,empfanger,belastung,gutschrift,saldo,text"
+# Cumulative import time of the graph module at cold start, in microseconds
+IMPORT_TIME_BUDGET_US = 300_000
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_google_vertexai", "langgraph", "google")
+
+
+def profile_import(module: str) -> dict:
+    """Imports the module in a fresh interpreter, returns {module: cumulative import time in us} of -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    )
+    imports = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+
+class TestGraph(unittest.TestCase):
+
+    def test_import_is_cheap(self):
+        imports = profile_import("graph")
+        heavy = sorted(name for name in imports if name.split(".")[0] in HEAVY_PACKAGES)
+        self.assertEqual(heavy, [], "langchain, langgraph and google are imported when the graph is built")
+        slowest = sorted(imports.items(), key=lambda item: -item[1])[:10]
+        self.assertLess(imports["graph"], IMPORT_TIME_BUDGET_US, f"Slowest imports [us]: {slowest}")
+
+    @mock.patch.dict(os.environ, {"LANGCHAIN_TRACING_V2": "false"})
+    def test_valid_csv_ends_without_supervisor(self):
+        from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+        from langchain_core.messages import AIMessage
+
+        csv = HEADER + "\n12345,2025-01-01,2025-01-01,Example Recipient,50.25,,1000.00,Example text"
+        # A second call (the supervisor) would get the second answer
+        llm = FakeMessagesListChatModel(responses=[AIMessage(content=csv), AIMessage(content="FINISH")])
+        result = graph.build_graph(llm).invoke({"messages": [("user", "Extract bank transactions")]})
+
+        self.assertEqual(result["messages"][-1].content, csv)
+        self.assertEqual(llm.i, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
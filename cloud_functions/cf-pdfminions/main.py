@@ -5,7 +5,7 @@ Minions are AI Agents, that cooperate to extract table with bank transactions fr
 In Bank ZAK (Cler) the only way to get the transactions is to download PDF for particular month from mobile app. This pdf has many various informations, including list of transactions. Tasks for Minions:
 - Agent Supervisor: Manage workflow
 - Agent Extractor: Extract transactions to CSV Format - format will be specified in prompt
-- Agent Assessor: Check if exported data are really CSV
+- Validator: Check the extracted CSV against the schema banks.zak.json, without LLM call. The supervisor is only asked when it is invalid
 Agent Framework: LangChain
 Agent LLM Model: Google Gemini
 """
@@ -14,6 +14,9 @@ import logging
 import traceback
 import backoff
 import google.cloud.logging
+from CsvValidator import schema_header
+# Cheap to import: the graph is built on the first request and reused by the warm instance
+import graph
 
 
 # setup logging
@@ -42,11 +45,6 @@ def start(request):
     # Parse request
     gs_path = parse_request(request)
 
-    print("importing graph")
-    import graph
-
-
-
     # system_msg = ("You are helpful assistant and you do exactly what you were requested to. "
     #     "You do not make up any information. If you can not do something or you do not know, "
     #     "you simply says that you can not or you do not know."
@@ -61,10 +59,11 @@ def start(request):
 
     text_message = {
         "type": "text",
-        "text": """Extract bank transactions from this file. Output transactions format: CSV.
+        "text": f"""Extract bank transactions from this file. Output transactions format: CSV.
 Remember that Saldovortrag is not part of the data and should be excluded from CSV
 
 CSV Format:
+- Header row exactly: {schema_header()}
 - Floats without high commas between thausands
 - Buchungsnr. as separat column
 - \"Artur ... CH\" as separate column named \"Empfanger\"
@@ -72,6 +71,9 @@ CSV Format:
 - Date format %Y-%m-%d""",
     }
 
+    csv_content = graph.extract_transactions(gs_path, text_message["text"])
+    logging.info(f"start: extracted transactions: {csv_content}")
+
     # message = HumanMessage(content=[text_message, pdf_message])
     
     # logging.info(f"Prompt: {message}")
@@ -0,0 +1,96 @@
+__author__ = "Artur Fejklowicz"
+__copyright__ = "Copyright 2026, The AF Finanzen Project"
+__credits__ = ["Artur Fejklowicz"]
+__license__ = "GPLv3"
+__version__ = "1.0.0"
+__maintainer__ = "Artur Fejklowicz"
+__status__ = "Production"
+__doc__ = """
+Backfill of all PostFinance exports below a prefix, e.g. after re-exporting a year of statements.
+Objects are transformed concurrently in a bounded thread pool over one shared bucket (client),
+instead of one cold Cloud Function invocation per Pub/Sub notification.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Set, Tuple
+
+RAW_PREFIX = "raw/postfinance/"
+OUTPUT_PREFIX = "postfinance/"
+MAX_WORKERS = 8
+
+
+def transformed_sources(bucket, output_prefix: str = OUTPUT_PREFIX) -> Set[Tuple[str, str]]:
+    """
+    Returns (source_object, source_generation) of all transformed outputs below the prefix,
+    read from the metadata that save_blob writes to each month=/account= output.
+    """
+    sources = set()
+    for blob in bucket.list_blobs(prefix=output_prefix):
+        metadata = blob.metadata or {}
+        if "source_object" in metadata:
+            sources.add((metadata["source_object"], metadata.get("source_generation")))
+    return sources
+
+
+def backfill(
+    bucket,
+    process_file: Callable,
+    prefix: str = RAW_PREFIX,
+    max_workers: int = MAX_WORKERS,
+    force: bool = False,
+) -> dict:
+    """
+    Transforms all objects below the prefix.
+
+    :param bucket: The bucket (of one shared client), or a stand-in with list_blobs/get_blob/blob
+    :param process_file: Called as process_file(bucket_id, object_id, bucket=bucket) per object,
+        returns the name of the transformed output (or None)
+    :param prefix: Prefix of the raw exports
+    :param max_workers: Number of objects transformed at the same time
+    :param force: Also transform objects whose current generation was already transformed
+    :return: Report with the processed, skipped and failed objects, the written outputs and the throughput
+    """
+    start = time.perf_counter()
+    done = set() if force else transformed_sources(bucket)
+    todo, skipped = [], []
+    for blob in bucket.list_blobs(prefix=prefix):
+        if blob.name.endswith("/"):
+            continue
+        if (blob.name, str(blob.generation)) in done:
+            skipped.append(blob.name)
+        else:
+            todo.append(blob)
+    logging.info(f"backfill: {len(todo)} objects to transform, {len(skipped)} already transformed")
+
+    def transform(blob):
+        try:
+            return blob, process_file(bucket.name, blob.name, bucket=bucket), None
+        except Exception as e:
+            logging.error(f"backfill: Could not transform {blob.name}: {e}")
+            return blob, None, str(e)
+
+    processed, outputs, failed, processed_bytes = [], set(), {}, 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for blob, output, error in executor.map(transform, todo):
+            if error is None:
+                processed.append(blob.name)
+                processed_bytes += blob.size or 0
+                if output:
+                    outputs.add(output)
+            else:
+                failed[blob.name] = error
+
+    seconds = time.perf_counter() - start
+    report = {
+        "processed": len(processed),
+        "skipped": len(skipped),
+        "failed": failed,
+        "outputs": sorted(outputs),
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(processed) / seconds, 2) if seconds else None,
+        "megabytes_per_second": round(processed_bytes / 1e6 / seconds, 3) if seconds else None,
+    }
+    logging.info(f"backfill: {report}", extra={"labels": {"dst": "USER"}})
+    return report
@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from Backfill import backfill
+from FileContent import FileContent
+
+METADATA_DIR = ".metadata"
+
+
+class LocalBlob:
+    """Stand-in for google.cloud.storage.Blob, backed by a file below the bucket root"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+        self.generation = None
+        self.size = None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    @property
+    def _metadata_path(self):
+        return os.path.join(self.bucket.root, METADATA_DIR, self.name + ".json")
+
+    def _reload(self):
+        stat = os.stat(self._path)
+        self.generation, self.size = stat.st_mtime_ns, stat.st_size
+        if os.path.exists(self._metadata_path):
+            with open(self._metadata_path) as f:
+                self.metadata = json.load(f)
+        return self
+
+    def download_as_bytes(self, if_generation_match=None):
+        if if_generation_match is not None and os.stat(self._path).st_mtime_ns != if_generation_match:
+            raise RuntimeError(f"Generation of {self.name} does not match")
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def upload_from_string(self, data):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        previous_generation = os.stat(self._path).st_mtime_ns if os.path.exists(self._path) else 0
+        with open(self._path, "wb") as f:
+            f.write(data)
+        # Every upload is a new generation, also on filesystems with coarse timestamps
+        generation = max(time.time_ns(), previous_generation + 1)
+        os.utime(self._path, ns=(generation, generation))
+        if self.metadata is not None:
+            os.makedirs(os.path.dirname(self._metadata_path), exist_ok=True)
+            with open(self._metadata_path, "w") as f:
+                json.dump(self.metadata, f)
+        self.bucket.uploads += 1
+
+
+class LocalBucket:
+    """Local filesystem stand-in for google.cloud.storage.Bucket"""
+
+    def __init__(self, root):
+        self.root = root
+        self.name = "local-bucket"
+        self.uploads = 0
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob._reload() if os.path.exists(blob._path) else None
+
+    def list_blobs(self, prefix=""):
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = sorted(d for d in dirs if d != METADATA_DIR)
+            for file in sorted(files):
+                name = os.path.relpath(os.path.join(root, file), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    yield self.get_blob(name)
+
+
+def _export(account, month):
+    return (
+        'Datum von:;="2023-01-01"\nDatum bis:;="2023-12-31"\nKontoart:;Privatkonto\n'
+        f'Konto:;="{account}"\nWährung:;CHF\n\n'
+        'Buchungsdatum;Avisierungstext;Gutschrift;Lastschrift\n'
+        f'2023-{month}-28;Einkauf;;-12.50\n\nDisclaimer:;Der Dokumentinhalt\n'
+    ).encode("windows-1252")
+
+
+def process_file(bucket_id, object_id, bucket=None):
+    return FileContent(bucket_id, object_id, bucket=bucket) \
+        .transform(target="pf_header_strip") \
+        .transform(target="pf_footer_strip") \
+        .extract_date() \
+        .save_blob() \
+        .object_id_transformed
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bucket = LocalBucket(self.tmp_dir.name)
+        for month in ("01", "02", "03"):
+            self.bucket.blob(f"raw/postfinance/pf_2023{month}.csv").upload_from_string(_export("CH123", month))
+        self.bucket.blob("raw/postfinance/broken.csv").upload_from_string(b"no header")
+        self.bucket.uploads = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_backfill_transforms_all_exports(self):
+        report = backfill(self.bucket, process_file, max_workers=2)
+
+        self.assertEqual(report["processed"], 3)
+        self.assertEqual(list(report["failed"]), ["raw/postfinance/broken.csv"])
+        output = self.bucket.get_blob("postfinance/month=202302/account=CH123/pf_202302_CH123.csv")
+        self.assertEqual(output.download_as_bytes().decode("utf-8").splitlines()[1], "2023-02-28;Einkauf;;-12.50")
+        self.assertEqual(output.metadata["source_object"], "raw/postfinance/pf_202302.csv")
+        # The outputs tell the backfill entry point which months to load into BigQuery
+        self.assertEqual(report["outputs"], [
+            f"postfinance/month=2023{month}/account=CH123/pf_2023{month}_CH123.csv" for month in ("01", "02", "03")
+        ])
+
+    def test_backfill_skips_transformed_generations(self):
+        backfill(self.bucket, process_file)
+        # Re-exported (new generation) source is transformed again, the others are skipped
+        self.bucket.blob("raw/postfinance/pf_202301.csv").upload_from_string(_export("CH123", "01"))
+        self.bucket.uploads = 0
+        report = backfill(self.bucket, process_file)
+
+        self.assertEqual(report["processed"], 1)
+        self.assertEqual(report["skipped"], 2)
+        self.assertEqual(self.bucket.uploads, 1)
+
+    def test_backfill_force(self):
+        backfill(self.bucket, process_file)
+        report = backfill(self.bucket, process_file, force=True)
+        self.assertEqual((report["processed"], report["skipped"]), (3, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,11 +6,16 @@ __version__ = "1.0.0"
 __maintainer__ = "Artur Fejklowicz"
 __status__ = "Production"
 
-from google.cloud import storage
+from google.cloud import bigquery, storage
 import google.cloud.logging
 import logging
 import backoff
-import re
+import codecs
+import io
+from typing import Iterator
+from LinePipeline import (apply_stages, drop_blank, extract_metadata, prime, sniff_date, strip_footer_while,
+                          strip_header)
+from BigQueryLoad import load_month_partition
 
 # Cloud logger
 log_client = google.cloud.logging.Client()
@@ -20,120 +25,198 @@ log_client.setup_logging()
 logging.getLogger("backoff").addHandler(logging.StreamHandler())
 logging.basicConfig(level=logging.INFO)
 
+# Leading bytes inspected to choose the codec
+ENCODING_SAMPLE_SIZE = 64 * 1024
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+WINDOWS_1252_FALLBACK = "windows-1252-fallback"
+
+
+def _decode_as_windows_1252(error: UnicodeDecodeError):
+    """Decodes bytes that are not valid UTF-8 (after an all ASCII sample) as windows-1252"""
+    return error.object[error.start:error.end].decode("windows-1252"), error.end
+
+
+codecs.register_error(WINDOWS_1252_FALLBACK, _decode_as_windows_1252)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Chooses the codec from the byte order mark or the leading sample of the file:
+    UTF-8 if the sample is valid UTF-8 (a sequence cut at the end of the sample is fine),
+    otherwise windows-1252, the encoding of older PostFinance exports.
+    """
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "windows-1252"
+
+
+def decoded_lines(content_bytes: bytes, encoding: str) -> Iterator[str]:
+    """
+    Decodes the file incrementally in one pass and yields its lines without line ends.
+    A UTF-8 file whose first non-ASCII bytes are beyond the sample and turn out to be
+    windows-1252 is decoded byte-wise as windows-1252 instead of failing.
+    """
+    errors = WINDOWS_1252_FALLBACK if encoding.startswith("utf-8") else "strict"
+    text = io.TextIOWrapper(io.BytesIO(content_bytes), encoding=encoding, errors=errors, newline=None)
+    for line in text:
+        yield line[:-1] if line.endswith("\n") else line
+
+
+def is_footer_line(line: str) -> bool:
+    """Disclaimer, document info and empty lines at the end of the export"""
+    return line.strip() == "" or line.startswith("Disclaimer") or line.startswith("Der Dokumentinhalt")
+
+
+def parse_buchungsdatum(rows: list) -> tuple:
+    """
+    Returns (year, month) of the first data row.
+    rows[0] is the header, rows[1] is the first transaction.
+
+    PostFinance format usually has the date in the first few columns.
+    E.g., Buchungsdatum;Valuta;Text;Gutschrift;Lastschrift;Saldo
+    2023-01-31;...
+    """
+    header_row = rows[0]
+    # Detect delimiter
+    delimiter = ";" if ";" in header_row else ","
+
+    # We check the first data row
+    first_data_row = rows[1]
+    columns = first_data_row.split(delimiter)
+
+    # Usually 'Buchungsdatum' is the first column (index 0) or 'Valuta' (index 1)
+    # We will try to parse the first column
+    date_str = columns[0].replace('"', '') # Clean quotes if present
+
+    try:
+        # format often YYYY-MM-DD or DD.MM.YYYY
+        if "-" in date_str:
+            # YYYY-MM-DD
+            parts = date_str.split("-")
+            return parts[0], parts[1]
+        elif "." in date_str:
+            # DD.MM.YYYY
+            parts = date_str.split(".")
+            return parts[2], parts[1]
+        else:
+             raise ValueError(f"Unknown date format: {date_str}")
+
+    except Exception as e:
+         logging.error(f"Could not extract date from row: {first_data_row}. Error: {e}")
+         raise
+
+
+# PostFinance profile: the line stages of each transform target
+PF_STAGES = {
+    # Extract account from metadata before stripping (usually line 4)
+    # Konto:;="CHCC090000001612XXXXC" (No spaces in source)
+    # Keep full IBAN exactly as source (Upper Case) for copy-paste friendliness
+    # Skip the first 6 lines (metadata), line 7 is usually the header row for the data
+    # Filter out any completely empty lines to avoid parsing errors
+    "pf_header_strip": [
+        extract_metadata("account", r'^Konto:.*?="(.+?)"', within=6),
+        strip_header(6),
+        drop_blank(),
+    ],
+    # Remove "Disclaimer", "Der Dokumentinhalt", and empty lines at the end
+    "pf_footer_strip": [strip_footer_while(is_footer_line)],
+}
+
+
+def load_month(bq_client, table_id: str, bucket_id: str, month: str):
+    """Replaces the month (YYYYMM) partition of the native table with the transformed files of all accounts"""
+    return load_month_partition(
+        bq_client,
+        table_id,
+        month_uri=f"gs://{bucket_id}/postfinance/month={month}/",
+        source_uri_prefix=f"gs://{bucket_id}/postfinance/{{month:Integer}}/{{account:String}}",
+        partition=month,
+        encoding="UTF-8",
+    )
+
 
 class FileContent:
     bucket: google.cloud.storage.Bucket
     bucket_id: str
     object_id: str
     object_id_transformed: str
-    content_raw: str
-    content: list
+    content_raw: bytes
+    encoding: str
+    content: Iterator[str]
+    metadata: dict
     year: str
     month: str
     account: str
+    source_generation: int
 
-    def __init__(self, bucket_id, object_id):
+    def __init__(self, bucket_id, object_id, bucket: google.cloud.storage.Bucket = None):
+        """
+        :param bucket: Bucket of a shared client (e.g. in a backfill). A new client is created if None.
+        """
         self.bucket_id = bucket_id
         self.object_id = object_id
-        self._initialize_bucket()
+        if bucket is None:
+            self._initialize_bucket()
+        else:
+            self.bucket = bucket
         self._load_blob()
-        # PostFinance CSVs are often iso-8859-1 or windows-1252 encoded
-        # We will split by new lines.
-        self.content = self.content_raw.splitlines()
+        # PostFinance CSVs are often iso-8859-1 or windows-1252 encoded, newer ones UTF-8
+        self.encoding = detect_encoding(self.content_raw[:ENCODING_SAMPLE_SIZE])
+        logging.info(f"FileContent: {self.object_id} is {self.encoding} encoded")
+        self.content = decoded_lines(self.content_raw, self.encoding)
+        self.metadata = {}
         self.account = "unknown"
+        self.year = ""
+        self.month = ""
+        self._content_text = None
 
     def _get_content(self):
-        return "\n".join(self.content)
+        # Joined once, so a retried upload sends the same content
+        if self._content_text is None:
+            self._content_text = "\n".join(self.content)
+        return self._content_text
 
     def transform(self, target: str = None):
         """
-        Transforms the file content
+        Adds the line stages of the target to the content. The stages of all targets
+        run lazily in one pass when the content is saved.
         :param target: type of transformation
         :return: self
         """
         logging.info(f"transform: start target {target}")
-        
-        if target == "pf_header_strip":
-            # Extract account from metadata before stripping (usually line 4)
-            # Konto:;="CHCC090000001612XXXXC" (No spaces in source)
-            for line in self.content[:6]:
-                if line.startswith("Konto:"):
-                    match = re.search(r'="(.+?)"', line)
-                    if match:
-                        # Keep full IBAN exactly as source (Upper Case) for copy-paste friendliness
-                        self.account = match.group(1)
-                        logging.info(f"transform: Identified full IBAN account as {self.account}")
-
-            # Skip the first 6 lines (metadata)
-            # Line 7 is usually the header row for the data
-            if len(self.content) > 6:
-                self.content = self.content[6:]
-            else:
-                 logging.warning("File has fewer than 6 lines, cannot strip header correctly.")
-
-            # Filter out any completely empty lines to avoid parsing errors
-            self.content = [line for line in self.content if line.strip() != ""]
-
-        elif target == "pf_footer_strip":
-            # Remove "Disclaimer", "Der Dokumentinhalt", and empty lines at the end
-            while self.content and (self.content[-1].strip() == "" or self.content[-1].startswith("Disclaimer") or self.content[-1].startswith("Der Dokumentinhalt")):
-                self.content.pop()
-                
-        else:
+
+        if target not in PF_STAGES:
             raise Exception(f"transform: Unknown target {target}")
+        self.content = apply_stages(self.content, PF_STAGES[target], self.metadata)
 
         return self
 
     def extract_date(self):
         """
         Extracts the date from the file content.
-        Assumes the file has been stripped of the 6 metadata lines.
-        So self.content[0] is the header, self.content[1] is the first transaction.
-        
-        PostFinance format usually has the date in the first few columns.
-        E.g., Buchungsdatum;Valuta;Text;Gutschrift;Lastschrift;Saldo
-        2023-01-31;...
-        
-        We need to identify the column index for the date.
+        Assumes the 6 metadata lines are stripped, so the first line is the header
+        and the second line is the first transaction.
         """
         logging.info("extract_date: start")
 
-        if len(self.content) < 2:
-             raise Exception("File content is too short to extract date.")
-
-        # Let's inspect the header to find the date column if possible, or assume column 0
-        header_row = self.content[0]
-        # Detect delimiter
-        delimiter = ";" if ";" in header_row else ","
-        
-        # We check the first data row
-        first_data_row = self.content[1]
-        columns = first_data_row.split(delimiter)
-        
-        # Usually 'Buchungsdatum' is the first column (index 0) or 'Valuta' (index 1)
-        # We will try to parse the first column
-        date_str = columns[0].replace('"', '') # Clean quotes if present
-        
-        try:
-            # format often YYYY-MM-DD or DD.MM.YYYY
-            # We treat it as YYYY-MM-DD based on typical exports, or use dateutil to be safe?
-            # Creating a robust parser for YYYY-MM-DD or DD.MM.YYYY
-            if "-" in date_str:
-                # YYYY-MM-DD
-                parts = date_str.split("-")
-                self.year = parts[0]
-                self.month = parts[1]
-            elif "." in date_str:
-                # DD.MM.YYYY
-                parts = date_str.split(".")
-                self.year = parts[2]
-                self.month = parts[1]
-            else:
-                 raise ValueError(f"Unknown date format: {date_str}")
-                 
-        except Exception as e:
-             logging.error(f"Could not extract date from row: {first_data_row}. Error: {e}")
-             raise
+        self.content = apply_stages(self.content, [sniff_date(1, parse_buchungsdatum)], self.metadata)
+        # Read ahead up to the first data row, the lines stay in the content
+        self.content = prime(self.content, lambda: "month" in self.metadata)
+        self.year = self.metadata["year"]
+        self.month = self.metadata["month"]
+        # The account line is in the metadata lines, which are read by now
+        self.account = self.metadata.get("account", self.account)
+        if self.account != "unknown":
+            logging.info(f"extract_date: Identified full IBAN account as {self.account}")
 
         logging.info(f"extract_date: year {self.year} month {self.month}")
         return self
@@ -146,21 +229,33 @@ class FileContent:
     def _load_blob(self):
         """
         Loads the Blob from Google Storage
-        :return: File content as string
+        :return: File content as bytes, decoded lazily by the line stages
         """
         try:
-            blob = self.bucket.blob(self.object_id)
-            # Try decoding with common encodings
-            content_bytes = blob.download_as_bytes()
-            try:
-                self.content_raw = content_bytes.decode('utf-8')
-            except UnicodeDecodeError:
-                self.content_raw = content_bytes.decode('windows-1252')
-                
+            blob = self.bucket.get_blob(self.object_id)
+            if blob is None:
+                raise FileNotFoundError(f"gs://{self.bucket_id}/{self.object_id} does not exist")
+            self.source_generation = blob.generation
+            self.content_raw = blob.download_as_bytes(if_generation_match=blob.generation)
         except Exception as e:
             logging.error(f"Could not load the Blob from Google Storage {self.object_id}: {e}")
             raise RuntimeError(f"Could not load the Blob from Google Storage {self.object_id}: {e}")
 
+    def load_to_bigquery(self, table_id: str, bq_client=None):
+        """
+        Replaces the month partition of the native table with the saved month folder (all accounts)
+        :param table_id: Destination table, e.g. banks.postfinance_native
+        :param bq_client: BigQuery client, a new one is created if None
+        :return: self
+        """
+        try:
+            load_month(bq_client or bigquery.Client(), table_id, self.bucket_id, f"{self.year}{self.month}")
+        except Exception as e:
+            logging.error(f"Could not load {self.object_id_transformed} into BigQuery {table_id}: {e}")
+            raise RuntimeError(f"Could not load {self.object_id_transformed} into BigQuery {table_id}: {e}")
+
+        return self
+
     @backoff.on_exception(backoff.expo, Exception, max_time=60, max_tries=3)
     def save_blob(self):
         """
@@ -175,6 +270,8 @@ class FileContent:
         
         try:
             blob = self.bucket.blob(self.object_id_transformed)
+            # The source of the output, so a backfill can skip sources that are already transformed
+            blob.metadata = {"source_object": self.object_id, "source_generation": str(self.source_generation)}
             blob.upload_from_string(self._get_content().encode('utf-8')) # Save as UTF-8
         except Exception as e:
             logging.error(f"Could not save the Blob to Google Storage {self.object_id_transformed}: {e}")
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+import FileContent
+from FileContent import decoded_lines, detect_encoding
+
+EXPORT = 'Konto:;="CH123"\r\nBuchungsdatum;Avisierungstext;Gutschrift\r\n2023-01-31;Café Zürich;10\r\n'
+
+
+def _legacy_lines(content_bytes):
+    try:
+        return content_bytes.decode('utf-8').splitlines()
+    except UnicodeDecodeError:
+        return content_bytes.decode('windows-1252').splitlines()
+
+
+class TestEncoding(unittest.TestCase):
+
+    def _lines(self, content_bytes):
+        return list(decoded_lines(content_bytes, detect_encoding(content_bytes[:FileContent.ENCODING_SAMPLE_SIZE])))
+
+    def test_detect_encoding(self):
+        self.assertEqual(detect_encoding(EXPORT.encode("utf-8")), "utf-8")
+        self.assertEqual(detect_encoding(EXPORT.encode("windows-1252")), "windows-1252")
+        self.assertEqual(detect_encoding(EXPORT.encode("utf-8-sig")), "utf-8-sig")
+        self.assertEqual(detect_encoding(EXPORT.encode("utf-16")), "utf-16")
+        # A multi-byte sequence cut at the end of the sample is still UTF-8
+        self.assertEqual(detect_encoding("Zürich".encode("utf-8")[:2]), "utf-8")
+
+    def test_decoded_lines_match_previous_decoding(self):
+        for encoding in ("utf-8", "windows-1252"):
+            content_bytes = EXPORT.encode(encoding)
+            self.assertEqual(self._lines(content_bytes), _legacy_lines(content_bytes))
+
+    def test_byte_order_marks(self):
+        self.assertEqual(self._lines(EXPORT.encode("utf-8-sig")), EXPORT.splitlines())
+        self.assertEqual(self._lines(EXPORT.encode("utf-16")), EXPORT.splitlines())
+
+    def test_windows_1252_after_ascii_sample(self):
+        content_bytes = ("x" * 100 + "\n").encode("ascii") + EXPORT.encode("windows-1252")
+        with mock.patch.object(FileContent, "ENCODING_SAMPLE_SIZE", 50):
+            self.assertEqual(self._lines(content_bytes), _legacy_lines(content_bytes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,8 +14,13 @@ import google.cloud.logging
 import logging
 import traceback
 import base64
+import functools
 import json
-from FileContent import FileContent
+import os
+from google.cloud import bigquery, storage
+from FileContent import FileContent, load_month
+from Backfill import backfill as run_backfill, MAX_WORKERS, RAW_PREFIX
+from DedupeIndex import create_index, dedupe_key
 
 # Cloud logger
 log_client = google.cloud.logging.Client()
@@ -26,9 +31,28 @@ logging.getLogger("backoff").addHandler(logging.StreamHandler())
 logging.basicConfig(level=logging.INFO)
 
 BUCKET_ID = "af-finanzen-banks"
+DEDUPE_PREFIX = "dedupe/cf-pf-csv-transform/"
+# Native table the month is loaded into after saving, e.g. banks.postfinance_native. Not loaded if unset.
+BQ_LOAD_TABLE = os.environ.get("BQ_LOAD_TABLE")
 
+# Created on first use and reused by the invocations of a warm instance
+_bucket = None
+_dedupe_index = None
 
-def process_file(bucket_id, object_id):
+
+def get_dedupe_index():
+    global _bucket, _dedupe_index
+    if _bucket is None:
+        _bucket = storage.Client().bucket(BUCKET_ID)
+        _dedupe_index = create_index(_bucket, DEDUPE_PREFIX)
+    return _dedupe_index
+
+
+def process_file(bucket_id, object_id, bucket=None, load: bool = True):
+    """
+    Transforms one export and returns the name of the transformed file.
+    :param load: Load the month into BQ_LOAD_TABLE, if set. A backfill loads each month once at the end.
+    """
     logging.info(f"process_file: File gs://{bucket_id}/{object_id} triggered", extra={"labels": {"dst": "USER"}})
     
     # We only want to process files in the raw/postfinance/ directory
@@ -36,14 +60,18 @@ def process_file(bucket_id, object_id):
         logging.info(f"process_file: Skipping file {object_id} as it is not in raw/postfinance/", extra={"labels": {"dst": "USER"}})
         return
 
-    file_content = FileContent(bucket_id, object_id)
+    file_content = FileContent(bucket_id, object_id, bucket=bucket)
     file_content \
         .transform(target="pf_header_strip")\
         .transform(target="pf_footer_strip")\
         .extract_date()\
         .save_blob()
 
+    if load and BQ_LOAD_TABLE:
+        file_content.load_to_bigquery(BQ_LOAD_TABLE)
+
     logging.info(f"process_file: file {object_id} transformed and saved")
+    return file_content.object_id_transformed
 
 
 @functions_framework.cloud_event
@@ -75,9 +103,69 @@ def main(cloud_event):
              
              if not bucket_id or not object_id:
                   raise ValueError("Bucket or object ID missing in Pub/Sub message payload")
-                  
+
+             # Skip redelivered notifications and re-uploads of identical content before downloading
+             dedupe_index = get_dedupe_index() if "raw/postfinance/" in object_id else None
+             if dedupe_index is not None:
+                  key = dedupe_key(object_id, msg_json.get("generation"), msg_json.get("md5Hash"),
+                                   bucket=_bucket.client.bucket(bucket_id))
+                  if dedupe_index.seen(key):
+                       logging.info(f"main: file {object_id} already transformed ({key}), skipping", extra={"labels": {"dst": "USER"}})
+                       return
+
              process_file(bucket_id, object_id)
 
+             if dedupe_index is not None:
+                  dedupe_index.mark(key)
+
     except Exception:
         logging.error(traceback.format_exc())
         raise RuntimeError("Cloud Function failed")
+
+
+def parse_bool(value) -> bool:
+    """Request flag as bool, also when it is sent as string ("false" is False)"""
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("true", "1"):
+        return True
+    if str(value).strip().lower() in ("false", "0"):
+        return False
+    raise ValueError(f"Not a boolean: {value}")
+
+
+def load_months(outputs: list) -> list:
+    """Loads each month of the transformed files once into BQ_LOAD_TABLE, returns the months (YYYYMM)"""
+    bq_client = bigquery.Client()
+    # postfinance/month=YYYYMM/account=.../pf_YYYYMM_....csv
+    months = sorted({output.split("/")[1][len("month="):] for output in outputs})
+    for month in months:
+        load_month(bq_client, BQ_LOAD_TABLE, BUCKET_ID, month)
+    return months
+
+
+@functions_framework.http
+def backfill(request):
+    """
+    HTTP entry point that transforms all exports below raw/postfinance/ with one shared client.
+    Optional JSON payload: {"prefix": "raw/postfinance/2025/", "max_workers": 8, "force": false}
+    """
+    try:
+        request_json = request.get_json(silent=True) or {}
+        prefix = request_json.get("prefix", RAW_PREFIX)
+        if not prefix.startswith(RAW_PREFIX):
+            raise ValueError(f"Prefix must be below {RAW_PREFIX}")
+        bucket = storage.Client().bucket(BUCKET_ID)
+        report = run_backfill(
+            bucket,
+            functools.partial(process_file, load=False),
+            prefix=prefix,
+            max_workers=int(request_json.get("max_workers", MAX_WORKERS)),
+            force=parse_bool(request_json.get("force", False)),
+        )
+        if BQ_LOAD_TABLE:
+            report["loaded_months"] = load_months(report["outputs"])
+        return report, 200 if not report["failed"] else 500
+    except Exception:
+        logging.error(traceback.format_exc())
+        raise RuntimeError("Backfill failed")
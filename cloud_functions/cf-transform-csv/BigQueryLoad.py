@@ -0,0 +1,64 @@
+__author__ = "Artur Fejklowicz"
+__copyright__ = "Copyright 2026, The AF Finanzen Project"
+__credits__ = ["Artur Fejklowicz"]
+__license__ = "GPLv3"
+__version__ = "1.0.0"
+__maintainer__ = "Artur Fejklowicz"
+__status__ = "Production"
+__doc__ = """
+Optional load of the transformed bank CSVs into native, month-partitioned BigQuery tables.
+Each Cloud Function is deployed from its own directory, so this file is kept
+identical in cf-transform-csv and cf-pf-csv-transform.
+
+The tables are created by terraform from terraform/bq-schemas/banks.<bank>_native.json,
+the load takes the schema from the destination table.
+"""
+
+import logging
+
+import backoff
+from google.cloud import bigquery
+
+
+@backoff.on_exception(backoff.expo, Exception, max_time=120, max_tries=3)
+def load_month_partition(
+    bq_client,
+    table_id: str,
+    month_uri: str,
+    source_uri_prefix: str,
+    partition: str,
+    encoding: str,
+):
+    """
+    Replaces one month partition of the table with all transformed files of that month.
+
+    Loading the whole month folder (all accounts) with WRITE_TRUNCATE on the partition
+    decorator makes the load idempotent and leaves the other months untouched.
+    The folder names (e.g. Monat=2023-01) become columns, like in the external tables.
+
+    :param table_id: Destination table, e.g. banks.ubs_native
+    :param month_uri: GCS folder of the month, e.g. gs://af-finanzen-banks/ubs/Monat=2023-01/
+    :param source_uri_prefix: Hive partitioning prefix, e.g. gs://af-finanzen-banks/ubs/{Monat:String}
+    :param partition: Partition to replace (YYYYMM)
+    :param encoding: Encoding of the CSV files
+    :return: The finished load job
+    """
+    hive_partitioning = bigquery.HivePartitioningOptions()
+    hive_partitioning.mode = "CUSTOM"
+    hive_partitioning.source_uri_prefix = source_uri_prefix
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.CSV,
+        field_delimiter=";",
+        quote_character='"',
+        skip_leading_rows=1,
+        encoding=encoding,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        hive_partitioning=hive_partitioning,
+    )
+    destination = f"{table_id}${partition}"
+    logging.info(f"load_month_partition: loading {month_uri}* into {destination}")
+    job = bq_client.load_table_from_uri(f"{month_uri.rstrip('/')}/*", destination, job_config=job_config)
+    job.result()
+    logging.info(f"load_month_partition: loaded {job.output_rows} rows into {destination}")
+    return job
@@ -0,0 +1,64 @@
+import os
+import unittest
+
+import BigQueryLoad
+from BigQueryLoad import load_month_partition
+
+
+class FakeLoadJob:
+    output_rows = 42
+
+    def __init__(self):
+        self.waited = False
+
+    def result(self):
+        self.waited = True
+        return self
+
+
+class FakeBigQueryClient:
+    """Local stand-in for google.cloud.bigquery.Client, records the load jobs"""
+
+    def __init__(self):
+        self.loads = []
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None):
+        job = FakeLoadJob()
+        self.loads.append((source_uris, destination, job_config, job))
+        return job
+
+
+class TestBigQueryLoad(unittest.TestCase):
+
+    def test_load_month_partition(self):
+        client = FakeBigQueryClient()
+        load_month_partition(
+            client,
+            "banks.ubs_native",
+            month_uri="gs://af-finanzen-banks/ubs/Monat=2023-01/",
+            source_uri_prefix="gs://af-finanzen-banks/ubs/{Monat:String}",
+            partition="202301",
+            encoding="ISO-8859-1",
+        )
+
+        source_uris, destination, job_config, job = client.loads[0]
+        self.assertEqual(source_uris, "gs://af-finanzen-banks/ubs/Monat=2023-01/*")
+        # Only the partition of the month is replaced
+        self.assertEqual(destination, "banks.ubs_native$202301")
+        self.assertEqual(job_config.write_disposition, "WRITE_TRUNCATE")
+        self.assertEqual(job_config.field_delimiter, ";")
+        self.assertEqual(job_config.skip_leading_rows, 1)
+        self.assertEqual(job_config.encoding, "ISO-8859-1")
+        self.assertEqual(job_config.hive_partitioning.source_uri_prefix, "gs://af-finanzen-banks/ubs/{Monat:String}")
+        self.assertTrue(job.waited)
+
+    def test_shared_copy_is_identical(self):
+        # Each Cloud Function is deployed from its own directory, so the loader is copied
+        other_copy = os.path.join(os.path.dirname(os.path.abspath(BigQueryLoad.__file__)),
+                                  "..", "cf-pf-csv-transform", "BigQueryLoad.py")
+        with open(BigQueryLoad.__file__, newline="") as f, open(other_copy, newline="") as g:
+            self.assertEqual(f.read().replace("\r\n", "\n"), g.read().replace("\r\n", "\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+__author__ = "Artur Fejklowicz"
+__copyright__ = "Copyright 2026, The AF Finanzen Project"
+__credits__ = ["Artur Fejklowicz"]
+__license__ = "GPLv3"
+__version__ = "1.0.0"
+__maintainer__ = "Artur Fejklowicz"
+__status__ = "Production"
+__doc__ = """
+Idempotency index of the bank CSV cloud functions.
+Each Cloud Function is deployed from its own directory, so this file is kept
+identical in cf-transform-csv and cf-pf-csv-transform.
+
+A source file version is identified by its object name, generation and MD5 hash, which
+the storage notification already carries. A redelivered notification or a re-upload of
+identical content is recognized before anything is downloaded.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+def dedupe_key(object_id: str, generation=None, md5_hash: str = None, bucket=None) -> str:
+    """
+    Returns the key of a source file version. The MD5 hash is taken from the notification;
+    if it is missing, it is read from the object metadata (no download). The hash makes a
+    re-upload of identical content a duplicate, even with a new generation. Objects without
+    MD5 hash (composite uploads) are keyed by their generation.
+    """
+    if md5_hash is None:
+        blob = bucket.get_blob(object_id)
+        if blob is None:
+            raise FileNotFoundError(f"{object_id} does not exist")
+        generation, md5_hash = blob.generation, blob.md5_hash
+    return f"{object_id}#{md5_hash or generation}"
+
+
+class GcsDedupeIndex:
+    """
+    Index as empty marker objects below a prefix in the bucket, one per key.
+    A lookup is one metadata request; marking is a create-only upload, so concurrent
+    invocations for the same key do not overwrite each other.
+    """
+
+    def __init__(self, bucket, prefix: str):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/") + "/"
+
+    def _marker(self, key: str):
+        return self.bucket.blob(self.prefix + hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def seen(self, key: str) -> bool:
+        return self.bucket.get_blob(self._marker(key).name) is not None
+
+    def mark(self, key: str, result: str = "") -> None:
+        marker = self._marker(key)
+        marker.metadata = {"key": key, "result": result}
+        try:
+            marker.upload_from_string(b"", if_generation_match=0)
+        except Exception as e:
+            # Precondition failed: another invocation marked the key first
+            logging.info(f"DedupeIndex: {key} already marked: {e}")
+
+
+class SqliteDedupeIndex:
+    """Index in a local SQLite file, for local runs and tests."""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS processed (key TEXT PRIMARY KEY, result TEXT, processed_at TEXT)"
+            )
+
+    def seen(self, key: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM processed WHERE key = ?", (key,)).fetchone() is not None
+
+    def mark(self, key: str, result: str = "") -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO processed VALUES (?, ?, ?)",
+                (key, result, datetime.now(timezone.utc).isoformat()),
+            )
+
+
+def create_index(bucket, prefix: str, setting: str = None):
+    """
+    Creates the index configured in DEDUPE_INDEX:
+    'gcs' (default): marker objects below prefix in the bucket,
+    'sqlite:<path>': a local SQLite file,
+    'none': no deduplication.
+    """
+    setting = setting or os.environ.get("DEDUPE_INDEX", "gcs")
+    if setting == "none":
+        return None
+    if setting.startswith("sqlite:"):
+        return SqliteDedupeIndex(setting[len("sqlite:"):])
+    if setting == "gcs":
+        return GcsDedupeIndex(bucket, prefix)
+    raise ValueError(f"Unknown DEDUPE_INDEX {setting}. Use 'gcs', 'sqlite:<path>' or 'none'.")
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import DedupeIndex
+from DedupeIndex import GcsDedupeIndex, SqliteDedupeIndex, create_index, dedupe_key
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+
+    def upload_from_string(self, data, if_generation_match=None):
+        if if_generation_match == 0 and self.name in self.bucket.objects:
+            raise RuntimeError("412 Precondition Failed")
+        self.bucket.objects[self.name] = self.metadata
+
+
+class FakeBucket:
+    """Local stand-in for google.cloud.storage.Bucket"""
+
+    def __init__(self, objects=None):
+        self.objects = objects or {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return SimpleNamespace(name=name, **self.objects[name]) if name in self.objects else None
+
+
+class TestDedupeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _check_index(self, index):
+        key = dedupe_key("ubs/export.csv", 1, "md5==")
+        self.assertFalse(index.seen(key))
+        index.mark(key, "ubs/Monat=2023-01/ubs_2023-01_transactions.csv")
+        index.mark(key)
+        self.assertTrue(index.seen(key))
+        self.assertFalse(index.seen(dedupe_key("ubs/export.csv", 2, "other==")))
+
+    def test_sqlite_index(self):
+        path = os.path.join(self.tmp_dir.name, "dedupe.sqlite")
+        self._check_index(SqliteDedupeIndex(path))
+        # Persistent across instances
+        self.assertTrue(SqliteDedupeIndex(path).seen(dedupe_key("ubs/export.csv", 1, "md5==")))
+
+    def test_gcs_index(self):
+        bucket = FakeBucket()
+        self._check_index(GcsDedupeIndex(bucket, "dedupe/cf-transform-csv"))
+        self.assertEqual(len(bucket.objects), 1)
+
+    def test_same_content_new_generation_is_duplicate(self):
+        self.assertEqual(dedupe_key("a.csv", 1, "md5=="), dedupe_key("a.csv", 2, "md5=="))
+
+    def test_key_from_object_metadata(self):
+        bucket = FakeBucket({"a.csv": {"generation": 7, "md5_hash": "md5=="}})
+        self.assertEqual(dedupe_key("a.csv", bucket=bucket), "a.csv#md5==")
+        with self.assertRaises(FileNotFoundError):
+            dedupe_key("missing.csv", bucket=bucket)
+
+    def test_create_index(self):
+        self.assertIsNone(create_index(None, "dedupe", "none"))
+        self.assertIsInstance(create_index(FakeBucket(), "dedupe", "gcs"), GcsDedupeIndex)
+        sqlite_path = os.path.join(self.tmp_dir.name, "dedupe.sqlite")
+        self.assertIsInstance(create_index(None, "dedupe", f"sqlite:{sqlite_path}"), SqliteDedupeIndex)
+
+    def test_shared_copy_is_identical(self):
+        # Each Cloud Function is deployed from its own directory, so the index is copied
+        other_copy = os.path.join(os.path.dirname(os.path.abspath(DedupeIndex.__file__)),
+                                  "..", "cf-pf-csv-transform", "DedupeIndex.py")
+        with open(DedupeIndex.__file__, newline="") as f, open(other_copy, newline="") as g:
+            self.assertEqual(f.read().replace("\r\n", "\n"), g.read().replace("\r\n", "\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
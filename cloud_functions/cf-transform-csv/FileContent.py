@@ -6,12 +6,16 @@ __version__ = "1.0.0"
 __maintainer__ = "Artur Fejklowicz"
 __status__ = "Production"
 
-from google.cloud import storage
+from google.cloud import bigquery, storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 import google.cloud.logging
 import logging
 import backoff
+import itertools
 from functools import singledispatch
-from typing import overload
+from typing import Iterator, overload
+from LinePipeline import apply_stages, prime, sniff_date, split_lines, strip_footer, strip_header
+from BigQueryLoad import load_month_partition
 
 
 # Cloud logger
@@ -22,6 +26,26 @@ log_client.setup_logging()
 logging.getLogger("backoff").addHandler(logging.StreamHandler())
 logging.basicConfig(level=logging.INFO)
 
+# Read/upload chunk size of the streaming mode (multiple of 256 KiB, as required by resumable uploads)
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Number of lines encoded and written to the upload at once
+WRITE_BATCH_LINES = 1000
+# The streaming mode uploads here first, outside of ubs/ where the external table and the month load read
+STAGING_PREFIX = "staging/cf-transform-csv/"
+
+
+def parse_einkaufsdatum(rows: list) -> tuple:
+    """Returns (year, month) of the Einkaufsdatum (DD.MM.YYYY) in the first data row"""
+    einkaufsdatum = rows[1].split(";")[3]
+    return einkaufsdatum.split(".")[2], einkaufsdatum.split(".")[1]
+
+
+# UBS profile: the line stages of each transform target
+UBS_STAGES = {
+    "first_line": [strip_header(1)],
+    "end_of_file": [strip_footer(3)],
+}
+
 
 class FileContent:
     bucket: google.cloud.storage.Bucket
@@ -29,35 +53,51 @@ class FileContent:
     object_id: str
     object_id_transformed: str
     content_raw: str
-    content: list
+    content: Iterator[str]
+    metadata: dict
     year: str
     month: str
 
-    def __init__(self, bucket_id, object_id):
+    def __init__(self, bucket_id, object_id, streaming: bool = False):
+        """
+        :param streaming: Read, transform and upload the file line by line in bounded memory,
+            self.content_raw stays empty. Otherwise the whole file is downloaded first.
+        """
         self.bucket_id = bucket_id
         self.object_id = object_id
+        self.streaming = streaming
+        self._content_consumed = False
+        self._content_text = None
+        self.content_raw = ""
+        self.metadata = {}
+        self.year = ""
+        self.month = ""
         self._initialize_bucket()
-        self._load_blob()
-        self.content = self.content_raw.split("\n")
+        if streaming:
+            self._open_blob()
+        else:
+            self._load_blob()
+            self.content = iter(self.content_raw.split("\n"))
 
     def _get_content(self):
-        return f"\n".join(self.content)
+        # Joined once, so a retried upload sends the same content
+        if self._content_text is None:
+            self._content_text = "\n".join(self.content)
+        return self._content_text
 
     def transform(self, target: str = None):
         """
-        Transforms the file content
+        Adds the line stages of the target to the content. The stages of all targets
+        run lazily in one pass when the content is saved.
         :param target: type of transformation
         :return: self
         """
         logging.info(f"transform: start target {target}")
         print(f"transform: start target {target}")
 
-        if target == "first_line":
-            self.content = self.content[1:]
-        elif target == "end_of_file":
-            self.content = self.content[:-3]
-        else:
+        if target not in UBS_STAGES:
             raise Exception(f"transform: Unknown target {target}")
+        self.content = apply_stages(self.content, UBS_STAGES[target], self.metadata)
 
         return self
 
@@ -69,10 +109,11 @@ class FileContent:
         logging.info(f"extract_date: start")
         print(f"extract_date: start")
 
-        first_data_row = self.content[1]
-        einkaufsdatum = first_data_row.split(";")[3]
-        self.year = einkaufsdatum.split(".")[2]
-        self.month = einkaufsdatum.split(".")[1]
+        self.content = apply_stages(self.content, [sniff_date(1, parse_einkaufsdatum)], self.metadata)
+        # Read ahead up to the first data row, the lines stay in the content
+        self.content = prime(self.content, lambda: "month" in self.metadata)
+        self.year = self.metadata["year"]
+        self.month = self.metadata["month"]
         print(f"extract_date: year {self.year} month {self.month}")
 
         return self
@@ -97,6 +138,74 @@ class FileContent:
             logging.error(f"Could not load the Blob from Google Storage {self.object_id}: {e}")
             raise RuntimeError(f"Could not load the Blob from Google Storage {self.object_id}: {e}")
 
+    @backoff.on_exception(backoff.expo, Exception, max_time=60, max_tries=3)
+    def _open_blob(self):
+        """
+        Opens the Blob in Google Storage for reading in chunks of STREAM_CHUNK_SIZE
+        and sets self.content to an iterator over its lines
+        """
+        try:
+            blob = self.bucket.blob(self.object_id)
+            reader = blob.open("rt", encoding="windows-1252", newline="\n", chunk_size=STREAM_CHUNK_SIZE)
+            self.content = split_lines(reader)
+        except Exception as e:
+            logging.error(f"Could not open the Blob from Google Storage {self.object_id}: {e}")
+            raise RuntimeError(f"Could not open the Blob from Google Storage {self.object_id}: {e}")
+
+    def _write_content(self, blob):
+        """
+        Uploads the line iterator through a resumable upload, WRITE_BATCH_LINES lines at a time.
+        Failed chunks are retried within the upload session; the whole upload can not be retried,
+        as the lines already sent are consumed from the stream.
+
+        The writer finalizes the upload on close also when the stream fails, so the lines are
+        uploaded to a staging object that is rewritten onto the blob only after the whole content
+        was written, and deleted otherwise. A failed run leaves no truncated output.
+        """
+        if self._content_consumed:
+            raise RuntimeError(f"Content of {self.object_id} was already streamed, the upload can not be retried")
+        self._content_consumed = True
+        staging_blob = self.bucket.blob(f"{STAGING_PREFIX}{blob.name}")
+        try:
+            with staging_blob.open("wb", chunk_size=STREAM_CHUNK_SIZE, retry=DEFAULT_RETRY) as writer:
+                separator = b""
+                while True:
+                    lines = list(itertools.islice(self.content, WRITE_BATCH_LINES))
+                    if not lines:
+                        break
+                    writer.write(separator + "\n".join(lines).encode('latin1'))
+                    separator = b"\n"
+            token, _, _ = blob.rewrite(staging_blob)
+            while token is not None:
+                token, _, _ = blob.rewrite(staging_blob, token=token)
+        finally:
+            try:
+                staging_blob.delete()
+            except Exception as e:
+                logging.warning(f"Could not delete the staging object {staging_blob.name}: {e}")
+
+    def load_to_bigquery(self, table_id: str, bq_client=None):
+        """
+        Replaces the month partition of the native table with the saved month folder
+        :param table_id: Destination table, e.g. banks.ubs_native
+        :param bq_client: BigQuery client, a new one is created if None
+        :return: self
+        """
+        try:
+            load_month_partition(
+                bq_client or bigquery.Client(),
+                table_id,
+                month_uri=f"gs://{self.bucket_id}/ubs/Monat={self.year}-{self.month}/",
+                source_uri_prefix=f"gs://{self.bucket_id}/ubs/{{Monat:String}}",
+                partition=f"{self.year}{self.month}",
+                encoding="ISO-8859-1",
+            )
+        except Exception as e:
+            logging.error(f"Could not load {self.object_id_transformed} into BigQuery {table_id}: {e}")
+            raise RuntimeError(f"Could not load {self.object_id_transformed} into BigQuery {table_id}: {e}")
+
+        return self
+
     @backoff.on_exception(backoff.expo, Exception, max_time=60, max_tries=3)
     def save_blob(self):
         """
@@ -107,7 +216,10 @@ class FileContent:
         self.object_id_transformed = f"ubs/Monat={self.year}-{self.month}/ubs_{self.year}-{self.month}_transactions.csv"
         try:
             blob = self.bucket.blob(self.object_id_transformed)
-            blob.upload_from_string(self._get_content().encode('latin1'))
+            if self.streaming:
+                self._write_content(blob)
+            else:
+                blob.upload_from_string(self._get_content().encode('latin1'))
         except Exception as e:
             logging.error(f"Could not save the Blob to Google Storage {self.object_id_transformed}: {e}")
             raise RuntimeError(f"Could not save the Blob to Google Storage {self.object_id_transformed}: {e}")
@@ -1,5 +1,7 @@
 import FileContent
+import io
 import unittest
+from unittest import mock
 
 #from FileContent import FileContent
 
@@ -68,5 +70,107 @@ class TestFileContent(unittest.TestCase):
 
         self.assertEqual(content, "Buchungsdatum;Konto;IBAN;BIC;Betrag;Währung;Verwendungszweck")
 
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def download_as_text(self, encoding):
+        return self.bucket.objects[self.name].decode(encoding)
+
+    def upload_from_string(self, data):
+        self.bucket.objects[self.name] = data
+
+    def open(self, mode, encoding=None, newline=None, **kwargs):
+        if mode == "rt":
+            return io.TextIOWrapper(io.BytesIO(self.bucket.objects[self.name]), encoding=encoding, newline=newline)
+        bucket, name = self.bucket, self.name
+
+        # Like the BlobWriter of google-cloud-storage 2.6.0: close() finalizes the upload, also on an exception
+        class Writer(io.BytesIO):
+            def close(self):
+                bucket.objects[name] = self.getvalue()
+                super().close()
+
+        return Writer()
+
+    def rewrite(self, source, token=None):
+        self.bucket.objects[self.name] = self.bucket.objects[source.name]
+        return None, len(self.bucket.objects[self.name]), len(self.bucket.objects[self.name])
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    """Local stand-in for google.cloud.storage.Bucket"""
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+UBS_EXPORT = (
+    "sep=;\n"
+    "Abschlussdatum;Abschlusszeit;Buchungsdatum;Valutadatum;Währung;Belastung;Gutschrift\n"
+    "31.01.2023;12:00:00;31.01.2023;31.01.2023;CHF;10.00;\n"
+    "30.01.2023;12:00:00;30.01.2023;30.01.2023;CHF;;20.00\n"
+    "\n"
+    "Total;;;;;10.00;20.00\n"
+).encode("windows-1252")
+
+
+class TestFileContentStreaming(unittest.TestCase):
+
+    def _transform(self, streaming):
+        bucket = FakeBucket({"raw/ubs.csv": UBS_EXPORT})
+        with mock.patch.object(FileContent.storage, "Client") as client:
+            client.return_value.bucket.return_value = bucket
+            file_content = FileContent.FileContent("af-finanzen-banks", "raw/ubs.csv", streaming=streaming)
+            file_content \
+                .transform(target="first_line") \
+                .transform(target="end_of_file") \
+                .extract_date() \
+                .save_blob()
+        return file_content, bucket.objects[file_content.object_id_transformed]
+
+    def test_streaming_matches_in_memory(self):
+        file_content, streamed = self._transform(streaming=True)
+        _, in_memory = self._transform(streaming=False)
+
+        self.assertEqual(streamed, in_memory)
+        expected = "\n".join(UBS_EXPORT.decode("windows-1252").split("\n")[1:][:-3])
+        self.assertEqual(streamed, expected.encode("latin1"))
+        self.assertEqual(file_content.object_id_transformed, "ubs/Monat=2023-01/ubs_2023-01_transactions.csv")
+        self.assertEqual(streamed.decode("latin1").split("\n")[-1], "30.01.2023;12:00:00;30.01.2023;30.01.2023;CHF;;20.00")
+
+    def test_failed_stream_leaves_no_output(self):
+        bucket = FakeBucket({"raw/ubs.csv": UBS_EXPORT})
+        with mock.patch.object(FileContent.storage, "Client") as client, \
+                mock.patch.object(FileContent, "WRITE_BATCH_LINES", 1):
+            client.return_value.bucket.return_value = bucket
+            file_content = FileContent.FileContent("af-finanzen-banks", "raw/ubs.csv", streaming=True)
+            file_content.transform(target="first_line").extract_date()
+
+            def failing_lines(lines):
+                yield next(lines)
+                raise UnicodeDecodeError("cp1252", b"\x81", 0, 1, "undefined")
+
+            file_content.content = failing_lines(file_content.content)
+            with self.assertRaises(RuntimeError):
+                file_content.save_blob()
+
+        self.assertEqual(list(bucket.objects), ["raw/ubs.csv"])
+
+    def test_streaming_in_small_batches(self):
+        with mock.patch.object(FileContent, "WRITE_BATCH_LINES", 1):
+            _, streamed = self._transform(streaming=True)
+        _, in_memory = self._transform(streaming=False)
+        self.assertEqual(streamed, in_memory)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
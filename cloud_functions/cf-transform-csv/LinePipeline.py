@@ -0,0 +1,125 @@
+__author__ = "Artur Fejklowicz"
+__copyright__ = "Copyright 2026, The AF Finanzen Project"
+__credits__ = ["Artur Fejklowicz"]
+__license__ = "GPLv3"
+__version__ = "1.0.0"
+__maintainer__ = "Artur Fejklowicz"
+__status__ = "Production"
+__doc__ = """
+Line stage transform engine shared by the bank CSV cloud functions.
+Each Cloud Function is deployed from its own directory, so this file is kept
+identical in cf-transform-csv and cf-pf-csv-transform.
+
+A stage is a function (lines, metadata) -> lines over line iterators. Stages are
+composed lazily, so a whole stage list runs in one pass over the file and only
+holds the lines a stage needs to look ahead (e.g. the footer window).
+"""
+
+import itertools
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List
+
+Stage = Callable[[Iterator[str], Dict[str, str]], Iterator[str]]
+
+
+def split_lines(text_stream: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the lines of a text stream without the line end, the same items as str.split("\\n")
+    (including the empty string after a trailing line end), without reading the whole stream.
+    """
+    ends_with_newline = True
+    for line in text_stream:
+        ends_with_newline = line.endswith("\n")
+        yield line[:-1] if ends_with_newline else line
+    if ends_with_newline:
+        yield ""
+
+
+def apply_stages(lines: Iterable[str], stages: List[Stage], metadata: Dict[str, str]) -> Iterator[str]:
+    """Composes the stages over the lines. Nothing is read until the result is iterated."""
+    lines = iter(lines)
+    for stage in stages:
+        lines = stage(lines, metadata)
+    return lines
+
+
+def prime(lines: Iterator[str], ready: Callable[[], bool]) -> Iterator[str]:
+    """
+    Advances the lines until ready() is true (e.g. a metadata value is sniffed) and
+    returns an iterator that still yields all lines, including the ones read ahead.
+    """
+    head = []
+    for line in lines:
+        head.append(line)
+        if ready():
+            break
+    return itertools.chain(head, lines)
+
+
+def strip_header(n: int) -> Stage:
+    """Drops the first n lines."""
+    def stage(lines, metadata):
+        return itertools.islice(lines, n, None)
+    return stage
+
+
+def strip_footer(n: int) -> Stage:
+    """Drops the last n lines, holding only n lines in a ring buffer."""
+    def stage(lines, metadata):
+        window = deque(maxlen=n)
+        for line in lines:
+            if len(window) == n:
+                yield window[0]
+            window.append(line)
+    return stage
+
+
+def strip_footer_while(predicate: Callable[[str], bool]) -> Stage:
+    """Drops the trailing lines that match the predicate, holding only the current run of matching lines."""
+    def stage(lines, metadata):
+        pending = []
+        for line in lines:
+            if predicate(line):
+                pending.append(line)
+            else:
+                yield from pending
+                pending.clear()
+                yield line
+    return stage
+
+
+def drop_blank() -> Stage:
+    """Drops empty and whitespace only lines."""
+    def stage(lines, metadata):
+        return (line for line in lines if line.strip() != "")
+    return stage
+
+
+def extract_metadata(name: str, pattern: str, within: int) -> Stage:
+    """Stores group 1 of the last match of the regex within the first lines as metadata[name]."""
+    regex = re.compile(pattern)
+
+    def stage(lines, metadata):
+        for i, line in enumerate(lines):
+            if i < within:
+                match = regex.search(line)
+                if match:
+                    metadata[name] = match.group(1)
+            yield line
+    return stage
+
+
+def sniff_date(row: int, parse: Callable[[List[str]], tuple]) -> Stage:
+    """
+    Reads ahead the lines up to index `row` and stores parse(lines) as metadata 'year' and 'month'.
+    The lines are passed on unchanged.
+    """
+    def stage(lines, metadata):
+        head = list(itertools.islice(lines, row + 1))
+        if len(head) <= row:
+            raise ValueError("File content is too short to extract date.")
+        metadata["year"], metadata["month"] = parse(head)
+        yield from head
+        yield from lines
+    return stage
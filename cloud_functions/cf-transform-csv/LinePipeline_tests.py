@@ -0,0 +1,59 @@
+import io
+import os
+import unittest
+
+import LinePipeline
+from LinePipeline import (apply_stages, drop_blank, extract_metadata, prime, sniff_date, split_lines,
+                          strip_footer, strip_footer_while, strip_header)
+
+
+def _run(lines, stages):
+    metadata = {}
+    return list(apply_stages(lines, stages, metadata)), metadata
+
+
+class TestLinePipeline(unittest.TestCase):
+
+    def test_split_lines(self):
+        for text in ["", "a", "a\n", "a\nb", "a\r\nb\n\n"]:
+            self.assertEqual(list(split_lines(io.StringIO(text, newline=""))), text.split("\n"))
+
+    def test_strip_header_and_footer(self):
+        self.assertEqual(_run("abcdef", [strip_header(1), strip_footer(3)])[0], ["b", "c"])
+        self.assertEqual(_run("ab", [strip_footer(3)])[0], [])
+
+    def test_strip_footer_while(self):
+        lines = ["h", "x", "", "y", "Disclaimer", ""]
+        stages = [strip_footer_while(lambda line: line == "" or line.startswith("Disclaimer"))]
+        self.assertEqual(_run(lines, stages)[0], ["h", "x", "", "y"])
+
+    def test_drop_blank(self):
+        self.assertEqual(_run(["a", " ", "", "b"], [drop_blank()])[0], ["a", "b"])
+
+    def test_extract_metadata_within_first_lines(self):
+        lines = ['Datum von:;2023-01-01', 'Konto:;="CH123"', 'h', 'Konto:;="CH999"']
+        _, metadata = _run(lines, [extract_metadata("account", r'^Konto:.*?="(.+?)"', within=3)])
+        self.assertEqual(metadata["account"], "CH123")
+
+    def test_sniff_date_and_prime(self):
+        metadata = {}
+        lines = apply_stages(iter(["h", "2023-02-01;x", "2023-02-02;y"]),
+                             [sniff_date(1, lambda rows: tuple(rows[1][:7].split("-")))], metadata)
+        lines = prime(lines, lambda: "month" in metadata)
+        self.assertEqual(metadata, {"year": "2023", "month": "02"})
+        self.assertEqual(list(lines), ["h", "2023-02-01;x", "2023-02-02;y"])
+
+    def test_sniff_date_too_short(self):
+        with self.assertRaises(ValueError):
+            _run(["h"], [sniff_date(1, lambda rows: ("", ""))])
+
+    def test_shared_copy_is_identical(self):
+        # Each Cloud Function is deployed from its own directory, so the engine is copied
+        other_copy = os.path.join(os.path.dirname(os.path.abspath(LinePipeline.__file__)),
+                                  "..", "cf-pf-csv-transform", "LinePipeline.py")
+        with open(LinePipeline.__file__, newline="") as f, open(other_copy, newline="") as g:
+            self.assertEqual(f.read().replace("\r\n", "\n"), g.read().replace("\r\n", "\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
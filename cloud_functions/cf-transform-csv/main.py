@@ -10,9 +10,14 @@ import google.cloud.logging
 import logging
 import traceback
 import backoff
+import base64
+import json
+import os
 from dateutil import parser
 from datetime import datetime, timezone
+from google.cloud import storage
 from FileContent import FileContent
+from DedupeIndex import create_index, dedupe_key
 
 
 # Cloud logger
@@ -24,6 +29,29 @@ logging.getLogger("backoff").addHandler(logging.StreamHandler())
 logging.basicConfig(level=logging.INFO)
 
 BUCKET_ID = "af-finanzen-banks"
+DEDUPE_PREFIX = "dedupe/cf-transform-csv/"
+# Native table the month is loaded into after saving, e.g. banks.ubs_native. Not loaded if unset.
+BQ_LOAD_TABLE = os.environ.get("BQ_LOAD_TABLE")
+
+# Created on first use and reused by the invocations of a warm instance
+_bucket = None
+_dedupe_index = None
+
+
+def get_dedupe_index():
+    global _bucket, _dedupe_index
+    if _bucket is None:
+        _bucket = storage.Client().bucket(BUCKET_ID)
+        _dedupe_index = create_index(_bucket, DEDUPE_PREFIX)
+    return _dedupe_index
+
+
+def notification_hash(event) -> str:
+    """MD5 hash of the object from the notification payload, None if not included"""
+    try:
+        return json.loads(base64.b64decode(event["data"]).decode("utf-8")).get("md5Hash")
+    except (KeyError, ValueError, TypeError):
+        return None
 
 
 def start(event, context):
@@ -36,13 +64,28 @@ def start(event, context):
         raise Exception(f"start: File in notification not found: {e}")
 
     logging.info(f"start: File gs://{bucket_id}/{object_id} triggered", extra={"labels": {"dst": "USER"}})
-    file_content = FileContent(BUCKET_ID, object_id)
+
+    # Skip redelivered notifications and re-uploads of identical content before downloading
+    dedupe_index = get_dedupe_index()
+    if dedupe_index is not None:
+        key = dedupe_key(object_id, attributes.get("objectGeneration"), notification_hash(event), bucket=_bucket.client.bucket(bucket_id))
+        if dedupe_index.seen(key):
+            logging.info(f"start: file {object_id} already transformed ({key}), skipping", extra={"labels": {"dst": "USER"}})
+            return
+
+    file_content = FileContent(BUCKET_ID, object_id, streaming=True)
     file_content \
         .transform(target="first_line")\
         .transform(target="end_of_file")\
         .extract_date()\
         .save_blob()
 
+    if BQ_LOAD_TABLE:
+        file_content.load_to_bigquery(BQ_LOAD_TABLE)
+
+    if dedupe_index is not None:
+        dedupe_index.mark(key, file_content.object_id_transformed)
+
     logging.info(f"start: file {object_id} transformed and saved")
     print(f"start: file {object_id} transformed and saved")
 
@@ -100,6 +100,32 @@ variable "internal_tables" {
             dataset_id = "banks"
             schema = "bq-schemas/banks.postfinance_iban_mapping.json"
         }
+        "ubs_native" = {
+            description = "UBS transactions, loaded per month by cf-transform-csv (BQ_LOAD_TABLE)"
+            dataset_id = "banks"
+            schema = "bq-schemas/banks.ubs_native.json"
+            # Monat is a YYYY-mm string, so the table is partitioned by load month (partition decorator $YYYYMM)
+            time_partitioning = {
+                type = "MONTH"
+                expiration_ms = null
+                field = null
+                require_partition_filter = false
+            }
+        }
+        "postfinance_native" = {
+            description = "PostFinance transactions, loaded per month by cf-pf-csv-transform (BQ_LOAD_TABLE)"
+            dataset_id = "banks"
+            clustering = ["account"]
+            schema = "bq-schemas/banks.postfinance_native.json"
+            range_partitioning = {
+                field = "month"
+                range = {
+                    start = 201801
+                    end = 203801
+                    interval = 1
+                }
+            }
+        }
         "i0_predictions" = {
             description = "Transak predictions. Iteration 0 of agile plan."
             dataset_id = "transak"
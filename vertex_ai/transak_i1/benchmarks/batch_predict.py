@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of the batch prediction input path.
+
+Compares the previous path (df2dataset with a per-element expand_dims map, batches of 32,
+12 keyword tensors per call) with the inference path of batch_predict/task.py
+(df2inference_arrays + large batches through the serving signature), in rows/sec.
+
+Usage:
+    python -m benchmarks.batch_predict
+    python -m benchmarks.batch_predict --rows 100000 --batch-sizes 512 4096
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from benchmarks.synthetic import build_adapted_model, make_transactions
+from src.common.utils import df2dataset, df2inference_arrays
+
+
+def _legacy_predict(predict_fn, df):
+    prediction_dataset = df2dataset(df, shuffle=False, batch_size=32, mode='inference')
+    all_predictions = []
+    for batch in prediction_dataset:
+        predictions_tensor = predict_fn(**batch)
+        output_key = list(predictions_tensor.keys())[0]
+        all_predictions.append(predictions_tensor[output_key].numpy())
+    return np.concatenate(all_predictions)
+
+
+def _array_predict(predict_fn, df, batch_size):
+    inputs = df2inference_arrays(df)
+    input_names = list(predict_fn.structured_input_signature[1].keys())
+    output_key = list(predict_fn.structured_outputs.keys())[0]
+    all_predictions = []
+    for start in range(0, len(df), batch_size):
+        predictions_tensor = predict_fn(**{
+            name: tf.constant(inputs[name][start:start + batch_size]) for name in input_names
+        })
+        all_predictions.append(predictions_tensor[output_key].numpy())
+    return np.concatenate(all_predictions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batch prediction input path.")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[512, 4096])
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows)
+    model = build_adapted_model(df)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model")
+        model.export(model_path)
+        predict_fn = tf.saved_model.load(model_path).signatures['serving_default']
+
+        # Warm up both paths once, so tracing is not part of the timing
+        _legacy_predict(predict_fn, df.head(64))
+        _array_predict(predict_fn, df.head(64), 64)
+
+        start = time.perf_counter()
+        expected = _legacy_predict(predict_fn, df)
+        legacy_seconds = time.perf_counter() - start
+        print(f"df2dataset, batch 32: {args.rows / legacy_seconds:>10,.0f} rows/sec")
+
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            actual = _array_predict(predict_fn, df, batch_size)
+            seconds = time.perf_counter() - start
+            assert np.allclose(expected, actual, atol=1e-5), "Predictions differ from the df2dataset path"
+            print(f"arrays, batch {batch_size:>5}: {args.rows / seconds:>10,.0f} rows/sec "
+                  f"({legacy_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
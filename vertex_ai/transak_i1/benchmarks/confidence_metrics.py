@@ -0,0 +1,131 @@
+"""
+Benchmark of the confidence threshold sweep used by model_evaluation_op.
+
+Compares the previous per-threshold loop (filter + sklearn confusion_matrix + f1_score)
+with the sort-once cumulative engine in src.common.metrics, and checks that both give
+the same `confidenceMetrics`.
+
+The per-threshold loop is O(N^2 * C), so for large row counts it is timed on a sample of
+thresholds and extrapolated to the full threshold count.
+
+Usage:
+    python -m benchmarks.confidence_metrics
+    python -m benchmarks.confidence_metrics --rows 10000 100000 1000000 --num-classes 13
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics import confusion_matrix, f1_score
+
+from src.common.metrics import (
+    confidence_threshold_metrics,
+    confidence_thresholds,
+    softmax,
+    to_confidence_metrics,
+)
+
+
+def _make_predictions(num_rows: int, num_classes: int, seed: int = 42):
+    """Creates random labels and logits that are correct for roughly 80% of rows."""
+    rng = np.random.default_rng(seed)
+    y_true = rng.integers(0, num_classes, size=num_rows)
+    logits = rng.normal(size=(num_rows, num_classes)).astype(np.float32)
+    logits[np.arange(num_rows), y_true] += rng.choice([0.0, 3.0], size=num_rows, p=[0.2, 0.8])
+    return y_true, softmax(logits)
+
+
+def _legacy_metric(y_true, y_pred, y_pred_max_proba, threshold, num_classes):
+    """One iteration of the previous per-threshold loop from model_evaluation_op."""
+    total_instances = len(y_true)
+    total_possible_negatives = total_instances * (num_classes - 1)
+    valid_indices = y_pred_max_proba >= threshold
+    y_true_filtered = y_true[valid_indices]
+    y_pred_filtered = y_pred[valid_indices]
+
+    if len(y_true_filtered) == 0:
+        tp_count, fp_count, fn_count = 0, 0, total_instances
+        tn_count = total_possible_negatives
+        precision_micro, recall_micro, f1_micro, f1_macro, false_positive_rate = 1.0, 0.0, 0.0, 0.0, 0.0
+    else:
+        cm_filtered = confusion_matrix(y_true_filtered, y_pred_filtered, labels=range(num_classes))
+        tp_count = int(np.diag(cm_filtered).sum())
+        fp_count = int(cm_filtered.sum() - tp_count)
+        fn_count = total_instances - tp_count
+        tn_count = total_possible_negatives - fp_count
+        precision_micro = tp_count / (tp_count + fp_count) if (tp_count + fp_count) > 0 else 1.0
+        recall_micro = tp_count / (tp_count + fn_count) if (tp_count + fn_count) > 0 else 0.0
+        false_positive_rate = fp_count / (fp_count + tn_count) if (fp_count + tn_count) > 0 else 0.0
+        f1_micro = 2 * (precision_micro * recall_micro) / (precision_micro + recall_micro) if (precision_micro + recall_micro) > 0 else 0.0
+        f1_macro = f1_score(y_true_filtered, y_pred_filtered, average='macro', labels=range(num_classes), zero_division=0)
+
+    return {
+        "confidenceThreshold": float(threshold), "maxPredictions": 10000,
+        "recall": recall_micro, "precision": precision_micro,
+        "falsePositiveRate": false_positive_rate, "f1Score": f1_micro,
+        "f1ScoreMicro": f1_micro, "f1ScoreMacro": f1_macro,
+        "truePositiveCount": tp_count, "falsePositiveCount": fp_count,
+        "falseNegativeCount": fn_count, "trueNegativeCount": tn_count,
+        "recallAt1": recall_micro, "precisionAt1": precision_micro,
+        "falsePositiveRateAt1": false_positive_rate, "f1ScoreAt1": f1_micro,
+    }
+
+
+def _legacy_confidence_metrics(y_true, y_pred_proba, num_classes, thresholds):
+    y_pred = np.argmax(y_pred_proba, axis=1)
+    y_pred_max_proba = np.max(y_pred_proba, axis=1)
+    return [_legacy_metric(y_true, y_pred, y_pred_max_proba, t, num_classes) for t in thresholds]
+
+
+def check_parity(num_rows: int, num_classes: int):
+    """Asserts that the cumulative engine reproduces the legacy confidenceMetrics."""
+    y_true, y_pred_proba = _make_predictions(num_rows, num_classes)
+    thresholds = confidence_thresholds(y_pred_proba)
+    expected = _legacy_confidence_metrics(y_true, y_pred_proba, num_classes, thresholds)
+    actual = to_confidence_metrics(confidence_threshold_metrics(y_true, y_pred_proba, num_classes, thresholds))
+
+    assert len(expected) == len(actual), f"{len(expected)} != {len(actual)} thresholds"
+    for expected_row, actual_row in zip(expected, actual):
+        assert expected_row.keys() == actual_row.keys()
+        for key, expected_value in expected_row.items():
+            assert np.isclose(expected_value, actual_row[key], rtol=1e-12, atol=0.0), \
+                f"{key} at threshold {expected_row['confidenceThreshold']}: {expected_value} != {actual_row[key]}"
+    print(f"Parity check passed on {num_rows} rows and {len(thresholds)} thresholds.")
+
+
+def benchmark(num_rows: int, num_classes: int, legacy_sample: int):
+    y_true, y_pred_proba = _make_predictions(num_rows, num_classes)
+
+    start = time.perf_counter()
+    thresholds = confidence_thresholds(y_pred_proba)
+    confidence_threshold_metrics(y_true, y_pred_proba, num_classes, thresholds)
+    vectorized_seconds = time.perf_counter() - start
+
+    # The legacy loop cost is linear in the number of thresholds, so it is sampled.
+    sampled = thresholds[np.linspace(0, len(thresholds) - 1, num=min(legacy_sample, len(thresholds))).astype(np.int64)]
+    start = time.perf_counter()
+    _legacy_confidence_metrics(y_true, y_pred_proba, num_classes, sampled)
+    legacy_seconds = (time.perf_counter() - start) * len(thresholds) / len(sampled)
+
+    print(
+        f"{num_rows:>9} rows | {len(thresholds):>9} thresholds | "
+        f"legacy ~{legacy_seconds:>10.1f}s (extrapolated from {len(sampled)}) | "
+        f"vectorized {vectorized_seconds:>7.3f}s | speed-up ~{legacy_seconds / vectorized_seconds:,.0f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the confidence threshold sweep.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--num-classes", type=int, default=13)
+    parser.add_argument("--legacy-sample", type=int, default=50, help="Thresholds timed with the legacy loop.")
+    parser.add_argument("--parity-rows", type=int, default=1_000, help="Rows used for the full parity check.")
+    args = parser.parse_args()
+
+    check_parity(args.parity_rows, args.num_classes)
+    for num_rows in args.rows:
+        benchmark(num_rows, args.num_classes, args.legacy_sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark of writing and reading batch prediction results (JSONL).
+
+Compares the previous handling (to_dict + json.dumps per row, pd.read_json + json_normalize)
+with PredictionWriter and iter_prediction_batches from src.common.predictions_io.
+
+Usage:
+    python -m benchmarks.predictions_io
+    python -m benchmarks.predictions_io --rows 100000 --num-classes 13
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_transactions
+from src.common.predictions_io import PredictionWriter, iter_prediction_batches, prediction_file_name
+
+
+def _legacy_write(path, instances_df, logits):
+    instances = instances_df.to_dict(orient='records')
+    all_predictions = logits.tolist()
+    with open(path, 'w') as f:
+        for instance, pred in zip(instances, all_predictions):
+            f.write(json.dumps({"instance": instance, "prediction": pred}) + '\n')
+
+
+def _legacy_read(path):
+    predictions_df = pd.read_json(path, lines=True)
+    instance_df = pd.json_normalize(predictions_df['instance'])
+    logits = np.stack(predictions_df['prediction'].to_numpy())
+    return instance_df, logits
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark(num_rows: int, num_classes: int, batch_size: int):
+    instances_df = make_transactions(num_rows)
+    logits = np.random.default_rng(0).normal(size=(num_rows, num_classes))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = os.path.join(tmp_dir, "legacy.jsonl")
+        _, legacy_write_seconds = _timed(_legacy_write, legacy_path, instances_df, logits)
+        (legacy_instances, legacy_logits), legacy_read_seconds = _timed(_legacy_read, legacy_path)
+
+        path = os.path.join(tmp_dir, prediction_file_name())
+
+        def write():
+            with PredictionWriter(path) as writer:
+                for start in range(0, num_rows, batch_size):
+                    writer.write_batch(instances_df.iloc[start:start + batch_size], logits[start:start + batch_size])
+
+        def read():
+            batches = list(iter_prediction_batches([path], batch_size=batch_size))
+            return pd.concat([instances for instances, _ in batches], ignore_index=True), np.concatenate([batch_logits for _, batch_logits in batches])
+
+        _, write_seconds = _timed(write)
+        (new_instances, new_logits), read_seconds = _timed(read)
+
+    assert np.allclose(legacy_logits, new_logits)
+    pd.testing.assert_frame_equal(legacy_instances, new_instances, check_dtype=False)
+
+    print(f"{num_rows:>9} rows | write: legacy {legacy_write_seconds:6.2f}s, streaming {write_seconds:6.2f}s "
+          f"({legacy_write_seconds / write_seconds:4.1f}x) | read: legacy {legacy_read_seconds:6.2f}s, "
+          f"streaming {read_seconds:6.2f}s ({legacy_read_seconds / read_seconds:4.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prediction results JSONL handling.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--num-classes", type=int, default=13)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    for num_rows in args.rows:
+        benchmark(num_rows, args.num_classes, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Micro-benchmark of the preprocessing layer adaptation in the trainer.
+
+Compares the previous path (three adapt() scans of the shuffled, batched train_ds plus a
+pandas copy for the normalizer) with build_preprocessing_state (one pass over the rows),
+and checks that both give the same vocabularies.
+
+Usage:
+    python -m benchmarks.preprocessing_state
+    python -m benchmarks.preprocessing_state --rows 200000 --batch-size 64
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_transactions
+from src.common.preprocessing_state import build_preprocessing_state
+from src.common.utils import df2dataset
+from src.components.trainer.model import create_stateful_preprocessing_layers
+
+
+def _legacy_adapt(train_df, batch_size):
+    train_ds = df2dataset(train_df, batch_size=batch_size)
+    preprocessing_layers = create_stateful_preprocessing_layers({'desc_vocab_size': 5000})
+    preprocessing_layers['description_text_vectorizer'].adapt(train_ds.map(lambda x, y: x['description']))
+    preprocessing_layers['type_lookup'].adapt(train_ds.map(lambda x, y: x['type']))
+    preprocessing_layers['currency_lookup'].adapt(train_ds.map(lambda x, y: x['currency']))
+    df_for_adapt = train_df.copy()
+    df_for_adapt['amount_log'] = np.log1p(np.abs(df_for_adapt['amount']))
+    df_for_adapt['amount_sign'] = (df_for_adapt['amount'] >= 0).astype(np.float32)
+    preprocessing_layers['normalizer'].adapt(
+        df_for_adapt[['started_year', 'first_started_year', 'amount_log', 'amount_sign']].values)
+    return preprocessing_layers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing layer adaptation.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    train_df = make_transactions(args.rows).drop(columns=['tid'])
+
+    start = time.perf_counter()
+    expected = _legacy_adapt(train_df, args.batch_size)
+    legacy_seconds = time.perf_counter() - start
+    print(f"adapt() per layer:         {legacy_seconds:>7.2f}s")
+
+    start = time.perf_counter()
+    actual = build_preprocessing_state(train_df).apply(create_stateful_preprocessing_layers({'desc_vocab_size': 5000}))
+    seconds = time.perf_counter() - start
+    for name in ('description_text_vectorizer', 'type_lookup', 'currency_lookup'):
+        assert actual[name].get_vocabulary() == expected[name].get_vocabulary(), f"Vocabulary of {name} differs"
+    assert np.allclose(np.asarray(actual['normalizer'].mean), np.asarray(expected['normalizer'].mean), rtol=1e-5)
+    print(f"build_preprocessing_state: {seconds:>7.2f}s ({legacy_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Synthetic transactions for the benchmarks."""
+import numpy as np
+import pandas as pd
+
+
+def make_transactions(num_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Creates random transactions with the columns of the data splits."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'tid': np.arange(num_rows, dtype=np.int64),
+        'type': rng.choice(['CARD_PAYMENT', 'TRANSFER', 'TOPUP'], size=num_rows),
+        'started_year': rng.integers(2020, 2026, size=num_rows),
+        'started_month': rng.integers(1, 13, size=num_rows),
+        'started_day': rng.integers(1, 32, size=num_rows),
+        'started_weekday': rng.integers(0, 7, size=num_rows),
+        'first_started_year': rng.integers(2020, 2026, size=num_rows),
+        'first_started_month': rng.integers(1, 13, size=num_rows),
+        'first_started_day': rng.integers(1, 32, size=num_rows),
+        'first_started_weekday': rng.integers(0, 7, size=num_rows),
+        'description': [f'shop number {i % 997}' for i in range(num_rows)],
+        'amount': rng.normal(scale=100, size=num_rows).round(2),
+        'currency': rng.choice(['CHF', 'EUR', 'PLN'], size=num_rows),
+        'i1_true_label_id': rng.integers(0, 13, size=num_rows),
+    })
+
+
+def build_adapted_model(train_df: pd.DataFrame, num_classes: int = 13, hyperparams: dict = None):
+    """
+    Builds the Wide & Deep model with preprocessing layers adapted on train_df,
+    the same way the trainer task does, but without training it.
+    """
+    from src.common.preprocessing_state import build_preprocessing_state
+    from src.components.trainer.model import build_model, create_stateful_preprocessing_layers
+
+    preprocessing_layers = create_stateful_preprocessing_layers({'desc_vocab_size': 5000})
+    build_preprocessing_state(train_df).apply(preprocessing_layers)
+
+    model_hyperparams = {
+        'desc_hash_bins': 1000,
+        'cross_bins': 5000,
+        'num_classes': num_classes,
+        'desc_embedding_dim': 32,
+        'type_embedding_dim': 4,
+        'currency_embedding_dim': 3,
+        'learning_rate': 0.0002,
+    }
+    model_hyperparams.update(hyperparams or {})
+    return build_model(preprocessing_layers=preprocessing_layers, hyperparams=model_hyperparams)
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the training performance settings of build_model.
+
+Trains the default graph and the opt-in performance settings (fused cyclical features,
+XLA on the fused features, steps_per_execution, mixed precision) on the same data with
+the same seed. It reports the training step time and checks that the validation accuracy
+of the performance mode stays within --tolerance of the default graph.
+
+Usage:
+    python -m benchmarks.training_performance
+    python -m benchmarks.training_performance --rows 50000 --batch-size 16 --epochs 3
+"""
+import argparse
+import time
+
+import tensorflow as tf
+
+from benchmarks.synthetic import build_adapted_model, make_transactions
+from src.common.utils import df2dataset
+from src.components.trainer.model import PERFORMANCE_MODE
+
+
+class _EpochTimer(tf.keras.callbacks.Callback):
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.seconds = time.perf_counter() - self.start
+
+
+def _train(train_df, val_df, hyperparams, batch_size, epochs):
+    """Returns (ms per step of the last epoch, validation accuracy after the last epoch)."""
+    tf.keras.utils.set_random_seed(42)
+    model = build_adapted_model(train_df, hyperparams=hyperparams)
+    timer = _EpochTimer()
+    history = model.fit(
+        df2dataset(train_df, batch_size=batch_size, cache=''),
+        validation_data=df2dataset(val_df, shuffle=False, batch_size=batch_size, cache=''),
+        epochs=epochs, callbacks=[timer], verbose=0,
+    )
+    steps = -(-len(train_df) // batch_size)
+    return timer.seconds / steps * 1000, history.history['val_accuracy'][-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the training performance settings.")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Allowed validation accuracy difference.")
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows)
+    # A label the description determines, so the validation accuracy is meaningful
+    df['i1_true_label_id'] = df['tid'] % 997 % 13
+    split = int(len(df) * 0.8)
+    train_df, val_df = df.iloc[:split], df.iloc[split:]
+
+    modes = {
+        "default": {},
+        "fused": {'fused_features': True},
+        "fused + XLA": {'fused_features': True, 'jit_compile': True},
+        "performance mode": PERFORMANCE_MODE,
+        "+ mixed bfloat16": {**PERFORMANCE_MODE, 'mixed_precision': True},
+    }
+    results = {}
+    for name, hyperparams in modes.items():
+        results[name] = _train(train_df, val_df, hyperparams, args.batch_size, args.epochs)
+        step_ms, val_accuracy = results[name]
+        print(f"{name:<18} {step_ms:>7.2f} ms/step ({results['default'][0] / step_ms:.2f}x)  val_accuracy {val_accuracy:.4f}")
+
+    difference = abs(results["performance mode"][1] - results["default"][1])
+    assert difference <= args.tolerance, f"Validation accuracy differs by {difference:.4f} from the default graph"
+    print(f"Parity: validation accuracy of the performance mode within {difference:.4f} of the default graph")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,22 @@ def batch_predict_op(
     test_data: Input[Dataset],
     predictions: Output[Artifact],
     experiment_name: str,
+    batch_size: int = 4096,
+    num_workers: int = 1,
+    model_cache_dir: str = "",
 ):
     """
     A custom component to perform batch predictions using a trained TensorFlow model
     retrieved from the Vertex AI Model Registry.
+
+    With `num_workers` > 1 the input is split into that many shards, predicted in parallel
+    worker processes and written as prediction.results-0000k-of-0000K.jsonl files.
+
+    The model cache is opt-in: by default (empty `model_cache_dir`) the SavedModel is loaded
+    directly from its artifact URI. Every component runs in a fresh pod, so a cache in the
+    container's /tmp would never be reused. Set `model_cache_dir` to a persistent location
+    that outlives the pod (a mounted volume) to download each model once (content-addressed,
+    LRU evicted) and reuse it in later components and runs.
     """
     return ContainerSpec(
         image=BATCH_PREDICT_CONTAINER_IMAGE_URI,
@@ -28,5 +40,8 @@ def batch_predict_op(
             "--test-data-uri", test_data.uri,
             "--predictions-path", predictions.path,
             "--experiment-name", experiment_name,
+            "--batch-size", str(batch_size),
+            "--num-workers", str(num_workers),
+            "--model-cache-dir", model_cache_dir,
         ]
     )
@@ -33,6 +33,7 @@ def create_monitoring_baseline_op(
     import pandas as pd
     from pathlib import Path
     from google.cloud import bigquery
+    from src.common.predictions_io import prediction_files, read_predictions
 
     logging.basicConfig(level=logging.INFO)
 
@@ -47,24 +48,16 @@ def create_monitoring_baseline_op(
     prediction_dir = Path(predictions_artifact.path)
     logging.info(f"Searching for prediction files in local directory: {prediction_dir}")
 
-    jsonl_files = list(prediction_dir.glob("prediction.results-*.jsonl"))
-    if not jsonl_files:
-        raise FileNotFoundError(
-            f"No prediction results file found in {predictions_artifact.path}"
-        )
-
+    jsonl_files = prediction_files(predictions_artifact.path)
     logging.info(f"Found local prediction files: {jsonl_files}")
 
-    df_list = [pd.read_json(f, lines=True) for f in jsonl_files]
-    predictions_df = pd.concat(df_list, ignore_index=True)
-    logging.info(f"Successfully loaded {len(predictions_df)} predictions.")
+    instance_df, logits = read_predictions(jsonl_files)
+    logging.info(f"Successfully loaded {len(instance_df)} predictions.")
 
     # --- 3. Process data ---
-    instance_df = pd.json_normalize(predictions_df["instance"])
     logging.info(f"Extracted features. Columns: {instance_df.columns.tolist()}")
 
-    logits = list(predictions_df["prediction"])
-    predicted_class_ids = [np.argmax(logit_list) for logit_list in logits]
+    predicted_class_ids = np.argmax(logits, axis=1).tolist()
     
     predicted_labels = [label_mapping.get(id, "unknown") for id in predicted_class_ids]
     prediction_df = pd.DataFrame({"i1_pred_label": predicted_labels})
@@ -2,7 +2,7 @@ from kfp.v2.dsl import component, Input, Output, Dataset, Artifact
 from google_cloud_pipeline_components.types.artifact_types import BQTable
 
 @component(
-    base_image='python:3.9',
+    base_image="europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest",
     packages_to_install=["pandas", "google-cloud-bigquery", "db-dtypes", "google-cloud-pipeline-components"],
 )
 def data_splits_op(
@@ -14,16 +14,24 @@ def data_splits_op(
     project_id: str,
     region: str,
     target_column: str,
+    output_format: str = "parquet",
 ):
     """
     A component that reads golden data, splits it into train, validation, and test sets,
     and calculates statistics for each split, attaching them as metadata.
+
+    The query result is streamed in Arrow record batches (BigQuery Storage Read API when
+    available) directly into the split artifacts, so the golden table is never held in memory.
+    The splits are written as Parquet with the Arrow schema derived from the feature query
+    (`output_format="csv"` writes CSV instead). Readers detect the format automatically.
     """
 
     import json
     import pandas as pd
     import numpy as np
     from google.cloud import bigquery
+    from src.common.bq_io import write_query_to_split_datasets
+    from src.common.dataset_io import read_dataset
     
     def _calculate_dataframe_statistics(df: pd.DataFrame, target_column: str) -> dict:
         """Calculates various statistics for a given DataFrame."""
@@ -113,20 +121,17 @@ def data_splits_op(
     """
     bq_client = bigquery.Client(project=project_id)
     print(f"Running query: {query}")
-    df = bq_client.query(query).to_dataframe()
-
-    train_df = df[df.split_set == 'train'].drop(columns=['split_set'])
-    val_df = df[df.split_set == 'validation'].drop(columns=['split_set'])
-    test_df = df[df.split_set == 'test'].drop(columns=['split_set'])
 
-    # Save splits data to GCS paths
-    print(f"Saving splits data to {train_data.path}")
-    train_df.to_csv(train_data.path, index=False)
-    val_df.to_csv(val_data.path, index=False)
-    test_df.to_csv(test_data.path, index=False)
+    # Stream the query result straight into the split artifacts, one record batch at a time
+    print(f"Saving splits data as {output_format} to {train_data.path}")
+    split_paths = {'train': train_data.path, 'validation': val_data.path, 'test': test_data.path}
+    split_rows = write_query_to_split_datasets(
+        bq_client, query, split_paths, split_column='split_set', file_format=output_format
+    )
+    print(f"Rows per split: {split_rows}")
 
     # Create and save a mapping from i1_true_label_id to i1_true_label
-    label_mapping_df = train_df[['i1_true_label_id', 'i1_true_label']].drop_duplicates().sort_values('i1_true_label_id')
+    label_mapping_df = read_dataset(train_data.path, columns=['i1_true_label_id', 'i1_true_label']).drop_duplicates().sort_values('i1_true_label_id')
     label_mapping = pd.Series(label_mapping_df.i1_true_label.values, index=label_mapping_df.i1_true_label_id).to_dict()
 
     # Convert integer keys to strings for JSON compatibility
@@ -137,10 +142,10 @@ def data_splits_op(
 
     print("Class Label Mapping (id: label):", label_mapping_json)
 
-    # Calculate and attach statistics as metadata
-    train_data.metadata = _calculate_dataframe_statistics(train_df, target_column)
-    val_data.metadata = _calculate_dataframe_statistics(val_df, target_column)
-    test_data.metadata = _calculate_dataframe_statistics(test_df, target_column)
+    # Calculate and attach statistics as metadata, reading back one split at a time
+    for split_data in (train_data, val_data, test_data):
+        split_data.metadata = _calculate_dataframe_statistics(read_dataset(split_data.path), target_column)
+        split_data.metadata['file_format'] = output_format
 
     print("Train Data Statistics:", train_data.metadata)
     print("Validation Data Statistics:", val_data.metadata)
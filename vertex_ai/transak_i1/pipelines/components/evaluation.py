@@ -11,7 +11,7 @@ from google_cloud_pipeline_components.types.artifact_types import (
 
 
 @dsl.component(
-    base_image="python:3.10",
+    base_image="europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest",
     packages_to_install=[
         "google-cloud-aiplatform==1.100.0",
         "google-cloud-pipeline-components==2.20.1",
@@ -30,6 +30,7 @@ def model_evaluation_op(
     evaluation_metrics: Output[ClassificationMetrics],
     target_column: str = 'i1_true_label_id',
     evaluation_display_name: str = "production_evaluation",
+    max_confidence_thresholds: int = 0,
 ):
     """
     Perform model evaluation, add metadata, and upload metrics.
@@ -38,55 +39,48 @@ def model_evaluation_op(
     a comprehensive set of classification metrics, adds the max F1 macro score
     to the artifact's metadata, and uploads the metrics as a ModelEvaluation
     to the Vertex AI Model Registry.
+
+    The confidence metrics are computed for every unique probability as threshold.
+    Set `max_confidence_thresholds` to emit only that many evenly spaced thresholds
+    to the registry (0 emits all of them). The max F1 macro always uses all thresholds.
     """
     import json
-    from pathlib import Path
-    import numpy as np
-    import pandas as pd
     from google.cloud import aiplatform
     from google.cloud.aiplatform import gapic
     from sklearn.metrics import (
         average_precision_score,
-        confusion_matrix,
-        f1_score,
         log_loss,
         roc_auc_score,
     )
+    from src.common.metrics import (
+        confidence_threshold_metrics,
+        confidence_thresholds,
+        sample_thresholds,
+        softmax,
+        to_confidence_metrics,
+    )
+    from src.common.predictions_io import prediction_files, read_predictions
 
     # Initialize clients
     aiplatform.init(project=project, location=location)
 
-    def softmax(x):
-        """Compute softmax values for each sets of scores in x."""
-        e_x = np.exp(x - np.max(x, axis=1, keepdims=True))
-        return e_x / e_x.sum(axis=1, keepdims=True)
-
     # 1. Read inputs from local paths and artifact metadata
     print("Reading inputs...")
     model_resource_name = vertex_model.metadata["resourceName"]
     print(f"Retrieved model resource name from artifact metadata: {model_resource_name}")
 
-    # Find the prediction file and read it directly into Pandas
-    prediction_dir = Path(predictions.path)
-    jsonl_file = next(
-        (f for f in prediction_dir.iterdir() if "prediction.results-" in f.name),
-        None,
-    )
-    if not jsonl_file:
-        raise FileNotFoundError(f"No prediction results file found in {predictions.path}")
-
-    print(f"Reading predictions from {jsonl_file} into DataFrame.")
-    predictions_df = pd.read_json(jsonl_file, lines=True)
+    # Read the prediction files, keeping only the target column of the instances
+    jsonl_files = prediction_files(predictions.path)
+    print(f"Reading predictions from {jsonl_files}.")
+    instances_df, y_pred_logits = read_predictions(jsonl_files, columns=[target_column])
 
     # Read class labels
     with open(class_labels.path, 'r') as f:
         class_labels = json.load(f)
     print("Inputs read successfully.")
 
-    # Extract numpy arrays from the DataFrame
-    y_true = predictions_df['instance'].apply(lambda x: x[target_column]).to_numpy()
-    y_pred_logits = np.stack(predictions_df['prediction'].to_numpy())
-    y_pred = np.argmax(softmax(y_pred_logits), axis=1)
+    # Extract the true labels from the instances
+    y_true = instances_df[target_column].to_numpy()
     print(f"Found {len(y_true)} records for evaluation.")
 
     # 2. Calculate metrics
@@ -96,51 +90,21 @@ def model_evaluation_op(
     au_roc = roc_auc_score(y_true, y_pred_proba, average='micro', multi_class='ovr')
     logloss = log_loss(y_true, y_pred_proba)
 
-    confidence_metrics = []
-    all_probabilities = y_pred_proba.ravel()
-    confidence_thresholds = np.sort(np.unique(np.concatenate(([0.0, 1.0], all_probabilities))))[::-1]
-    print(f"Generating metrics for {len(confidence_thresholds)} unique thresholds...")
-
     num_classes = len(class_labels)
-    total_instances = len(y_true)
-    total_possible_negatives = total_instances * (num_classes - 1)
     annotation_specs_list = [
         {"id": str(label_id), "displayName": label_name}
         for label_id, label_name in sorted(class_labels.items(), key=lambda item: int(item[0]))
     ]
+    all_thresholds = confidence_thresholds(y_pred_proba)
+    print(f"Generating metrics for {len(all_thresholds)} unique thresholds...")
+    sweep = confidence_threshold_metrics(y_true, y_pred_proba, num_classes, all_thresholds)
+    max_f1_macro = float(sweep["f1_macro"].max()) if len(all_thresholds) else 0.0
 
-    for threshold in confidence_thresholds:
-        y_pred_max_proba = np.max(y_pred_proba, axis=1)
-        valid_indices = y_pred_max_proba >= threshold
-        y_true_filtered = y_true[valid_indices]
-        y_pred_filtered = y_pred[valid_indices]
-
-        if len(y_true_filtered) == 0:
-            tp_count, fp_count, fn_count = 0, 0, total_instances
-            tn_count = total_possible_negatives
-            precision_micro, recall_micro, f1_micro, f1_macro, false_positive_rate = 1.0, 0.0, 0.0, 0.0, 0.0
-        else:
-            cm_filtered = confusion_matrix(y_true_filtered, y_pred_filtered, labels=range(num_classes))
-            tp_count = int(np.diag(cm_filtered).sum())
-            fp_count = int(cm_filtered.sum() - tp_count)
-            fn_count = total_instances - tp_count
-            tn_count = total_possible_negatives - fp_count
-            precision_micro = tp_count / (tp_count + fp_count) if (tp_count + fp_count) > 0 else 1.0
-            recall_micro = tp_count / (tp_count + fn_count) if (tp_count + fn_count) > 0 else 0.0
-            false_positive_rate = fp_count / (fp_count + tn_count) if (fp_count + tn_count) > 0 else 0.0
-            f1_micro = 2 * (precision_micro * recall_micro) / (precision_micro + recall_micro) if (precision_micro + recall_micro) > 0 else 0.0
-            f1_macro = f1_score(y_true_filtered, y_pred_filtered, average='macro', labels=range(num_classes), zero_division=0)
-
-        confidence_metrics.append({
-            "confidenceThreshold": float(threshold), "maxPredictions": 10000,
-            "recall": recall_micro, "precision": precision_micro,
-            "falsePositiveRate": false_positive_rate, "f1Score": f1_micro,
-            "f1ScoreMicro": f1_micro, "f1ScoreMacro": f1_macro,
-            "truePositiveCount": tp_count, "falsePositiveCount": fp_count,
-            "falseNegativeCount": fn_count, "trueNegativeCount": tn_count,
-            "recallAt1": recall_micro, "precisionAt1": precision_micro,
-            "falsePositiveRateAt1": false_positive_rate, "f1ScoreAt1": f1_micro,
-        })
+    emitted_thresholds = sample_thresholds(all_thresholds, max_confidence_thresholds)
+    if len(emitted_thresholds) < len(all_thresholds):
+        print(f"Emitting {len(emitted_thresholds)} of {len(all_thresholds)} thresholds to the registry.")
+        sweep = confidence_threshold_metrics(y_true, y_pred_proba, num_classes, emitted_thresholds)
+    confidence_metrics = to_confidence_metrics(sweep)
 
     # 3. Finalize metrics and add metadata
     final_evaluation_metrics = {
@@ -148,11 +112,6 @@ def model_evaluation_op(
         "confidenceMetrics": confidence_metrics,
     }
 
-    # Find the max f1_macro from the calculated confidence metrics
-    max_f1_macro = 0.0
-    if confidence_metrics:
-        max_f1_macro = max(m.get('f1ScoreMacro', 0.0) for m in confidence_metrics)
-
     print(f"Saving evaluation metrics to {evaluation_metrics.path}")
     with open(evaluation_metrics.path, 'w') as f:
         json.dump(final_evaluation_metrics, f, indent=4)
@@ -1,25 +1,31 @@
 from kfp.v2.dsl import component, Output, Dataset
 
 @component(
-    base_image='us-docker.pkg.dev/deeplearning-platform-release/gcr.io/tf2-cpu.2-17.py310',
+    base_image="europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest",
 )
 def get_prediction_data_op(
     prediction_data: Output[Dataset],
     project_id: str,
     month: int,
     query: str,
+    output_format: str = "parquet",
 ):
     """
     A component that executes a query for a given month and saves the result to a GCS path.
+
+    The result is streamed in Arrow record batches (BigQuery Storage Read API when available)
+    directly into the output artifact, so memory stays flat regardless of the month size.
     """
-    import pandas as pd
     from google.cloud import bigquery
+    from src.common.bq_io import write_query_to_dataset
 
     final_query = query.format(month_placeholder=month)
 
     bq_client = bigquery.Client(project=project_id)
     print(f"Running query: {final_query}")
-    df = bq_client.query(final_query).to_dataframe()
 
-    print(f"Saving prediction data to {prediction_data.path}")
-    df.to_csv(prediction_data.path, index=False)
+    print(f"Saving prediction data as {output_format} to {prediction_data.path}")
+    num_rows = write_query_to_dataset(bq_client, final_query, prediction_data.path, file_format=output_format)
+    print(f"Saved {num_rows} rows of prediction data.")
+    prediction_data.metadata['num_rows'] = num_rows
+    prediction_data.metadata['file_format'] = output_format
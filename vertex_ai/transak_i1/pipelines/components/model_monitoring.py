@@ -2,7 +2,7 @@ from kfp.v2.dsl import component, Input, Output, Dataset
 from google_cloud_pipeline_components.types.artifact_types import VertexModel
 
 @component(
-    base_image='python:3.9',
+    base_image="europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest",
     packages_to_install=["pandas", "numpy", "google-cloud-aiplatform", "fsspec", "gcsfs"],
 )
 def model_monitoring_op(
@@ -19,6 +19,7 @@ def model_monitoring_op(
     import numpy as np
     from google.cloud import aiplatform
     import re
+    from src.common.dataset_io import read_dataset
 
     # Get the training data URI from the model description
     model_resource_name = model.metadata["resourceName"]
@@ -49,8 +50,9 @@ def model_monitoring_op(
         
         return stats
 
-    train_df = pd.read_csv(training_data_uri)
-    predict_df = pd.read_csv(prediction_data.path)
+    # The splits may be Parquet or CSV, read_dataset detects the format
+    train_df = read_dataset(training_data_uri)
+    predict_df = read_dataset(prediction_data.path)
 
     train_stats = _calculate_dataframe_statistics(train_df)
     predict_stats = _calculate_dataframe_statistics(predict_df)
@@ -2,7 +2,7 @@ from kfp.v2.dsl import component, Input, Output, Artifact
 from google_cloud_pipeline_components.types.artifact_types import BQTable
 
 @component(
-    base_image='python:3.9',
+    base_image="europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest",
     packages_to_install=["pandas==2.2.2", "google_cloud_pipeline_components==2.20.1", "db-dtypes", "pyarrow", "google-cloud-bigquery"],
 )
 def save_predictions_op(
@@ -13,105 +13,96 @@ def save_predictions_op(
     bigquery_prediction_table_fqtn: str,
     pipeline_run_id: str,
     month: int,
+    chunk_size: int = 100000,
 ):
     """
     A component that saves batch predictions to a BigQuery table.
+
+    Predictions are read and loaded in chunks of `chunk_size` rows, so at most one
+    chunk is held in memory. Set `chunk_size` to 0 to load all predictions with a
+    single load job. The chunks are loaded into a staging table of this run, which
+    is appended to the prediction table with one copy job and then deleted: a failed
+    chunk leaves no rows of the month behind, so retries do not duplicate them.
     """
+    import datetime
+    import uuid
     import pandas as pd
+    from google.api_core.exceptions import NotFound
     from google.cloud import bigquery
     import numpy as np
-    from pathlib import Path
-    import math
-
-    # --- Helper Functions ---
-    def softmax(x):
-        """Compute softmax values for a single list of scores."""
-        e_x = np.exp(x - np.max(x))
-        return e_x / e_x.sum()
-
-    def entropy(p):
-        """Compute entropy for a single probability distribution."""
-        return -sum([p_i * math.log(p_i) for p_i in p if p_i > 0])
-
-    # Find the prediction file and read it directly into Pandas
-    prediction_dir = Path(predictions.path)
-    jsonl_file = next(
-        (f for f in prediction_dir.iterdir() if "prediction.results-" in f.name),
-        None,
-    )
-    if not jsonl_file:
-        raise FileNotFoundError(f"No prediction results file found in {predictions.path}")
-
-    print(f"Reading predictions from {jsonl_file} into DataFrame.")
-    predictions_df = pd.read_json(jsonl_file, lines=True)
-
-    # The 'instance' column is a dict, and the 'prediction' column is a list of scores (logits).
-    # We want to flatten the instance and calculate our metrics.
-    
-    # Get the original data from the 'instance' column
-    instance_df = pd.json_normalize(predictions_df['instance'])
-    
-    # Get the logits
-    logits = list(predictions_df['prediction'])
-
-    # --- Calculate Metrics ---
-    predicted_class_ids = []
-    probabilities_list = []
-    confidence_msp_list = []
-    confidence_margin_list = []
-    confidence_entropy_list = []
+    from src.common.metrics import prediction_confidence
+    from src.common.predictions_io import iter_prediction_batches, prediction_files, read_predictions
 
-    for logit_list in logits:
-        # Probabilities
-        probabilities = softmax(np.array(logit_list))
-        probabilities_list.append(probabilities.tolist())
-        
-        # Predicted class
-        predicted_class_ids.append(np.argmax(probabilities))
-        
-        # MSP
-        confidence_msp_list.append(np.max(probabilities))
-        
-        # Margin
-        sorted_probs = np.sort(probabilities)[::-1]
-        margin = sorted_probs[0] - sorted_probs[1] if len(sorted_probs) > 1 else sorted_probs[0]
-        confidence_margin_list.append(margin)
-        
-        # Entropy
-        confidence_entropy_list.append(entropy(probabilities))
-
-    # Create a new dataframe with the results
-    results_df = pd.concat([
-        instance_df,
-        pd.DataFrame({
-            'i1_pred_label_id': predicted_class_ids,
-            'logits': logits,
-            'probas': probabilities_list,
-            'confidence_msp': confidence_msp_list,
-            'confidence_margin': confidence_margin_list,
-            'confidence_entropy': confidence_entropy_list
-        })
-    ], axis=1)
+    # Find the prediction files
+    jsonl_files = prediction_files(predictions.path)
 
     # Add the pipeline run URL for traceability
     if "placeholder" in pipeline_run_id.lower():
         pipeline_run_url = "local_run"
     else:
         pipeline_run_url = f"https://console.cloud.google.com/vertex-ai/pipelines/locations/{region}/runs/{pipeline_run_id}?project={project_id}"
-    results_df["pipeline_run_url"] = pipeline_run_url
-    results_df["month"] = month
 
-    # Save the predictions to BigQuery
+    def to_results_df(instance_df: pd.DataFrame, logits: np.ndarray) -> pd.DataFrame:
+        """Adds the predicted class and confidence scores to the instances."""
+        # --- Calculate Metrics --- all rows of the chunk at once
+        confidence = prediction_confidence(logits)
+
+        results_df = pd.concat([
+            instance_df,
+            pd.DataFrame({
+                'i1_pred_label_id': confidence['predicted_class_ids'],
+                'logits': logits.tolist(),
+                'probas': confidence['probas'].tolist(),
+                'confidence_msp': confidence['confidence_msp'],
+                'confidence_margin': confidence['confidence_margin'],
+                'confidence_entropy': confidence['confidence_entropy'],
+            })
+        ], axis=1)
+        results_df["pipeline_run_url"] = pipeline_run_url
+        results_df["month"] = month
+        return results_df
+
+    # Save the predictions to BigQuery, through a staging table so the append is all-or-nothing
     bq_client = bigquery.Client(project=project_id)
+    staging_table_fqtn = f"{bigquery_prediction_table_fqtn}_staging_{uuid.uuid4().hex}"
     job_config = bigquery.LoadJobConfig(
         write_disposition="WRITE_APPEND",
     )
+    try:
+        # The staging table gets the schema of the prediction table, so the copy can append to it
+        job_config.schema = bq_client.get_table(bigquery_prediction_table_fqtn).schema
+    except NotFound:
+        pass
 
-    print(f"Saving predictions to {bigquery_prediction_table_fqtn}")
-    job = bq_client.load_table_from_dataframe(
-        results_df, bigquery_prediction_table_fqtn, job_config=job_config
-    )
-    job.result()
+    if chunk_size > 0:
+        print(f"Reading predictions from {jsonl_files} in chunks of {chunk_size} rows.")
+        chunks = iter_prediction_batches(jsonl_files, batch_size=chunk_size)
+    else:
+        print(f"Reading predictions from {jsonl_files} into DataFrame.")
+        chunks = [read_predictions(jsonl_files)]
+
+    total_rows = 0
+    try:
+        for instance_df, logits in chunks:
+            results_df = to_results_df(instance_df, logits)
+            print(f"Staging {len(results_df)} predictions in {staging_table_fqtn}")
+            job = bq_client.load_table_from_dataframe(
+                results_df, staging_table_fqtn, job_config=job_config
+            )
+            job.result()
+            if not total_rows:
+                # Expires by itself if the component is killed before it deletes the table
+                staging_table = bq_client.get_table(staging_table_fqtn)
+                staging_table.expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+                bq_client.update_table(staging_table, ["expires"])
+            total_rows += len(results_df)
+
+        if total_rows:
+            copy_config = bigquery.CopyJobConfig(write_disposition="WRITE_APPEND")
+            bq_client.copy_table(staging_table_fqtn, bigquery_prediction_table_fqtn, job_config=copy_config).result()
+    finally:
+        bq_client.delete_table(staging_table_fqtn, not_found_ok=True)
+    print(f"Saved {total_rows} predictions to {bigquery_prediction_table_fqtn}")
 
     # Update the output artifact
     table = bq_client.get_table(bigquery_prediction_table_fqtn)
@@ -1,4 +1,5 @@
-from kfp.dsl import container_component, ContainerSpec, Input, Output, Model, Dataset
+from kfp.dsl import container_component, ContainerSpec, IfPresentPlaceholder, Input, Output, Model, Dataset, Artifact
+from google_cloud_pipeline_components.types.artifact_types import BQTable
 
 # This is best practice to define pushed container's image URI as a constant at the top.
 TRAIN_PREDICT_CONTAINER_IMAGE_URI = "europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest"
@@ -9,6 +10,8 @@ def train_model_op(
     train_data: Input[Dataset],
     val_data: Input[Dataset],
     output_model: Output[Model],
+    golden_data_table: Input[BQTable],
+    preprocessing_state: Output[Artifact],
     num_epochs: int,
     learning_rate: float,
     batch_size: int,
@@ -17,11 +20,25 @@ def train_model_op(
     project_id: str,
     region: str,
     experiment_name: str,
+    hyperparameters: Input[Artifact] = None,
+    latest_preprocessing_state_uri: str = "",
+    performance_mode: bool = False,
 ):
     """
     A containerized component that runs the model training task.
     It launches our pre-built custom container and passes parameters
     as command-line arguments to the trainer/task.py script inside it.
+
+    The preprocessing state (vocabularies and normalization statistics) of the training split is
+    written to the `preprocessing_state` artifact, keyed by the golden data table. When
+    `latest_preprocessing_state_uri` is set, the state stored there by the previous run is updated
+    with the changed training rows instead of being rebuilt, and replaced with the new one.
+
+    The optional `hyperparameters` artifact of tune_hyperparameters_op sets the learning rate,
+    batch size and model hyperparameters. Without it the trainer uses `learning_rate`,
+    `batch_size` and its default model hyperparameters. `performance_mode` trains with the
+    fused, XLA compiled cyclical features and steps_per_execution (see PERFORMANCE_MODE in
+    trainer/model.py).
     """
     # The ContainerSpec defines the container image to run and the command to execute inside it.
     return ContainerSpec(
@@ -41,5 +58,13 @@ def train_model_op(
             "--project-id", str(project_id),
             "--region", str(region),
             "--experiment-name", str(experiment_name),
+            IfPresentPlaceholder(
+                input_name="hyperparameters",
+                then=["--hyperparameters-path", hyperparameters.path],
+            ),
+            "--golden-data-table", golden_data_table.uri,
+            "--output-preprocessing-state-path", preprocessing_state.path,
+            "--latest-preprocessing-state-uri", latest_preprocessing_state_uri,
+            "--performance-mode", str(performance_mode),
         ]
     )
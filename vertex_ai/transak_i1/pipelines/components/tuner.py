@@ -0,0 +1,47 @@
+from kfp.dsl import container_component, ContainerSpec, Input, Output, Dataset, Artifact
+
+# This is best practice to define pushed container's image URI as a constant at the top.
+TRAIN_PREDICT_CONTAINER_IMAGE_URI = "europe-west6-docker.pkg.dev/af-finanzen/af-finanzen-mlops/transak-i1-train-predict:latest"
+
+@container_component
+def tune_hyperparameters_op(
+    train_data: Input[Dataset],
+    val_data: Input[Dataset],
+    hyperparameters: Output[Artifact],
+    num_classes: int,
+    learning_rate: float,
+    batch_size: int,
+    strategy: str = "none",
+    max_trials: int = 20,
+    max_epochs: int = 27,
+    parallel_trials: int = 4,
+    latest_preprocessing_state_uri: str = "",
+):
+    """
+    A containerized component that searches the hyperparameters of the Wide & Deep model
+    ('random', 'bayesian' or 'hyperband') on the splits of this pipeline run.
+
+    Up to `parallel_trials` trials train at the same time in worker processes of one machine.
+    The trials share one preprocessing state and one dataset snapshot and stop early on val_loss.
+    The best configuration is written as JSON to the `hyperparameters` artifact, which the
+    trainer consumes. With strategy 'none' the defaults (`learning_rate`, `batch_size` and the
+    model defaults) are written without running trials.
+    """
+    return ContainerSpec(
+        image=TRAIN_PREDICT_CONTAINER_IMAGE_URI,
+        command=[
+            "python",
+            "-m", "src.components.tuner.task",
+            "--train-data-uri", train_data.uri,
+            "--val-data-uri", val_data.uri,
+            "--output-hyperparameters-path", hyperparameters.path,
+            "--strategy", strategy,
+            "--max-trials", str(max_trials),
+            "--max-epochs", str(max_epochs),
+            "--parallel-trials", str(parallel_trials),
+            "--num-classes", str(num_classes),
+            "--learning-rate", str(learning_rate),
+            "--batch-size", str(batch_size),
+            "--latest-preprocessing-state-uri", latest_preprocessing_state_uri,
+        ]
+    )
@@ -33,6 +33,12 @@ DATASET = "transak"
 TABLE_NAME = "i1_predictions"
 CPU_LIMIT = "4"
 MEMORY_LIMIT = "15G"
+# Data steps stream BigQuery results and predictions in bounded chunks, so they need far less.
+DATA_CPU_LIMIT = "1"
+DATA_MEMORY_LIMIT = "4G"
+# One batch prediction worker process per CPU of the default container
+BATCH_PREDICT_NUM_WORKERS = 4
+BATCH_PREDICT_BATCH_SIZE = 4096
 
 
 # The @dsl.pipeline decorator defines this function as a pipeline blueprint.
@@ -70,7 +76,7 @@ def transak_i1_pipeline_predict(
         project_id=project_id,
         month=month,
         query=predict_data_query()
-    ).set_cpu_limit(os.getenv("CPU_LIMIT", cpu_limit)).set_memory_limit(os.getenv("MEMORY_LIMIT", memory_limit))
+    ).set_cpu_limit(os.getenv("DATA_CPU_LIMIT", DATA_CPU_LIMIT)).set_memory_limit(os.getenv("DATA_MEMORY_LIMIT", DATA_MEMORY_LIMIT))
     get_prediction_data.set_display_name("Get Prediction Data")
 
     # 3. Get Production Model
@@ -87,7 +93,9 @@ def transak_i1_pipeline_predict(
         location=region,
         vertex_model=get_prod_model.outputs['production_model'],
         test_data=get_prediction_data.outputs['prediction_data'],
-        experiment_name=""
+        experiment_name="",
+        batch_size=BATCH_PREDICT_BATCH_SIZE,
+        num_workers=BATCH_PREDICT_NUM_WORKERS,
     ).set_cpu_limit(os.getenv("CPU_LIMIT", cpu_limit)).set_memory_limit(os.getenv("MEMORY_LIMIT", memory_limit))
     batch_predict_production.set_display_name("Batch Predict: Production")
 
@@ -99,7 +107,7 @@ def transak_i1_pipeline_predict(
         bigquery_prediction_table_fqtn=f"{project_id}.{DATASET}.{TABLE_NAME}",
         pipeline_run_id=dsl.PIPELINE_JOB_NAME_PLACEHOLDER,
         month=month,
-    ).set_cpu_limit(os.getenv("CPU_LIMIT", cpu_limit)).set_memory_limit(os.getenv("MEMORY_LIMIT", memory_limit))
+    ).set_cpu_limit(os.getenv("DATA_CPU_LIMIT", DATA_CPU_LIMIT)).set_memory_limit(os.getenv("DATA_MEMORY_LIMIT", DATA_MEMORY_LIMIT))
     save_predictions.set_display_name("Save Predictions")
 
     # 6. Run Monitoring
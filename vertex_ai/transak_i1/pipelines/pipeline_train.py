@@ -6,6 +6,7 @@ from google.cloud import aiplatform
 from google.cloud import storage
 from pipelines.components.data_splits import data_splits_op
 from pipelines.components.trainer import train_model_op
+from pipelines.components.tuner import tune_hyperparameters_op
 from pipelines.components.register import register_model_op
 from pipelines.components.bq_config_generator import bq_config_generator_op
 from pipelines.components.bless_model import bless_model_op
@@ -29,6 +30,8 @@ TENSORBOARD_RESOURCE_NAME = os.getenv("TENSORBOARD_RESOURCE_NAME")
 PIPELINE_NAME = os.getenv("PIPELINE_NAME", "transak-i1-train")
 SERVING_CONTAINER_IMAGE_URI = os.getenv("SERVING_CONTAINER_IMAGE_URI", "europe-docker.pkg.dev/vertex-ai-restricted/prediction/tf_opt-cpu.2-17:latest")
 NOTIFICATION_CHANNEL = os.getenv("NOTIFICATION_CHANNEL")
+TUNER_CPU_LIMIT = os.getenv("TUNER_CPU_LIMIT", "8")
+TUNER_MEMORY_LIMIT = os.getenv("TUNER_MEMORY_LIMIT", "32G")
 USER_EMAILS = list(os.getenv("USER_EMAILS", "artur.fejklowicz@gmail.com").split(","))
 
 
@@ -39,6 +42,8 @@ if not all([PROJECT_ID, REGION, PIPELINE_BUCKET, TENSORBOARD_RESOURCE_NAME, NOTI
 PIPELINE_ROOT = f"{PIPELINE_BUCKET}/pipelines/{PIPELINE_NAME}"
 PIPELINE_TEMPLATE_GCS_PATH = f"{PIPELINE_ROOT}/{PIPELINE_NAME}.json"
 EXPERIMENT_NAME = f"{PIPELINE_NAME}-experiment"
+# Preprocessing state of the latest training run, updated with the changed rows by the next one
+LATEST_PREPROCESSING_STATE_URI = f"{PIPELINE_ROOT}/preprocessing_state/latest"
 PIPELINE_JOB_NAME = f"{PIPELINE_NAME}-job"
 
 
@@ -65,6 +70,11 @@ def transak_i1_pipeline_train(
     run_name: str = PIPELINE_JOB_NAME, # type: ignore
     notification_channel: str = NOTIFICATION_CHANNEL, # type: ignore
     user_emails: List[str] = USER_EMAILS, # type: ignore
+    tuning_strategy: str = "none",
+    tuning_max_trials: int = 20,
+    tuning_max_epochs: int = 27,
+    tuning_parallel_trials: int = 4,
+    performance_mode: bool = False,
 ):
     """Defines the sequence of operations in the pipeline. Pipeline orchestrator will execute them."""
     # 1. Generate BigQuery job configuration
@@ -94,25 +104,54 @@ def transak_i1_pipeline_train(
     )
     data_splits.set_display_name("Create Data Splits")
 
-    # 3. Model Training
-    train_model = train_model_op( # type: ignore
-        train_data=data_splits.outputs['train_data'],
-        val_data=data_splits.outputs['val_data'],
-        num_epochs=num_epochs,
-        learning_rate=learning_rate,
-        batch_size=batch_size,
-        num_classes=num_classes,
-        tensorboard_resource_name=tensorboard_resource_name,
-        project_id=project_id,
-        region=REGION,
-        experiment_name=experiment_name,
-    )
-    train_model.set_display_name("Train Model")
-    train_model.set_caching_options(False)
+    # Model Training (step 4), with the tuned hyperparameters when a search runs
+    def _train_model(**hyperparameters):
+        train_model = train_model_op( # type: ignore
+            train_data=data_splits.outputs['train_data'],
+            val_data=data_splits.outputs['val_data'],
+            num_epochs=num_epochs,
+            learning_rate=learning_rate,
+            batch_size=batch_size,
+            num_classes=num_classes,
+            tensorboard_resource_name=tensorboard_resource_name,
+            project_id=project_id,
+            region=REGION,
+            experiment_name=experiment_name,
+            golden_data_table=golden_data.outputs['destination_table'],
+            latest_preprocessing_state_uri=LATEST_PREPROCESSING_STATE_URI,
+            performance_mode=performance_mode,
+            **hyperparameters,
+        )
+        train_model.set_display_name("Train Model")
+        train_model.set_caching_options(False)
+        return train_model
+
+    # 3. Hyperparameter search, only its pod gets the large limits. With 'none' the trainer
+    # uses the pipeline's learning rate and batch size and its default hyperparameters.
+    with dsl.If(tuning_strategy != "none", name="Tune Hyperparameters Condition"):
+        tune_hyperparameters = tune_hyperparameters_op( # type: ignore
+            train_data=data_splits.outputs['train_data'],
+            val_data=data_splits.outputs['val_data'],
+            num_classes=num_classes,
+            learning_rate=learning_rate,
+            batch_size=batch_size,
+            strategy=tuning_strategy,
+            max_trials=tuning_max_trials,
+            max_epochs=tuning_max_epochs,
+            parallel_trials=tuning_parallel_trials,
+            latest_preprocessing_state_uri=LATEST_PREPROCESSING_STATE_URI,
+        ).set_cpu_limit(TUNER_CPU_LIMIT).set_memory_limit(TUNER_MEMORY_LIMIT)
+        tune_hyperparameters.set_display_name("Tune Hyperparameters")
+        # 4. Model Training
+        train_tuned_model = _train_model(hyperparameters=tune_hyperparameters.outputs['hyperparameters'])
+    with dsl.Else():
+        # 4. Model Training
+        train_default_model = _train_model()
+    output_model = dsl.OneOf(train_tuned_model.outputs['output_model'], train_default_model.outputs['output_model'])
 
     # 4. Model Registration
     register_model = register_model_op( # type: ignore
-        model=train_model.outputs['output_model'],
+        model=output_model,
         model_display_name=f"{PIPELINE_NAME}-model",
         serving_container_image_uri=serving_container_image_uri,
         project_id=project_id,
@@ -0,0 +1,157 @@
+from typing import Dict, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.common.dataset_io import dataset_schema, feature_schema
+
+
+def bqstorage_client():
+    """
+    Returns a BigQuery Storage Read API client, or None if the library is not installed.
+    Without it the query results are paged through the REST API.
+    """
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        print("google-cloud-bigquery-storage is not installed, reading query results through the REST API.")
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+
+def iter_query_batches(
+    bq_client,
+    query: str,
+    use_storage_api: bool = True,
+    page_size: Optional[int] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Runs the query and yields the result as Arrow record batches, one page or
+    Storage Read API stream block at a time, without materializing the whole result.
+
+    Args:
+        bq_client: A google.cloud.bigquery.Client (or a stand-in with the same query() API).
+        query: The SQL query to run.
+        use_storage_api: Read through the BigQuery Storage Read API when available.
+        page_size: Rows per page when reading through the REST API.
+    """
+    rows = bq_client.query(query).result(page_size=page_size)
+    storage_client = bqstorage_client() if use_storage_api else None
+    yield from rows.to_arrow_iterable(bqstorage_client=storage_client)
+
+
+class DatasetWriter:
+    """
+    Writes Arrow record batches to a dataset artifact incrementally, as Parquet
+    (typed with the feature schema) or CSV (fallback), so that only one batch is in memory.
+    """
+
+    def __init__(self, path: str, file_format: str = "parquet"):
+        if file_format not in ("parquet", "csv"):
+            raise ValueError(f"Unknown file format: {file_format}. Choose 'parquet' or 'csv'.")
+        self.path = path
+        self.file_format = file_format
+        self.num_rows = 0
+        self._schema = None
+        self._parquet_writer = None
+        self._csv_file = None
+
+    def _typed_schema(self, schema: pa.Schema) -> pa.Schema:
+        """Applies the declared feature/label types, other columns keep their BigQuery type."""
+        typed_columns = dataset_schema(schema.names)
+        return pa.schema([
+            typed_columns.field(field.name) if field.name in typed_columns.names else field
+            for field in schema
+        ])
+
+    def write_table(self, table: pa.Table) -> None:
+        """Appends the rows of the table. An empty table still fixes the schema of the dataset."""
+        if self._schema is None:
+            self._schema = self._typed_schema(table.schema)
+            if self.file_format == "parquet":
+                self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._csv_file = open(self.path, "w", newline="")
+                self._csv_file.write(",".join(self._schema.names) + "\n")
+
+        table = table.select(self._schema.names).cast(self._schema)
+        if self.file_format == "parquet":
+            self._parquet_writer.write_table(table)
+        elif table.num_rows:
+            table.to_pandas().to_csv(self._csv_file, header=False, index=False)
+        self.num_rows += table.num_rows
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        self.write_table(pa.Table.from_batches([batch]))
+
+    def close(self) -> None:
+        if self._schema is None:
+            # No rows at all: still create a valid (empty) dataset with the feature columns.
+            schema = feature_schema()
+            if self.file_format == "parquet":
+                pq.write_table(schema.empty_table(), self.path)
+            else:
+                with open(self.path, "w", newline="") as f:
+                    f.write(",".join(schema.names) + "\n")
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._csv_file is not None:
+            self._csv_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_query_to_dataset(
+    bq_client,
+    query: str,
+    path: str,
+    file_format: str = "parquet",
+    use_storage_api: bool = True,
+) -> int:
+    """
+    Streams the query result into a single dataset artifact.
+
+    Returns:
+        The number of rows written.
+    """
+    with DatasetWriter(path, file_format=file_format) as writer:
+        for batch in iter_query_batches(bq_client, query, use_storage_api=use_storage_api):
+            writer.write_batch(batch)
+    return writer.num_rows
+
+
+def write_query_to_split_datasets(
+    bq_client,
+    query: str,
+    paths: Dict[str, str],
+    split_column: str,
+    file_format: str = "parquet",
+    use_storage_api: bool = True,
+) -> Dict[str, int]:
+    """
+    Streams the query result into one dataset artifact per split. Each row goes to the
+    path of its `split_column` value; the split column itself is not written.
+    Rows with a split value that is not in `paths` are dropped.
+
+    Args:
+        paths: Mapping of split value (e.g. 'train') to the artifact path.
+    Returns:
+        The number of rows written per split value.
+    """
+    writers = {split: DatasetWriter(path, file_format=file_format) for split, path in paths.items()}
+    try:
+        for batch in iter_query_batches(bq_client, query, use_storage_api=use_storage_api):
+            table = pa.Table.from_batches([batch])
+            split_values = table.column(split_column)
+            table = table.drop_columns([split_column])
+            for split, writer in writers.items():
+                writer.write_table(table.filter(pc.equal(split_values, split)))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {split: writer.num_rows for split, writer in writers.items()}
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow as pa
+
+from src.common import bq_io
+from src.common.dataset_io import read_dataset
+
+
+class FakeRowIterator:
+    """Serves pre-built Arrow batches like google.cloud.bigquery.table.RowIterator."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.bqstorage_client = "not called"
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        self.bqstorage_client = bqstorage_client
+        for batch in self.batches:
+            yield batch
+
+
+class FakeQueryJob:
+    def __init__(self, row_iterator):
+        self.row_iterator = row_iterator
+
+    def result(self, page_size=None):
+        return self.row_iterator
+
+
+class FakeBigQueryClient:
+    """Local stand-in for google.cloud.bigquery.Client that serves Arrow batches."""
+
+    def __init__(self, batches):
+        self.row_iterator = FakeRowIterator(batches)
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        return FakeQueryJob(self.row_iterator)
+
+
+def _batch(tids, split_sets=None):
+    columns = {
+        'tid': pa.array(tids, type=pa.int64()),
+        'type': pa.array(['CARD_PAYMENT'] * len(tids)),
+        'started_year': pa.array([2025] * len(tids), type=pa.int64()),
+        'description': pa.array([f'shop {tid}' for tid in tids]),
+        'amount': pa.array([-12.5] * len(tids), type=pa.float64()),
+        'currency': pa.array(['CHF'] * len(tids)),
+    }
+    if split_sets is not None:
+        columns['split_set'] = pa.array(split_sets)
+    return pa.RecordBatch.from_pydict(columns)
+
+
+class TestBqIo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_write_query_to_dataset_parquet(self):
+        bq_client = FakeBigQueryClient([_batch([1, 2]), _batch([3])])
+        num_rows = bq_io.write_query_to_dataset(bq_client, "SELECT 1", self._path("data"), use_storage_api=False)
+
+        df = read_dataset(self._path("data"))
+        self.assertEqual(num_rows, 3)
+        self.assertEqual(df['tid'].tolist(), [1, 2, 3])
+        self.assertEqual(df['amount'].dtype.kind, 'f')
+        self.assertIsNone(bq_client.row_iterator.bqstorage_client)
+
+    def test_write_query_to_dataset_csv(self):
+        bq_client = FakeBigQueryClient([_batch([1, 2]), _batch([3])])
+        bq_io.write_query_to_dataset(bq_client, "SELECT 1", self._path("data"), file_format="csv", use_storage_api=False)
+
+        df = read_dataset(self._path("data"))
+        self.assertEqual(df['tid'].tolist(), [1, 2, 3])
+        self.assertEqual(df['description'].tolist(), ['shop 1', 'shop 2', 'shop 3'])
+
+    def test_write_query_to_dataset_empty_result(self):
+        bq_client = FakeBigQueryClient([])
+        num_rows = bq_io.write_query_to_dataset(bq_client, "SELECT 1", self._path("data"), use_storage_api=False)
+
+        df = read_dataset(self._path("data"))
+        self.assertEqual(num_rows, 0)
+        self.assertIn('description', df.columns)
+
+    def test_write_query_to_split_datasets(self):
+        bq_client = FakeBigQueryClient([
+            _batch([1, 2, 3], ['train', 'test', 'train']),
+            _batch([4, 5], ['validation', 'unknown']),
+        ])
+        paths = {split: self._path(split) for split in ('train', 'validation', 'test')}
+        num_rows = bq_io.write_query_to_split_datasets(
+            bq_client, "SELECT 1", paths, split_column='split_set', use_storage_api=False
+        )
+
+        self.assertEqual(num_rows, {'train': 2, 'validation': 1, 'test': 1})
+        self.assertEqual(read_dataset(paths['train'])['tid'].tolist(), [1, 3])
+        self.assertEqual(read_dataset(paths['validation'])['tid'].tolist(), [4])
+        self.assertNotIn('split_set', read_dataset(paths['test']).columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
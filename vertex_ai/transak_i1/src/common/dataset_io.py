@@ -0,0 +1,133 @@
+import os
+import re
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pa_fs
+
+from src.common.base_sql import get_feature_selection_sql
+
+PARQUET_MAGIC = b"PAR1"
+GCS_FUSE_ROOT = "/gcs"
+
+# Types of the source columns selected without transformation in get_feature_selection_sql()
+SOURCE_COLUMN_TYPES = {
+    'tid': pa.int64(),
+    'type': pa.string(),
+    'description': pa.string(),
+    'amount': pa.float64(),
+    'currency': pa.string(),
+}
+
+# Columns added on top of the features by the training query and data_splits_op
+LABEL_COLUMN_TYPES = {
+    'i1_true_label': pa.string(),
+    'i1_true_label_id': pa.int64(),
+}
+
+
+def _expression_type(expression: str) -> pa.DataType:
+    """Returns the Arrow type of a single SELECT expression of the feature query."""
+    function = expression.split("(", 1)[0].strip().upper()
+    if function in ("EXTRACT", "MOD"):
+        return pa.int64()
+    if function in ("LOWER", "UPPER", "TRIM"):
+        return pa.string()
+    if expression in SOURCE_COLUMN_TYPES:
+        return SOURCE_COLUMN_TYPES[expression]
+    raise ValueError(f"Cannot derive the Arrow type of feature expression: {expression}")
+
+
+def feature_schema() -> pa.Schema:
+    """
+    Derives the Arrow schema of the feature columns from get_feature_selection_sql(),
+    so the artifact schema follows the query whenever a feature is added or removed.
+    """
+    select_list = re.sub(r"^\s*SELECT", "", get_feature_selection_sql().strip(), flags=re.IGNORECASE)
+    fields = []
+    for item in re.split(r"\n\s*,", select_list):
+        item = " ".join(item.split())
+        if not item:
+            continue
+        match = re.match(r"(?P<expression>.+?)\s+AS\s+(?P<alias>\w+)$", item, flags=re.IGNORECASE)
+        if match:
+            expression, name = match.group("expression"), match.group("alias")
+        else:
+            expression = name = item
+        fields.append(pa.field(name, _expression_type(expression)))
+    return pa.schema(fields)
+
+
+def dataset_schema(columns: List[str]) -> pa.Schema:
+    """
+    Returns the Arrow schema for the given columns: feature and label columns get their
+    declared types, any other column is left to Arrow type inference.
+    """
+    known_types = {field.name: field.type for field in feature_schema()}
+    known_types.update(LABEL_COLUMN_TYPES)
+    return pa.schema([pa.field(name, known_types[name]) for name in columns if name in known_types])
+
+
+def _to_local_path(uri: str) -> str:
+    """Maps gs:// URIs to the Cloud Storage FUSE mount when it is available (Vertex AI jobs)."""
+    if uri.startswith("gs://") and os.path.isdir(GCS_FUSE_ROOT):
+        return f"{GCS_FUSE_ROOT}/{uri[len('gs://'):]}"
+    return uri
+
+
+def is_parquet(uri: str) -> bool:
+    """Checks the magic bytes of the file, as artifact paths have no file extension."""
+    path = _to_local_path(uri)
+    filesystem, fs_path = pa_fs.FileSystem.from_uri(path) if "://" in path else (pa_fs.LocalFileSystem(), path)
+    with filesystem.open_input_file(fs_path) as f:
+        return f.read(len(PARQUET_MAGIC)) == PARQUET_MAGIC
+
+
+def write_dataset(df: pd.DataFrame, path: str, file_format: str = "parquet") -> None:
+    """
+    Writes a split to the artifact path.
+
+    Args:
+        df: The data to write.
+        path: Local (or FUSE mounted) path of the artifact.
+        file_format: 'parquet' (typed, columnar) or 'csv' (fallback).
+    """
+    if file_format == "csv":
+        df.to_csv(path, index=False)
+    elif file_format == "parquet":
+        # Declared columns are cast to the feature schema, any other column is inferred.
+        typed_columns = dataset_schema(list(df.columns))
+        fields = [
+            typed_columns.field(name) if name in typed_columns.names
+            else pa.Schema.from_pandas(df[[name]], preserve_index=False).field(name)
+            for name in df.columns
+        ]
+        table = pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+        # Drop the pandas metadata, so readers get plain numpy dtypes like with read_csv.
+        pq.write_table(table.replace_schema_metadata(None), path)
+    else:
+        raise ValueError(f"Unknown file format: {file_format}. Choose 'parquet' or 'csv'.")
+
+
+def read_dataset(uri: str, columns: Optional[List[str]] = None, memory_map: bool = True) -> pd.DataFrame:
+    """
+    Reads a split written by write_dataset. Parquet is detected by its magic bytes,
+    anything else is read as CSV.
+
+    Args:
+        uri: Local path, FUSE path or gs:// URI of the artifact.
+        columns: Only read these columns (column projection). Reads all columns if None.
+        memory_map: Memory-map local Parquet files instead of reading them into buffers.
+    """
+    path = _to_local_path(uri)
+    if is_parquet(path):
+        print(f"Reading Parquet dataset from {path} (columns: {columns or 'all'})")
+        use_memory_map = memory_map and "://" not in path
+        table = pq.read_table(path, columns=columns, memory_map=use_memory_map)
+        return table.to_pandas()
+
+    print(f"Reading CSV dataset from {path} (columns: {columns or 'all'})")
+    df = pd.read_csv(path, usecols=columns)
+    return df[columns] if columns else df
@@ -0,0 +1,185 @@
+import numpy as np
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    """Compute softmax values for each row of scores in x."""
+    e_x = np.exp(x - np.max(x, axis=1, keepdims=True))
+    return e_x / e_x.sum(axis=1, keepdims=True)
+
+
+def confidence_thresholds(y_pred_proba: np.ndarray) -> np.ndarray:
+    """
+    Returns every unique probability (plus 0.0 and 1.0) in descending order.
+    These are the thresholds the Vertex AI classification metrics schema expects.
+    """
+    return np.unique(np.concatenate(([0.0, 1.0], y_pred_proba.ravel())))[::-1]
+
+
+def sample_thresholds(thresholds: np.ndarray, max_thresholds: int) -> np.ndarray:
+    """
+    Picks at most `max_thresholds` evenly spaced thresholds, always keeping the
+    first and the last one. Returns the thresholds unchanged if there are fewer.
+    """
+    if not max_thresholds or len(thresholds) <= max_thresholds:
+        return thresholds
+    if max_thresholds < 2:
+        raise ValueError(f"max_thresholds must be at least 2, got {max_thresholds}.")
+    indices = np.unique(np.linspace(0, len(thresholds) - 1, num=max_thresholds).round().astype(np.int64))
+    return thresholds[indices]
+
+
+def confidence_threshold_metrics(
+    y_true: np.ndarray,
+    y_pred_proba: np.ndarray,
+    num_classes: int,
+    thresholds: np.ndarray = None,
+) -> dict:
+    """
+    Computes the confidence metrics for all thresholds in a single pass.
+
+    A prediction is kept for a threshold when its max probability is >= threshold.
+    Instead of filtering and building a confusion matrix per threshold, the
+    predictions are sorted once by max probability, so the kept predictions of any
+    threshold are a prefix of that order. Cumulative counts over the prefix give
+    tp/fp/fn/tn, micro precision/recall/F1 and per-class macro F1 for every threshold.
+
+    Args:
+        y_true: True class ids, shape (N,).
+        y_pred_proba: Predicted probabilities, shape (N, C).
+        num_classes: Number of classes C.
+        thresholds: Thresholds to evaluate. Defaults to `confidence_thresholds(y_pred_proba)`.
+    Returns:
+        A dictionary of numpy arrays, one value per threshold.
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    y_pred_proba = np.asarray(y_pred_proba)
+    if thresholds is None:
+        thresholds = confidence_thresholds(y_pred_proba)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    total_instances = len(y_true)
+    total_possible_negatives = total_instances * (num_classes - 1)
+
+    # Sort once by max probability (descending), so each threshold keeps a prefix.
+    y_pred = np.argmax(y_pred_proba, axis=1)
+    y_pred_max_proba = np.max(y_pred_proba, axis=1)
+    order = np.argsort(-y_pred_max_proba, kind="stable")
+    y_true_sorted = y_true[order]
+    y_pred_sorted = y_pred[order]
+    max_proba_ascending = y_pred_max_proba[order][::-1]
+
+    # Number of kept predictions (prefix length) for each threshold
+    kept = total_instances - np.searchsorted(max_proba_ascending, thresholds, side="left")
+
+    correct = y_true_sorted == y_pred_sorted
+    cum_correct = np.concatenate(([0], np.cumsum(correct, dtype=np.int64)))
+
+    # Micro averaged metrics
+    tp = cum_correct[kept]
+    fp = kept - tp
+    fn = total_instances - tp
+    tn = total_possible_negatives - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision_micro = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 1.0)
+        recall_micro = np.where(tp + fn > 0, tp / np.maximum(tp + fn, 1), 0.0)
+        false_positive_rate = np.where(fp + tn > 0, fp / np.maximum(fp + tn, 1), 0.0)
+        precision_recall_sum = precision_micro + recall_micro
+        f1_micro = np.where(
+            precision_recall_sum > 0,
+            2 * (precision_micro * recall_micro) / np.where(precision_recall_sum > 0, precision_recall_sum, 1.0),
+            0.0,
+        )
+
+    # Macro F1: per class F1 = 2*tp / (true_count + pred_count), zero when undefined.
+    # Many thresholds keep the same prefix, so it is computed once per distinct prefix
+    # length, and classes are processed one by one to keep memory at O(N) per class.
+    kept_unique, kept_inverse = np.unique(kept, return_inverse=True)
+    f1_per_class = np.zeros((len(kept_unique), num_classes), dtype=np.float64)
+    for class_id in range(num_classes):
+        is_true = y_true_sorted == class_id
+        is_pred = y_pred_sorted == class_id
+        tp_class = np.concatenate(([0], np.cumsum(is_true & is_pred, dtype=np.int64)))[kept_unique]
+        true_class = np.concatenate(([0], np.cumsum(is_true, dtype=np.int64)))[kept_unique]
+        pred_class = np.concatenate(([0], np.cumsum(is_pred, dtype=np.int64)))[kept_unique]
+        denominator = true_class + pred_class
+        f1_per_class[:, class_id] = np.where(denominator > 0, 2 * tp_class / np.maximum(denominator, 1), 0.0)
+    f1_macro = np.where(kept_unique > 0, f1_per_class.mean(axis=1), 0.0)[kept_inverse.ravel()]
+
+    return {
+        "thresholds": thresholds,
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "tn": tn,
+        "precision_micro": precision_micro,
+        "recall_micro": recall_micro,
+        "false_positive_rate": false_positive_rate,
+        "f1_micro": f1_micro,
+        "f1_macro": f1_macro,
+    }
+
+
+def to_confidence_metrics(sweep: dict, max_predictions: int = 10000) -> list:
+    """
+    Formats the output of `confidence_threshold_metrics` as the `confidenceMetrics`
+    list of the Vertex AI classification metrics schema.
+    """
+    rows = zip(
+        sweep["thresholds"].tolist(),
+        sweep["tp"].tolist(), sweep["fp"].tolist(), sweep["fn"].tolist(), sweep["tn"].tolist(),
+        sweep["precision_micro"].tolist(), sweep["recall_micro"].tolist(),
+        sweep["false_positive_rate"].tolist(), sweep["f1_micro"].tolist(), sweep["f1_macro"].tolist(),
+    )
+    return [
+        {
+            "confidenceThreshold": threshold, "maxPredictions": max_predictions,
+            "recall": recall_micro, "precision": precision_micro,
+            "falsePositiveRate": false_positive_rate, "f1Score": f1_micro,
+            "f1ScoreMicro": f1_micro, "f1ScoreMacro": f1_macro,
+            "truePositiveCount": tp_count, "falsePositiveCount": fp_count,
+            "falseNegativeCount": fn_count, "trueNegativeCount": tn_count,
+            "recallAt1": recall_micro, "precisionAt1": precision_micro,
+            "falsePositiveRateAt1": false_positive_rate, "f1ScoreAt1": f1_micro,
+        }
+        for (threshold, tp_count, fp_count, fn_count, tn_count,
+             precision_micro, recall_micro, false_positive_rate, f1_micro, f1_macro) in rows
+    ]
+
+
+def prediction_confidence(logits: np.ndarray) -> dict:
+    """
+    Computes probabilities, predicted class ids and confidence scores for a batch of logits.
+
+    Args:
+        logits: Logits, shape (N, C).
+    Returns:
+        A dictionary with:
+            probas: Softmax probabilities, shape (N, C).
+            predicted_class_ids: Argmax class ids, shape (N,).
+            confidence_msp: Maximum softmax probability, shape (N,).
+            confidence_margin: Difference between the top two probabilities, shape (N,).
+            confidence_entropy: Entropy of the probability distribution, shape (N,).
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    probas = softmax(logits)
+    num_classes = probas.shape[1]
+
+    if num_classes > 1:
+        # Partial sort: only the two largest probabilities need to be in place.
+        top_two = np.partition(probas, num_classes - 2, axis=1)[:, -2:]
+        confidence_msp = top_two[:, 1]
+        confidence_margin = top_two[:, 1] - top_two[:, 0]
+    else:
+        confidence_msp = probas[:, 0]
+        confidence_margin = probas[:, 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence_entropy = -np.where(probas > 0, probas * np.log(probas), 0.0).sum(axis=1)
+
+    return {
+        "probas": probas,
+        "predicted_class_ids": np.argmax(probas, axis=1),
+        "confidence_msp": confidence_msp,
+        "confidence_margin": confidence_margin,
+        "confidence_entropy": confidence_entropy,
+    }
@@ -0,0 +1,216 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+from pyarrow import fs as pa_fs
+
+from src.common.dataset_io import _to_local_path
+
+DEFAULT_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "transak-i1-model-cache"))
+DEFAULT_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+MANIFEST_FILE = "manifest.json"
+MODEL_DIR = "model"
+
+# SavedModels already loaded in this process, by local cache path
+_loaded_models: Dict[str, object] = {}
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_manifest(model_dir: str) -> Dict[str, Tuple[int, str]]:
+    """Returns {relative path: (size, sha256)} of all files below model_dir."""
+    files = {}
+    for root, _, names in os.walk(model_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, model_dir)] = (os.path.getsize(path), _sha256_file(path))
+    return files
+
+
+def _content_digest(files: Dict[str, Tuple[int, str]]) -> str:
+    """Digest of the directory content, independent of where the model was downloaded from."""
+    digest = hashlib.sha256()
+    for relative_path in sorted(files):
+        size, file_hash = files[relative_path]
+        digest.update(f"{relative_path}\0{size}\0{file_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _copy_tree(source_uri: str, destination: str) -> None:
+    """Copies a model directory from GCS (FUSE mount or gs://) or a local path."""
+    source = _to_local_path(source_uri.rstrip("/"))
+    if "://" not in source:
+        shutil.copytree(source, destination)
+        return
+    filesystem, source_path = pa_fs.FileSystem.from_uri(source)
+    os.makedirs(destination)
+    pa_fs.copy_files(source_path, destination, source_filesystem=filesystem,
+                     destination_filesystem=pa_fs.LocalFileSystem())
+
+
+class ModelCache:
+    """
+    Content-addressed local cache of SavedModel directories.
+
+    A model is identified by its registry resource name + version id (or its artifact URI,
+    which is immutable per registered version). The identity points to a content digest of
+    the downloaded files, so two identities with the same files share one copy on disk:
+
+        <cache_dir>/refs/<sha256 of the identity>     -> content digest
+        <cache_dir>/objects/<digest>/model/...        SavedModel files
+        <cache_dir>/objects/<digest>/manifest.json    size and sha256 per file
+
+    Every hit is checked against the manifest; a corrupt entry is dropped and downloaded again.
+    Entries are evicted least recently used first once the cache grows beyond `max_bytes`.
+    All operations hold a file lock, so worker processes on the same node download a model once.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._refs_dir = os.path.join(cache_dir, "refs")
+        self._objects_dir = os.path.join(cache_dir, "objects")
+        os.makedirs(self._refs_dir, exist_ok=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+
+    def _lock(self):
+        lock_file = open(os.path.join(self.cache_dir, ".lock"), "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _ref_path(self, model_id: str) -> str:
+        return os.path.join(self._refs_dir, hashlib.sha256(model_id.encode("utf-8")).hexdigest())
+
+    def _object_dir(self, digest: str) -> str:
+        return os.path.join(self._objects_dir, digest)
+
+    def _read_manifest(self, digest: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._object_dir(digest), MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_intact(self, digest: str) -> bool:
+        """Checks the files of a cache entry against its manifest (sizes and sha256)."""
+        manifest = self._read_manifest(digest)
+        if manifest is None:
+            return False
+        files = _file_manifest(os.path.join(self._object_dir(digest), MODEL_DIR))
+        expected = {path: tuple(entry) for path, entry in manifest["files"].items()}
+        return files == expected and _content_digest(files) == digest
+
+    def _lookup(self, model_id: str) -> Optional[str]:
+        try:
+            with open(self._ref_path(model_id)) as f:
+                digest = json.load(f)["digest"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if self._is_intact(digest):
+            return digest
+        print(f"Model cache entry for {model_id} is missing or corrupt, downloading it again.")
+        shutil.rmtree(self._object_dir(digest), ignore_errors=True)
+        os.remove(self._ref_path(model_id))
+        return None
+
+    def _download(self, model_uri: str) -> str:
+        """Downloads the model into a staging directory and moves it to its content address."""
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.cache_dir)
+        try:
+            _copy_tree(model_uri, os.path.join(staging_dir, MODEL_DIR))
+            files = _file_manifest(os.path.join(staging_dir, MODEL_DIR))
+            digest = _content_digest(files)
+            manifest = {"source": model_uri, "size": sum(size for size, _ in files.values()), "files": files}
+            with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+                json.dump(manifest, f)
+            if self._is_intact(digest):
+                # Same content already cached under another identity
+                shutil.rmtree(staging_dir)
+            else:
+                shutil.rmtree(self._object_dir(digest), ignore_errors=True)
+                os.rename(staging_dir, self._object_dir(digest))
+            return digest
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def _entries(self):
+        """Yields (last used, size, digest) of all cache entries."""
+        for digest in os.listdir(self._objects_dir):
+            manifest_path = os.path.join(self._object_dir(digest), MANIFEST_FILE)
+            try:
+                yield os.path.getmtime(manifest_path), self._read_manifest(digest)["size"], digest
+            except (OSError, TypeError):
+                continue
+
+    def size(self) -> int:
+        """Returns the total size in bytes of the cached models."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self, keep: str) -> None:
+        """Removes least recently used entries until the cache fits into max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, digest in entries:
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            print(f"Evicting model {digest} ({size} bytes) from the model cache.")
+            shutil.rmtree(self._object_dir(digest), ignore_errors=True)
+            total -= size
+        # Refs to evicted objects are dangling now; _lookup treats them as misses.
+
+    def get(self, model_uri: str, model_id: Optional[str] = None) -> str:
+        """
+        Returns the local path of the SavedModel, downloading it on a miss.
+
+        Args:
+            model_uri: The model artifact directory (gs://, FUSE or local path).
+            model_id: Identity of the model, e.g. 'projects/.../models/123@4'. Defaults to model_uri.
+        """
+        model_id = model_id or model_uri
+        lock_file = self._lock()
+        try:
+            digest = self._lookup(model_id)
+            if digest is None:
+                start = time.perf_counter()
+                digest = self._download(model_uri)
+                with open(self._ref_path(model_id), "w") as f:
+                    json.dump({"model_id": model_id, "digest": digest}, f)
+                print(f"Cached model {model_id} in {time.perf_counter() - start:.1f}s.")
+            else:
+                print(f"Model cache hit for {model_id}.")
+            # The manifest modification time is the LRU timestamp
+            os.utime(os.path.join(self._object_dir(digest), MANIFEST_FILE))
+            self._evict(keep=digest)
+            return os.path.join(self._object_dir(digest), MODEL_DIR)
+        finally:
+            lock_file.close()
+
+
+def load_saved_model(model_uri: str, model_id: Optional[str] = None, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+    """
+    Loads a SavedModel through the local model cache and keeps it loaded for the lifetime
+    of the process, so repeated calls do not deserialize it again.
+
+    Args:
+        cache_dir: The model cache directory. None loads directly from model_uri.
+    """
+    import tensorflow as tf
+
+    local_path = ModelCache(cache_dir).get(model_uri, model_id) if cache_dir else model_uri
+    if local_path not in _loaded_models:
+        _loaded_models[local_path] = tf.saved_model.load(local_path)
+    return _loaded_models[local_path]
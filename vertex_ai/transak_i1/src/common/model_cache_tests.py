@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from src.common.model_cache import ModelCache
+
+
+def _write_model(model_dir, variables=b"weights"):
+    os.makedirs(os.path.join(model_dir, "variables"))
+    with open(os.path.join(model_dir, "saved_model.pb"), "wb") as f:
+        f.write(b"graph")
+    with open(os.path.join(model_dir, "variables", "variables.data-00000-of-00001"), "wb") as f:
+        f.write(variables)
+
+
+class TestModelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ModelCache(self._path("cache"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _path(self, *names):
+        return os.path.join(self.tmp_dir.name, *names)
+
+    def test_miss_then_hit(self):
+        _write_model(self._path("model_v1"))
+        first = self.cache.get(self._path("model_v1"))
+        # The source is gone, so the second call can only be served from the cache
+        os.remove(self._path("model_v1", "saved_model.pb"))
+        second = self.cache.get(self._path("model_v1"))
+
+        self.assertEqual(first, second)
+        with open(os.path.join(second, "saved_model.pb"), "rb") as f:
+            self.assertEqual(f.read(), b"graph")
+
+    def test_same_content_is_stored_once(self):
+        _write_model(self._path("production"))
+        _write_model(self._path("candidate"))
+        production = self.cache.get(self._path("production"), model_id="models/1@1")
+        candidate = self.cache.get(self._path("candidate"), model_id="models/1@2")
+
+        self.assertEqual(production, candidate)
+        self.assertEqual(len(os.listdir(self._path("cache", "objects"))), 1)
+
+    def test_corrupt_entry_is_downloaded_again(self):
+        _write_model(self._path("model_v1"))
+        local_path = self.cache.get(self._path("model_v1"))
+        with open(os.path.join(local_path, "saved_model.pb"), "wb") as f:
+            f.write(b"truncated")
+
+        local_path = self.cache.get(self._path("model_v1"))
+        with open(os.path.join(local_path, "saved_model.pb"), "rb") as f:
+            self.assertEqual(f.read(), b"graph")
+
+    def test_least_recently_used_is_evicted(self):
+        for version in ("v1", "v2", "v3"):
+            _write_model(self._path(version), variables=version.encode() * 100)
+        model_size = len(b"graph") + 200
+        cache = ModelCache(self._path("cache"), max_bytes=2 * model_size)
+
+        v1 = cache.get(self._path("v1"))
+        v2 = cache.get(self._path("v2"))
+        os.utime(os.path.join(os.path.dirname(v1), "manifest.json"), (0, 0))
+        os.utime(os.path.join(os.path.dirname(v2), "manifest.json"), (1, 1))
+        cache.get(self._path("v1"))  # Touch v1, so v2 is the least recently used
+        cache.get(self._path("v3"))
+
+        self.assertTrue(os.path.isdir(v1))
+        self.assertFalse(os.path.isdir(v2))
+        self.assertLessEqual(cache.size(), 2 * model_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
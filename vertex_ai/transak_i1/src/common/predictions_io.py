@@ -0,0 +1,148 @@
+import glob
+import io
+import itertools
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+from src.common.dataset_io import dataset_schema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Adhering to the Vertex AI batch prediction output naming, which the evaluation components expect
+PREDICTION_FILE_PATTERN = "prediction.results-*.jsonl"
+
+
+def _dumps(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(record).encode("utf-8")
+
+
+def _records(instances: pd.DataFrame) -> List[dict]:
+    """Converts the rows to dicts column by column, which is much faster than to_dict(orient='records')."""
+    columns = list(instances.columns)
+    values = [instances[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def prediction_file_name(shard: int = 0, num_shards: int = 1) -> str:
+    """Returns the Vertex AI style file name of a prediction results shard."""
+    return f"prediction.results-{shard:05d}-of-{num_shards:05d}.jsonl"
+
+
+def prediction_files(predictions_path: str) -> List[str]:
+    """Returns all prediction results files in the directory, in shard order."""
+    files = sorted(glob.glob(os.path.join(predictions_path, PREDICTION_FILE_PATTERN)))
+    if not files:
+        raise FileNotFoundError(f"No prediction results file found in {predictions_path}")
+    return files
+
+
+class PredictionWriter:
+    """
+    Writes batch prediction results as JSONL, one {"instance": ..., "prediction": [...]} line
+    per row, batch by batch while the model is still running.
+    Uses orjson when installed (missing values are written as null), json otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.num_rows = 0
+        self._file = open(path, "wb")
+
+    def write_batch(self, instances: pd.DataFrame, logits: np.ndarray) -> None:
+        """
+        Args:
+            instances: The input rows of the batch.
+            logits: The model output for the batch, shape (len(instances), C).
+        """
+        if len(instances) != len(logits):
+            raise ValueError(f"Got {len(instances)} instances but {len(logits)} predictions.")
+        records = _records(instances)
+        self._file.write(b"".join(
+            _dumps({"instance": instance, "prediction": prediction}) + b"\n"
+            for instance, prediction in zip(records, np.asarray(logits).tolist())
+        ))
+        self.num_rows += len(records)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Applies the declared feature/label types to the instance frame."""
+    for field in dataset_schema(list(df.columns)):
+        if pa.types.is_integer(field.type) and df[field.name].notna().all():
+            df[field.name] = df[field.name].astype(np.int64)
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            df[field.name] = df[field.name].astype(np.float64)
+    return df
+
+
+def _decode_block(lines: List[bytes], columns: Optional[List[str]]) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Decodes a block of JSONL lines with Arrow's (multithreaded) JSON reader."""
+    table = pa_json.read_json(io.BytesIO(b"".join(lines)))
+
+    instances = table.column("instance").combine_chunks()
+    names = columns or [field.name for field in instances.type]
+    instances_df = pa.Table.from_arrays([instances.field(name) for name in names], names=names).to_pandas()
+
+    predictions = table.column("prediction").combine_chunks()
+    logits = predictions.flatten().to_numpy(zero_copy_only=False).astype(np.float64)
+    return _typed_frame(instances_df), logits.reshape(len(predictions), -1)
+
+
+def iter_prediction_batches(
+    files: List[str],
+    batch_size: int = 100000,
+    columns: Optional[List[str]] = None,
+) -> Iterator[Tuple[pd.DataFrame, np.ndarray]]:
+    """
+    Reads prediction results files in batches of at most `batch_size` rows, so memory stays
+    bounded by one batch regardless of the file size.
+
+    Args:
+        files: Prediction results files, read in the given order.
+        batch_size: Maximum number of rows per batch.
+        columns: Only keep these instance columns. Keeps all if None.
+    Yields:
+        (instances, logits) with instances as a DataFrame and logits as an (n, C) array.
+    """
+    for file in files:
+        with open(file, "rb") as f:
+            lines = (line for line in f if line.strip())
+            while True:
+                block = list(itertools.islice(lines, batch_size))
+                if not block:
+                    break
+                yield _decode_block(block, columns)
+
+
+def read_predictions(
+    files: List[str],
+    columns: Optional[List[str]] = None,
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Reads all prediction results files into one instance frame and an (N, C) logits array.
+    """
+    batches = list(iter_prediction_batches(files, columns=columns))
+    if not batches:
+        return pd.DataFrame(columns=columns), np.empty((0, 0), dtype=np.float64)
+    instances = pd.concat([instances for instances, _ in batches], ignore_index=True)
+    logits = np.concatenate([logits for _, logits in batches])
+    return instances, logits
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import re
+import string
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pa_fs
+
+from src.common.dataset_io import _to_local_path
+
+# Columns the normalizer is adapted on, in the order of build_model's features_to_normalize
+NUMERIC_FEATURES = ['started_year', 'first_started_year', 'amount_log', 'amount_sign']
+CHUNK_ROWS = 65536
+OOV_TOKEN = "[UNK]"
+
+# The tokenization of TextVectorization(standardize="lower_and_strip_punctuation", split="whitespace",
+# ngrams=(1, 3)): tf.strings.lower only lowercases ASCII and tf.strings.split only splits on ASCII whitespace.
+# ngrams=(1, 3) are the widths 1 and 3 (tf.strings.ngrams), not the range 1 to 3.
+NGRAMS = (1, 3)
+
+# Bump when the stored format or the tokenization changes: states of another version are rebuilt.
+STATE_VERSION = 1
+STATE_FILE = "preprocessing_state.json"
+ROWS_FILE = "rows.parquet"
+# Columns of a training row the state depends on, kept per row to take changed or removed rows out again
+STATE_COLUMNS = ['description', 'type', 'currency', 'amount', 'started_year', 'first_started_year']
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_STRIP_PUNCTUATION = re.compile(r'[!"#$%&()\*\+,-\./:;<=>?@\[\\\]^_`{|}~\']')
+_ASCII_WHITESPACE = re.compile(r"[ \t\n\r\f\v]+")
+
+
+def description_tokens(text: str) -> List[str]:
+    """Returns the tokens and ngrams the description TextVectorization layer produces for the text."""
+    words = [word for word in _ASCII_WHITESPACE.split(_STRIP_PUNCTUATION.sub("", text.translate(_ASCII_LOWER))) if word]
+    tokens = []
+    for n in NGRAMS:
+        tokens.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+    return tokens
+
+
+def engineered_numeric_features(df: pd.DataFrame) -> np.ndarray:
+    """Returns the [N, 4] float32 input of the normalizer, computed like the AmountFeatures layer."""
+    amount = df['amount'].to_numpy(dtype=np.float32)
+    return np.column_stack([
+        df['started_year'].to_numpy(dtype=np.float32),
+        df['first_started_year'].to_numpy(dtype=np.float32),
+        np.log1p(np.abs(amount)),
+        (amount >= 0).astype(np.float32),
+    ])
+
+
+def _vocabulary(counts: Counter, max_tokens: int = None, reserved: Iterable[str] = ()) -> List[str]:
+    """
+    Orders the tokens like IndexLookup.adapt: by count, ties by the token, both descending,
+    without the reserved (mask and OOV) tokens and cut to max_tokens.
+    """
+    reserved = set(reserved)
+    vocabulary = sorted((token for token in counts if token not in reserved),
+                        key=lambda token: (counts[token], token.encode("utf-8")), reverse=True)
+    return vocabulary[:max_tokens] if max_tokens else vocabulary
+
+
+class PreprocessingState:
+    """
+    The state of the stateful preprocessing layers, learned in one scan of the training data:
+    token and ngram counts of the descriptions, value counts of type and currency and the
+    moments (count, mean, sum of squared deviations) of the engineered numeric features.
+
+    Counts and moments are mergeable, so the state of a dataset can be built chunk by chunk
+    and applied to fresh layers instead of calling adapt() once per layer. They can also be
+    subtracted, so a stored state is updated to a new snapshot by scanning only the changed rows.
+    """
+
+    def __init__(self):
+        self.description_counts = Counter()
+        self.type_counts = Counter()
+        self.currency_counts = Counter()
+        self.numeric_count = 0
+        self.numeric_mean = np.zeros(len(NUMERIC_FEATURES))
+        self.numeric_m2 = np.zeros(len(NUMERIC_FEATURES))
+
+    def _merge_moments(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Combines the moments with those of another part of the data (Chan et al.)."""
+        if count == 0:
+            return
+        total = self.numeric_count + count
+        delta = mean - self.numeric_mean
+        self.numeric_mean = self.numeric_mean + delta * count / total
+        self.numeric_m2 = self.numeric_m2 + m2 + delta ** 2 * self.numeric_count * count / total
+        self.numeric_count = total
+
+    def _remove_moments(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Takes the moments of a part of the data out again, the inverse of _merge_moments."""
+        if count == 0:
+            return
+        if count > self.numeric_count:
+            raise ValueError(f"Cannot remove {count} rows from a state of {self.numeric_count} rows.")
+        remaining = self.numeric_count - count
+        if remaining == 0:
+            self.numeric_count = 0
+            self.numeric_mean = np.zeros(len(NUMERIC_FEATURES))
+            self.numeric_m2 = np.zeros(len(NUMERIC_FEATURES))
+            return
+        remaining_mean = (self.numeric_mean * self.numeric_count - mean * count) / remaining
+        delta = mean - remaining_mean
+        self.numeric_m2 = np.maximum(self.numeric_m2 - m2 - delta ** 2 * remaining * count / self.numeric_count, 0.0)
+        self.numeric_mean = remaining_mean
+        self.numeric_count = remaining
+
+    def update(self, df: pd.DataFrame) -> 'PreprocessingState':
+        """Adds a chunk of rows. Each distinct description is tokenized once."""
+        for text, count in df['description'].value_counts().items():
+            for token in description_tokens(text):
+                self.description_counts[token] += count
+        self.type_counts.update(df['type'].value_counts().to_dict())
+        self.currency_counts.update(df['currency'].value_counts().to_dict())
+
+        numeric = engineered_numeric_features(df).astype(np.float64)
+        if len(numeric):
+            mean = numeric.mean(axis=0)
+            self._merge_moments(len(numeric), mean, ((numeric - mean) ** 2).sum(axis=0))
+        return self
+
+    def merge(self, other: 'PreprocessingState') -> 'PreprocessingState':
+        """Adds the state of another part of the data."""
+        self.description_counts.update(other.description_counts)
+        self.type_counts.update(other.type_counts)
+        self.currency_counts.update(other.currency_counts)
+        self._merge_moments(other.numeric_count, other.numeric_mean, other.numeric_m2)
+        return self
+
+    def subtract(self, other: 'PreprocessingState') -> 'PreprocessingState':
+        """Removes the state of a part of the data, e.g. of rows deleted from the golden data."""
+        for counts, other_counts in ((self.description_counts, other.description_counts),
+                                     (self.type_counts, other.type_counts),
+                                     (self.currency_counts, other.currency_counts)):
+            counts.subtract(other_counts)
+            for token in [token for token, count in counts.items() if count <= 0]:
+                del counts[token]
+        self._remove_moments(other.numeric_count, other.numeric_mean, other.numeric_m2)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            'description_counts': dict(self.description_counts),
+            'type_counts': dict(self.type_counts),
+            'currency_counts': dict(self.currency_counts),
+            'numeric_features': NUMERIC_FEATURES,
+            'numeric_count': self.numeric_count,
+            'numeric_mean': self.numeric_mean.tolist(),
+            'numeric_m2': self.numeric_m2.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'PreprocessingState':
+        if values['numeric_features'] != NUMERIC_FEATURES:
+            raise ValueError(f"The state has the numeric features {values['numeric_features']}, expected {NUMERIC_FEATURES}.")
+        state = cls()
+        state.description_counts = Counter(values['description_counts'])
+        state.type_counts = Counter(values['type_counts'])
+        state.currency_counts = Counter(values['currency_counts'])
+        state.numeric_count = int(values['numeric_count'])
+        state.numeric_mean = np.asarray(values['numeric_mean'], dtype=np.float64)
+        state.numeric_m2 = np.asarray(values['numeric_m2'], dtype=np.float64)
+        return state
+
+    @property
+    def numeric_variance(self) -> np.ndarray:
+        """Population variance, as computed by Normalization.adapt."""
+        return self.numeric_m2 / self.numeric_count
+
+    def apply(self, preprocessing_layers: Dict[str, object]) -> Dict[str, object]:
+        """
+        Sets the vocabularies and the normalization statistics on the layers created by
+        create_stateful_preprocessing_layers, with the same result as adapting each of them.
+        """
+        if self.numeric_count == 0:
+            raise ValueError("The preprocessing state is empty, there were no rows.")
+
+        vectorizer = preprocessing_layers['description_text_vectorizer']
+        max_tokens = vectorizer.get_config()['max_tokens']
+        # The mask token '' and the OOV token take the first two indices of the vocabulary
+        vectorizer.set_vocabulary(_vocabulary(self.description_counts, max_tokens - 2 if max_tokens else None,
+                                              reserved=("", OOV_TOKEN)))
+        preprocessing_layers['type_lookup'].set_vocabulary(_vocabulary(self.type_counts, reserved=(OOV_TOKEN,)))
+        preprocessing_layers['currency_lookup'].set_vocabulary(_vocabulary(self.currency_counts, reserved=(OOV_TOKEN,)))
+
+        normalizer = preprocessing_layers['normalizer']
+        if not normalizer.built:
+            normalizer.build((None, len(NUMERIC_FEATURES)))
+        normalizer.adapt_mean.assign(self.numeric_mean.astype(np.float32))
+        normalizer.adapt_variance.assign(self.numeric_variance.astype(np.float32))
+        normalizer.finalize_state()
+        return preprocessing_layers
+
+
+def build_preprocessing_state(df: pd.DataFrame, chunk_rows: int = CHUNK_ROWS) -> PreprocessingState:
+    """Builds the state of all stateful preprocessing layers in one pass over the (unshuffled) rows."""
+    state = PreprocessingState()
+    for start in range(0, len(df), chunk_rows):
+        state.update(df.iloc[start:start + chunk_rows])
+    return state
+
+
+def state_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The columns of the training rows the state depends on, with a fingerprint of each row
+    (tid and the STATE_COLUMNS). Rows are compared between two snapshots by their fingerprint.
+    """
+    rows = df[STATE_COLUMNS].reset_index(drop=True)
+    rows.insert(0, 'fingerprint', pd.util.hash_pandas_object(df[['tid'] + STATE_COLUMNS], index=False).to_numpy())
+    return rows
+
+
+def _occurrences(fingerprints: pd.Series) -> pd.MultiIndex:
+    """(fingerprint, n-th occurrence) of each row, so that duplicated rows are compared as a multiset."""
+    return pd.MultiIndex.from_arrays([fingerprints.to_numpy(), fingerprints.groupby(fingerprints.to_numpy()).cumcount().to_numpy()])
+
+
+def snapshot_fingerprint(rows: pd.DataFrame) -> str:
+    """Order independent digest of the rows of a snapshot."""
+    return hashlib.sha256(np.sort(rows['fingerprint'].to_numpy()).tobytes()).hexdigest()
+
+
+def update_preprocessing_state(state: PreprocessingState, previous_rows: pd.DataFrame, df: pd.DataFrame,
+                               chunk_rows: int = CHUNK_ROWS) -> Tuple[PreprocessingState, pd.DataFrame, dict]:
+    """
+    Updates the state built on previous_rows to the rows of df by scanning only the difference:
+    the counts and moments of new or changed rows are merged, those of removed or changed rows
+    are subtracted. Rebuilds the state from df if the difference is as large as df itself.
+
+    Returns:
+        The state of df, the state_rows of df and the number of added and removed rows.
+    """
+    rows = state_rows(df)
+    current, previous = _occurrences(rows['fingerprint']), _occurrences(previous_rows['fingerprint'])
+    added = rows[~current.isin(previous)]
+    removed = previous_rows[~previous.isin(current)]
+    delta = {'added_rows': len(added), 'removed_rows': len(removed)}
+
+    if len(added) + len(removed) >= len(rows):
+        print(f"Preprocessing state: {len(added)} added and {len(removed)} removed of {len(rows)} rows, rebuilding from all rows.")
+        return build_preprocessing_state(rows, chunk_rows), rows, delta
+    print(f"Preprocessing state: merging {len(added)} added and subtracting {len(removed)} removed rows.")
+    if len(removed):
+        state.subtract(build_preprocessing_state(removed, chunk_rows))
+    state.merge(build_preprocessing_state(added, chunk_rows))
+    return state, rows, delta
+
+
+def _filesystem(uri: str):
+    path = _to_local_path(uri.rstrip("/"))
+    if "://" in path:
+        return pa_fs.FileSystem.from_uri(path)
+    return pa_fs.LocalFileSystem(), os.path.abspath(path)
+
+
+def save_preprocessing_state(uri: str, state: PreprocessingState, rows: pd.DataFrame, snapshot: dict) -> None:
+    """
+    Writes the state as an artifact directory: preprocessing_state.json (version, snapshot key,
+    counts and moments) and rows.parquet (the state_rows it was built on, for the next delta).
+
+    Args:
+        uri: Local path, FUSE path or gs:// URI of the directory.
+        snapshot: Identifies the data the state was built on, e.g. the golden data table.
+    """
+    filesystem, path = _filesystem(uri)
+    filesystem.create_dir(path, recursive=True)
+    document = {
+        'version': STATE_VERSION,
+        'snapshot': {**snapshot, 'num_rows': len(rows), 'fingerprint': snapshot_fingerprint(rows)},
+        'state': state.to_dict(),
+    }
+    with filesystem.open_output_stream(f"{path}/{STATE_FILE}") as f:
+        f.write(json.dumps(document).encode("utf-8"))
+    pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), f"{path}/{ROWS_FILE}", filesystem=filesystem)
+    print(f"Preprocessing state of snapshot {document['snapshot']} saved to {uri}")
+
+
+def load_preprocessing_state(uri: str) -> Optional[Tuple[PreprocessingState, pd.DataFrame, dict]]:
+    """
+    Reads a state written by save_preprocessing_state.
+
+    Returns:
+        (state, rows, snapshot), or None if there is no state at uri or it has another version.
+    """
+    filesystem, path = _filesystem(uri)
+    if filesystem.get_file_info(f"{path}/{STATE_FILE}").type == pa_fs.FileType.NotFound:
+        print(f"No preprocessing state at {uri}")
+        return None
+    with filesystem.open_input_stream(f"{path}/{STATE_FILE}") as f:
+        document = json.loads(f.read().decode("utf-8"))
+    if document.get('version') != STATE_VERSION:
+        print(f"Preprocessing state at {uri} has version {document.get('version')}, expected {STATE_VERSION}.")
+        return None
+    rows = pq.read_table(f"{path}/{ROWS_FILE}", filesystem=filesystem).to_pandas()
+    return PreprocessingState.from_dict(document['state']), rows, document['snapshot']
+
+
+def load_or_build_preprocessing_state(df: pd.DataFrame, previous_uri: Optional[str] = None,
+                                      chunk_rows: int = CHUNK_ROWS) -> Tuple[PreprocessingState, pd.DataFrame]:
+    """
+    Returns the state of the training rows in df (which needs the tid column) and their state_rows.
+    The state stored at previous_uri is updated with a delta scan, without one the state is
+    built with a full scan.
+    """
+    previous = load_preprocessing_state(previous_uri) if previous_uri else None
+    if previous is None:
+        rows = state_rows(df)
+        return build_preprocessing_state(rows, chunk_rows), rows
+    state, previous_rows, snapshot = previous
+    print(f"Updating the preprocessing state of snapshot {snapshot}")
+    state, rows, _ = update_preprocessing_state(state, previous_rows, df, chunk_rows)
+    return state, rows
@@ -0,0 +1,111 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_transactions
+from src.common.preprocessing_state import (
+    PreprocessingState, build_preprocessing_state, description_tokens, load_or_build_preprocessing_state,
+    load_preprocessing_state, save_preprocessing_state, state_rows, update_preprocessing_state,
+)
+from src.common.utils import df2dataset
+from src.components.trainer.model import create_stateful_preprocessing_layers
+
+
+def _adapted_layers(df, desc_vocab_size):
+    """The layers adapted one by one, as the trainer did before"""
+    train_ds = df2dataset(df.drop(columns=['tid']), batch_size=64)
+    layers = create_stateful_preprocessing_layers({'desc_vocab_size': desc_vocab_size})
+    layers['description_text_vectorizer'].adapt(train_ds.map(lambda x, y: x['description']))
+    layers['type_lookup'].adapt(train_ds.map(lambda x, y: x['type']))
+    layers['currency_lookup'].adapt(train_ds.map(lambda x, y: x['currency']))
+    amount = df['amount'].to_numpy()
+    layers['normalizer'].adapt(np.column_stack([
+        df['started_year'], df['first_started_year'], np.log1p(np.abs(amount)), (amount >= 0).astype(np.float32),
+    ]))
+    return layers
+
+
+class TestPreprocessingState(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_transactions(3000)
+        # Punctuation, ASCII-only lowercasing, non-ASCII whitespace and ngrams across repeated words
+        self.df.loc[:5, 'description'] = [
+            "Coop-1234 Zürich", "MIGROS  ÜBERWEISUNG", "Shop Nr. 7", "a a a a", "TWINT *Café\u00a0Bar\tZH", "[UNK]",
+        ]
+
+    def test_description_tokens(self):
+        # ngrams=(1, 3) adds the trigrams, not the bigrams
+        self.assertEqual(description_tokens("Coop-1234, Zürich HB"), ["coop1234", "zürich", "hb", "coop1234 zürich hb"])
+        # Only ASCII is lowercased and the no-break space does not split
+        self.assertEqual(description_tokens("ÜBER\u00a0UNS"), ["Über\u00a0uns"])
+
+    def test_same_state_as_adapt(self):
+        for desc_vocab_size in (5000, 100):
+            adapted = _adapted_layers(self.df, desc_vocab_size)
+            layers = build_preprocessing_state(self.df, chunk_rows=700).apply(
+                create_stateful_preprocessing_layers({'desc_vocab_size': desc_vocab_size}))
+
+            for name in ('description_text_vectorizer', 'type_lookup', 'currency_lookup'):
+                self.assertEqual(layers[name].get_vocabulary(), adapted[name].get_vocabulary(), name)
+            np.testing.assert_allclose(np.asarray(layers['normalizer'].mean), np.asarray(adapted['normalizer'].mean), rtol=1e-5)
+            np.testing.assert_allclose(np.asarray(layers['normalizer'].variance), np.asarray(adapted['normalizer'].variance), rtol=1e-4)
+
+    def test_merge_equals_single_pass(self):
+        merged = build_preprocessing_state(self.df.iloc[:1000]).merge(build_preprocessing_state(self.df.iloc[1000:]))
+        single = build_preprocessing_state(self.df)
+
+        self.assertEqual(merged.description_counts, single.description_counts)
+        self.assertEqual(merged.numeric_count, single.numeric_count)
+        np.testing.assert_allclose(merged.numeric_variance, single.numeric_variance)
+
+    def test_save_and_load(self):
+        state = build_preprocessing_state(self.df)
+        with tempfile.TemporaryDirectory() as state_dir:
+            self.assertIsNone(load_preprocessing_state(state_dir))
+            save_preprocessing_state(state_dir, state, state_rows(self.df), {'golden_data_table': 'golden_data_1'})
+            loaded, rows, snapshot = load_preprocessing_state(state_dir)
+
+        self.assertEqual(loaded.description_counts, state.description_counts)
+        self.assertEqual(loaded.currency_counts, state.currency_counts)
+        np.testing.assert_array_equal(loaded.numeric_m2, state.numeric_m2)
+        pd.testing.assert_frame_equal(rows, state_rows(self.df))
+        self.assertEqual(snapshot['golden_data_table'], 'golden_data_1')
+        self.assertEqual(snapshot['num_rows'], len(self.df))
+
+    def test_delta_update_equals_rebuild(self):
+        previous = self.df.iloc[:2500]
+        # Rows 2500+ are new, 100-199 are deleted and 10-19 changed
+        current = pd.concat([self.df.iloc[:100], self.df.iloc[200:]]).copy()
+        current.loc[10:19, 'description'] = 'changed description'
+        current.loc[10:19, 'amount'] = -1.5
+
+        state, rows, delta = update_preprocessing_state(build_preprocessing_state(previous), state_rows(previous), current)
+        rebuilt = build_preprocessing_state(current)
+
+        self.assertEqual(delta, {'added_rows': 510, 'removed_rows': 110})
+        self.assertEqual(state.description_counts, rebuilt.description_counts)
+        self.assertEqual(state.type_counts, rebuilt.type_counts)
+        self.assertEqual(state.numeric_count, rebuilt.numeric_count)
+        np.testing.assert_allclose(state.numeric_mean, rebuilt.numeric_mean)
+        np.testing.assert_allclose(state.numeric_variance, rebuilt.numeric_variance)
+        pd.testing.assert_frame_equal(rows, state_rows(current))
+
+    def test_load_or_build(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            state, rows = load_or_build_preprocessing_state(self.df, state_dir)
+            save_preprocessing_state(state_dir, state, rows, {'golden_data_table': 'golden_data_1'})
+            updated, _ = load_or_build_preprocessing_state(self.df.iloc[1:], state_dir)
+
+        self.assertEqual(updated.description_counts, build_preprocessing_state(self.df.iloc[1:]).description_counts)
+        self.assertEqual(updated.numeric_count, len(self.df) - 1)
+
+    def test_empty_state(self):
+        with self.assertRaises(ValueError):
+            PreprocessingState().apply(create_stateful_preprocessing_layers({'desc_vocab_size': 10}))
+
+
+if __name__ == '__main__':
+    unittest.main()
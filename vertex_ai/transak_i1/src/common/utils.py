@@ -1,8 +1,16 @@
+import hashlib
+import os
+from typing import Optional
+
 import pandas as pd
 import numpy as np
 import tensorflow as tf
 
-def df2dataset(df: pd.DataFrame, shuffle=True, batch_size=32, mode: str = 'train'):
+LABEL_COLUMN = 'i1_true_label_id'
+
+
+def df2dataset(df: pd.DataFrame, shuffle=True, batch_size=32, mode: str = 'train',
+               cache: Optional[str] = None, snapshot_dir: Optional[str] = None):
     """
     Converts a pandas DataFrame to a tf.data.Dataset, handling different modes.
 
@@ -11,7 +19,16 @@ def df2dataset(df: pd.DataFrame, shuffle=True, batch_size=32, mode: str = 'train
         shuffle (bool): Whether to shuffle the dataset.
         batch_size (int): The batch size for the dataset.
         mode (str): 'train' to return (features, labels), 'inference' for features only.
+        cache (str): Materialized input mode for multi-epoch training. The features are reshaped
+            once in NumPy instead of by a per-element map, and the elements are cached before the
+            shuffle: '' in memory, any other value is the cache file prefix (e.g. on local disk).
+        snapshot_dir (str): Materialized input mode that also saves the elements with
+            tf.data.Dataset.save below this directory, keyed by the content of df, and loads
+            them from there in later runs on the same data.
     """
+    if cache is not None or snapshot_dir is not None:
+        return _materialized_dataset(df, shuffle, batch_size, mode, cache, snapshot_dir)
+
     df = df.copy()
     label_column = 'i1_true_label_id'
 
@@ -55,3 +72,68 @@ def df2dataset(df: pd.DataFrame, shuffle=True, batch_size=32, mode: str = 'train
         ds = ds.shuffle(buffer_size=len(df), seed=42)
         
     return ds.batch(batch_size=batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def df2inference_arrays(df: pd.DataFrame) -> dict:
+    """
+    Converts a pandas DataFrame to a dict of model inputs for inference, one already-shaped
+    [N, 1] NumPy array per feature column. Unlike df2dataset there is no tf.data pipeline and
+    no per-element map, so slices can be fed to the model directly in large batches.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame. Non-feature columns (tid, labels) are ignored.
+    """
+    non_feature_columns = {'tid', 'i1_true_label', 'i1_true_label_id'}
+    arrays = {}
+    for col in df.columns:
+        if col in non_feature_columns:
+            continue
+        values = df[col].to_numpy()
+        if np.issubdtype(values.dtype, np.number):
+            values = values.astype(np.float32)
+        else:
+            values = values.astype(object)
+        arrays[col] = values.reshape(-1, 1)
+    return arrays
+
+
+def _dataset_fingerprint(df: pd.DataFrame, mode: str) -> str:
+    """Digest of the rows, columns and dtypes of df, the key of its dataset snapshot."""
+    digest = hashlib.sha256(f"{mode}\0{list(df.columns)}\0{list(df.dtypes.astype(str))}".encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _materialized_dataset(df: pd.DataFrame, shuffle: bool, batch_size: int, mode: str,
+                          cache: Optional[str], snapshot_dir: Optional[str]) -> tf.data.Dataset:
+    """
+    The materialized input mode of df2dataset. It yields the same elements in the same order
+    as the per-element map: features of shape [1], numeric features as float32, labels as int64.
+    """
+    if mode not in ('train', 'inference'):
+        raise ValueError(f"Invalid mode: {mode}. Choose 'train' or 'inference'.")
+    if mode == 'train' and LABEL_COLUMN not in df.columns:
+        raise ValueError(f"Label column '{LABEL_COLUMN}' not found in DataFrame for training mode.")
+
+    snapshot_path = os.path.join(snapshot_dir, _dataset_fingerprint(df, mode)) if snapshot_dir else None
+    if snapshot_path and tf.io.gfile.exists(snapshot_path):
+        print(f"Loading dataset snapshot from {snapshot_path}")
+        ds = tf.data.Dataset.load(snapshot_path)
+    else:
+        # The [N, 1] columns slice into elements of shape [1], so no per-element map is needed
+        features = df2inference_arrays(df)
+        if mode == 'train':
+            ds = tf.data.Dataset.from_tensor_slices((features, df[LABEL_COLUMN].to_numpy(dtype=np.int64)))
+        else:
+            ds = tf.data.Dataset.from_tensor_slices(features)
+        if snapshot_path:
+            print(f"Saving dataset snapshot to {snapshot_path}")
+            # One shard keeps the row order, so the seeded shuffle gives the same batches as without snapshot
+            ds.save(snapshot_path, shard_func=lambda *_: np.int64(0))
+            ds = tf.data.Dataset.load(snapshot_path)
+
+    if cache is not None:
+        ds = ds.cache(cache)
+    if shuffle:
+        ds = ds.shuffle(buffer_size=len(df), seed=42)
+    return ds.batch(batch_size=batch_size).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import make_transactions
+from src.common.utils import df2dataset
+
+
+def _batches(ds):
+    return [({key: value.numpy() for key, value in features.items()}, labels.numpy()) for features, labels in ds]
+
+
+class TestDf2Dataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.df = make_transactions(200)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assertSameBatches(self, expected_ds, actual_ds):
+        self.assertEqual(expected_ds.element_spec, actual_ds.element_spec)
+        expected, actual = _batches(expected_ds), _batches(actual_ds)
+        self.assertEqual(len(expected), len(actual))
+        for (expected_features, expected_labels), (features, labels) in zip(expected, actual):
+            np.testing.assert_array_equal(labels, expected_labels)
+            for key in expected_features:
+                np.testing.assert_array_equal(features[key], expected_features[key], key)
+
+    def test_cache_in_memory_gives_same_batches(self):
+        for shuffle in (True, False):
+            self.assertSameBatches(df2dataset(self.df, shuffle=shuffle, batch_size=16),
+                                   df2dataset(self.df, shuffle=shuffle, batch_size=16, cache=''))
+
+    def test_cache_file(self):
+        ds = df2dataset(self.df, batch_size=16, cache=os.path.join(self.tmp_dir.name, "train"))
+        # The second epoch is read from the cache file
+        self.assertEqual(_batches(ds)[0][1].shape, (16,))
+        self.assertEqual(sum(len(labels) for _, labels in _batches(ds)), len(self.df))
+
+    def test_snapshot_is_reused(self):
+        snapshot_dir = os.path.join(self.tmp_dir.name, "snapshots")
+        self.assertSameBatches(df2dataset(self.df, batch_size=16),
+                               df2dataset(self.df, batch_size=16, snapshot_dir=snapshot_dir))
+        self.assertEqual(len(os.listdir(snapshot_dir)), 1)
+
+        self.assertSameBatches(df2dataset(self.df, batch_size=16),
+                               df2dataset(self.df, batch_size=16, snapshot_dir=snapshot_dir))
+        self.assertEqual(len(os.listdir(snapshot_dir)), 1)
+        # Other data gets its own snapshot
+        df2dataset(self.df.iloc[1:], batch_size=16, snapshot_dir=snapshot_dir)
+        self.assertEqual(len(os.listdir(snapshot_dir)), 2)
+
+    def test_missing_label(self):
+        with self.assertRaises(ValueError):
+            df2dataset(self.df.drop(columns=['i1_true_label_id']), cache='')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,70 @@
 import tensorflow as tf
 import pandas as pd
-import json
 import numpy as np
 from google.cloud import aiplatform
-from src.common.utils import df2dataset
+from src.common.utils import df2inference_arrays
+from src.common.dataset_io import read_dataset
+from src.common.model_cache import ModelCache, load_saved_model
+from src.common.predictions_io import PredictionWriter, prediction_file_name
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import argparse
 import sys
 import os
 
+
+def _init_worker(intra_op_threads: int):
+    """Limits TensorFlow threads per worker process, so the workers share the CPUs instead of oversubscribing them."""
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def predict_shard(model_uri: str, shard_df: pd.DataFrame, output_file_path: str, batch_size: int) -> int:
+    """
+    Loads the SavedModel once and writes the predictions of one shard to a JSONL file.
+
+    Returns:
+        The number of predictions written.
+    """
+    # 3. Load the TensorFlow model (a local cache path when the model cache is enabled)
+    loaded_model = load_saved_model(model_uri, cache_dir=None)
+    print(f"Model loaded successfully for {output_file_path}.")
+
+    # Build the [N, 1] input columns once in NumPy; no tf.data pipeline or per-element map
+    inputs = df2inference_arrays(shard_df)
+
+    # Run predictions using the 'serving_default' signature
+    # It is a concrete function with a fixed input signature ([None, 1] per feature), so large
+    # batches run through the compiled graph without retracing.
+    # Each batch is written together with its original instances while the model is still running.
+    print(f"Running predictions using 'serving_default' signature, writing to: {output_file_path}")
+    predict_fn = loaded_model.signatures['serving_default']
+    input_names = list(predict_fn.structured_input_signature[1].keys())
+    output_key = list(predict_fn.structured_outputs.keys())[0]
+    with PredictionWriter(output_file_path) as writer:
+        for start in range(0, len(shard_df), batch_size):
+            predictions_tensor = predict_fn(**{
+                name: tf.constant(inputs[name][start:start + batch_size]) for name in input_names
+            })
+            # The output of the model is a dictionary, so we need to extract the predictions.
+            batch_instances = shard_df.iloc[start:start + batch_size]
+            writer.write_batch(batch_instances, predictions_tensor[output_key].numpy())
+
+    return writer.num_rows
+
+
 def main():
     parser = argparse.ArgumentParser(description="Perform batch predictions using a trained TensorFlow model.")
     parser.add_argument("--project", type=str, required=True, help="Google Cloud project ID.")
     parser.add_argument("--location", type=str, required=True, help="Google Cloud region.")
     parser.add_argument("--vertex-model-uri", type=str, required=True, help="URI to the model registered in Vertex AI Model Registry.")
-    parser.add_argument("--test-data-uri", type=str, required=True, help="URI of the test data.")
+    parser.add_argument("--test-data-uri", type=str, required=True, help="URI of the test data (Parquet or CSV).")
     parser.add_argument("--predictions-path", type=str, required=True, help="Path to save the predictions.")
     parser.add_argument("--experiment-name", type=str, required=True, help="Vertex AI Experiment name.")
+    parser.add_argument("--batch-size", type=int, default=4096, help="Number of rows per prediction call.")
+    parser.add_argument("--num-workers", type=int, default=1, help="Number of worker processes (shards). Each loads the model once.")
+    parser.add_argument("--model-cache-dir", type=str, default=os.environ.get("MODEL_CACHE_DIR", ""),
+                        help="Model cache directory on a persistent volume. Empty string (default) loads the model directly.")
 
     args = parser.parse_args()
 
@@ -25,64 +74,48 @@ def main():
     else:
         aiplatform.init(project=args.project, location=args.location, experiment=args.experiment_name)
 
-    # 3. Load the TensorFlow model
-    loaded_model = tf.saved_model.load(args.vertex_model_uri)
-    print("Model loaded successfully.")
-    print(dir(loaded_model))
-
     # 4. Load and prepare the test data
     print(f"Loading test data from: {args.test_data_uri}")
-    test_df = pd.read_csv(args.test_data_uri)
+    test_df = read_dataset(args.test_data_uri)
 
-    # Keep original instances for the output file
-    instances = test_df.to_dict(orient='records')
+    # With a persistent cache the model is downloaded once; the workers load it from local disk
+    model_path = args.vertex_model_uri
+    if args.model_cache_dir:
+        model_path = ModelCache(args.model_cache_dir).get(args.vertex_model_uri)
 
-    # Convert DataFrame to tf.data.Dataset for consistent preprocessing
-    prediction_dataset = df2dataset(test_df, shuffle=False, batch_size=32, mode='inference')
-
-    # 5. Run predictions using the 'serving_default' signature
-    print("Running predictions using 'serving_default' signature...")
-    # This is really a oneliner, but I need to understand this so I do prediction step by step
-    predict_fn = loaded_model.signatures['serving_default']
-    all_predictions = []
-    for batch in prediction_dataset:
-        predictions_tensor = predict_fn(
-            amount=batch['amount'],
-            currency=batch['currency'],
-            description=batch['description'],
-            first_started_day=batch['first_started_day'],
-            first_started_month=batch['first_started_month'],
-            first_started_weekday=batch['first_started_weekday'],
-            first_started_year=batch['first_started_year'],
-            started_day=batch['started_day'],
-            started_month=batch['started_month'],
-            started_weekday=batch['started_weekday'],
-            started_year=batch['started_year'],
-            type=batch['type']
-        )
-        # The output of the model is a dictionary, so we need to extract the predictions.
-        output_key = list(predictions_tensor.keys())[0]
-        all_predictions.extend(predictions_tensor[output_key].numpy().tolist())
-    
-    print("Predictions generated successfully.")
-    # 6. Format and save predictions as a JSONL file
+    # 5. Format and save predictions as JSONL files
     # The predictions_path is now expected to be a directory.
-    # We will create a file inside this directory with the required prefix.
-    output_file_name = 'prediction.results-00000-of-00001.jsonl' # Adhering to Vertex AI evaluation component requirements
-    output_file_path = os.path.join(args.predictions_path, output_file_name)
+    # We will create one file per shard inside this directory with the required prefix.
     os.makedirs(args.predictions_path, exist_ok=True)
+    num_shards = max(1, min(args.num_workers, len(test_df)))
+    # Contiguous shards, so reading the files in shard order gives the rows in input order
+    bounds = np.linspace(0, len(test_df), num_shards + 1).astype(int)
+    shards = [
+        (
+            model_path,
+            test_df.iloc[bounds[shard]:bounds[shard + 1]],
+            os.path.join(args.predictions_path, prediction_file_name(shard, num_shards)),
+            args.batch_size,
+        )
+        for shard in range(num_shards)
+    ]
 
-    print(f"Writing predictions to: {output_file_path}")
+    # 6. Run predictions
+    if num_shards == 1:
+        num_rows = predict_shard(*shards[0])
+    else:
+        print(f"Running predictions in {num_shards} worker processes...")
+        intra_op_threads = max(1, (os.cpu_count() or 1) // num_shards)
+        # TensorFlow is not fork-safe, so the workers are spawned.
+        with ProcessPoolExecutor(
+            max_workers=num_shards,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(intra_op_threads,),
+        ) as executor:
+            num_rows = sum(executor.map(predict_shard, *zip(*shards)))
 
-    with open(output_file_path, 'w') as f:
-        for instance, pred in zip(instances, all_predictions):
-            json_record = json.dumps({
-                # "instance": instance_values,
-                "instance": instance,
-                "prediction": pred
-            })
-            f.write(json_record + '\n')
-    
+    print(f"Predictions generated successfully: {num_rows} rows in {num_shards} file(s).")
     print("Predictions saved successfully.")
 
 if __name__ == "__main__":
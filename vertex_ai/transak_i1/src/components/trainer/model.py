@@ -2,6 +2,40 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers # type: ignore
 
+# Model hyperparameters used when no tuned ones are given (num_classes and learning_rate come from the pipeline)
+DEFAULT_HYPERPARAMS = {
+    'desc_hash_bins': 1000,
+    'cross_bins': 5000,
+    'desc_embedding_dim': 32,
+    'type_embedding_dim': 4,
+    'currency_embedding_dim': 3,
+}
+
+# Opt-in training performance settings, off by default (see build_model)
+DEFAULT_PERFORMANCE = {
+    'fused_features': False,
+    'jit_compile': False,
+    'steps_per_execution': 1,
+    'mixed_precision': False,
+}
+# The performance mode of the trainer (--performance-mode)
+PERFORMANCE_MODE = {
+    'fused_features': True,
+    'jit_compile': True,
+    'steps_per_execution': 32,
+    'mixed_precision': False,
+}
+
+# Cyclical date inputs and their periods, in the order of the deep path's numeric features
+CYCLICAL_FEATURES = {
+    'started_month': 12,
+    'started_day': 31,
+    'started_weekday': 7,
+    'first_started_month': 12,
+    'first_started_day': 31,
+    'first_started_weekday': 7,
+}
+
 
 @tf.keras.utils.register_keras_serializable()
 class CyclicalFeature(layers.Layer):
@@ -33,6 +67,41 @@ class CyclicalFeature(layers.Layer):
         return config
     
 
+@tf.keras.utils.register_keras_serializable()
+class FusedCyclicalFeatures(layers.Layer):
+    """
+    The sin/cos transformation of several cyclical inputs in one op each: the inputs are stacked
+    into one [batch, n] tensor and transformed by a single batched sin and cos.
+    Outputs [sin_0, cos_0, sin_1, cos_1, ...], the same features as n CyclicalFeature layers concatenated.
+    With jit_compile the transformation is compiled with XLA into one fused kernel.
+    """
+    def __init__(self, periods, jit_compile=False, name=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.periods = [float(period) for period in periods]
+        self.jit_compile = bool(jit_compile)
+        # 0-based weekdays, 1-based days and months, as in CyclicalFeature
+        self._offsets = tf.constant([0.0 if period == 7.0 else 1.0 for period in self.periods])
+        self._frequencies = tf.constant([2 * np.pi / period for period in self.periods], dtype=tf.float32)
+        self._transform_fn = tf.function(self._transform, jit_compile=True) if self.jit_compile else self._transform
+
+    def _transform(self, stacked_inputs):
+        angles = (stacked_inputs - self._offsets) * self._frequencies
+        # [batch, n, 2] -> [batch, 2n], interleaving sin and cos per input
+        return tf.reshape(tf.stack([tf.math.sin(angles), tf.math.cos(angles)], axis=-1), [-1, 2 * len(self.periods)])
+
+    def call(self, inputs):
+        """inputs: list of [batch, 1] tensors, one per period."""
+        return self._transform_fn(tf.concat(inputs, axis=-1))
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0][0], 2 * len(self.periods))
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"periods": self.periods, "jit_compile": self.jit_compile})
+        return config
+
+
 @tf.keras.utils.register_keras_serializable()
 class AmountFeatures(layers.Layer):
     """
@@ -85,9 +154,18 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     """Builds the complete Wide & Deep Keras model.
     Args:
         hyperparameters: A dictionary of hyperparameters.    
+            The optional performance settings (DEFAULT_PERFORMANCE) are:
+            fused_features: the six cyclical date features in one FusedCyclicalFeatures layer.
+            jit_compile: compile the fused features with XLA. Keras cannot XLA-compile the whole
+                train step of this model (string inputs and lookups), so it is applied there.
+            steps_per_execution: number of batches run per call of the compiled train function.
+            mixed_precision: Dense and Embedding layers compute in bfloat16 (float32 variables and logits).
     Returns:
         A compiled Keras model.
     """
+    performance = {name: hyperparams.get(name, default) for name, default in DEFAULT_PERFORMANCE.items()}
+    layer_dtype = "mixed_bfloat16" if performance['mixed_precision'] else None
+
     # --- Input Layers ---
     inputs = {
         'started_month': tf.keras.Input(shape=(1,), name="started_month", dtype="float32"),
@@ -109,16 +187,16 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     type_lookup = preprocessing_layers['type_lookup'](inputs['type'])
     type_desc_cross = layers.HashedCrossing(num_bins=hyperparams['cross_bins'])([description_hashed, type_lookup])
     wide_one_hot = layers.CategoryEncoding(num_tokens=hyperparams['cross_bins'] + 1, output_mode='one_hot')(type_desc_cross)
-    wide_logits = layers.Dense(units=hyperparams['num_classes'], activation=None)(wide_one_hot)
+    wide_logits = layers.Dense(units=hyperparams['num_classes'], activation=None, dtype=layer_dtype)(wide_one_hot)
 
     # --- Deep Path ---
     # Numerical features
-    started_month = CyclicalFeature(period=12)(inputs['started_month'])
-    started_day = CyclicalFeature(period=31)(inputs['started_day'])
-    started_weekday = CyclicalFeature(period=7)(inputs['started_weekday'])
-    first_started_month = CyclicalFeature(period=12)(inputs['first_started_month'])
-    first_started_day = CyclicalFeature(period=31)(inputs['first_started_day'])
-    first_started_weekday = CyclicalFeature(period=7)(inputs['first_started_weekday'])
+    if performance['fused_features']:
+        cyclical_features = [FusedCyclicalFeatures(
+            periods=list(CYCLICAL_FEATURES.values()), jit_compile=performance['jit_compile'], name='cyclical_features'
+        )([inputs[name] for name in CYCLICAL_FEATURES])]
+    else:
+        cyclical_features = [CyclicalFeature(period=period)(inputs[name]) for name, period in CYCLICAL_FEATURES.items()]
 
     amount_features = AmountFeatures(name='amount_features')(inputs['amount'])
 
@@ -133,12 +211,7 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     # Concatenate untouched numeric and cyclic features
     all_numeric_features = layers.concatenate([
         scaled_numeric_features,
-        started_month,
-        started_day,
-        started_weekday,
-        first_started_month,
-        first_started_day,
-        first_started_weekday
+        *cyclical_features
     ])
 
     # Text features
@@ -146,21 +219,24 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     description_embedding = layers.Embedding(
         input_dim=preprocessing_layers['description_text_vectorizer'].vocabulary_size(),
         output_dim=hyperparams['desc_embedding_dim'],
-        mask_zero=True
+        mask_zero=True,
+        dtype=layer_dtype
     )(description_text_vectorizer)
     description_embedding_reduced = layers.GlobalAveragePooling1D()(description_embedding)
 
     # Categorical features
     type_embedding = layers.Embedding(
         input_dim=preprocessing_layers['type_lookup'].vocabulary_size(),
-        output_dim=hyperparams['type_embedding_dim']
+        output_dim=hyperparams['type_embedding_dim'],
+        dtype=layer_dtype
     )(type_lookup)
     type_embedding_flat = layers.Flatten()(type_embedding)
 
     currency_lookup = preprocessing_layers['currency_lookup'](inputs['currency'])
     currency_embedding = layers.Embedding(
         input_dim=preprocessing_layers['currency_lookup'].vocabulary_size(),
-        output_dim=hyperparams['currency_embedding_dim']
+        output_dim=hyperparams['currency_embedding_dim'],
+        dtype=layer_dtype
     )(currency_lookup)
     currency_embedding_flat = layers.Flatten()(currency_embedding)
 
@@ -173,13 +249,14 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     ])
 
     # DNN head
-    h1 = layers.Dense(units=64, activation="relu")(deep_features_head)
+    h1 = layers.Dense(units=64, activation="relu", dtype=layer_dtype)(deep_features_head)
     drop1 = layers.Dropout(rate=0.2)(h1)
-    h2 = layers.Dense(units=32, activation="relu")(drop1)
-    deep_logits = layers.Dense(units=hyperparams['num_classes'], activation=None)(h2)
+    h2 = layers.Dense(units=32, activation="relu", dtype=layer_dtype)(drop1)
+    deep_logits = layers.Dense(units=hyperparams['num_classes'], activation=None, dtype=layer_dtype)(h2)
 
     # Combine Heads
-    combined_logits = layers.Add()([wide_logits, deep_logits])
+    # float32 logits also with mixed precision, for a numerically stable loss
+    combined_logits = layers.Add(dtype="float32")([wide_logits, deep_logits])
     # final_output = layers.Activation("softmax")(combined_logits)
 
     # Final Model
@@ -189,7 +266,8 @@ def build_model(preprocessing_layers: dict, hyperparams:dict) -> tf.keras.Model:
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=hyperparams['learning_rate']),
         loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True), # from_logits=True is important for numerical stability, that's why we combined_logits instead final_output
-        metrics=[tf.keras.metrics.SparseCategoricalAccuracy(name="accuracy")]
+        metrics=[tf.keras.metrics.SparseCategoricalAccuracy(name="accuracy")],
+        steps_per_execution=performance['steps_per_execution']
     )
 
     return model
\ No newline at end of file
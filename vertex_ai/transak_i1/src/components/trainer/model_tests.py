@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from benchmarks.synthetic import build_adapted_model, make_transactions
+from src.common.utils import df2inference_arrays
+from src.components.trainer.model import CYCLICAL_FEATURES, PERFORMANCE_MODE, CyclicalFeature, FusedCyclicalFeatures
+
+
+def _predict(model, inputs):
+    return model({name: tf.constant(values) for name, values in inputs.items()}, training=False).numpy()
+
+
+class TestPerformanceMode(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_transactions(500)
+        self.inputs = df2inference_arrays(self.df)
+
+    def test_fused_cyclical_features(self):
+        inputs = [tf.constant(self.inputs[name]) for name in CYCLICAL_FEATURES]
+        expected = tf.concat([CyclicalFeature(period=period)(x) for x, period in zip(inputs, CYCLICAL_FEATURES.values())], axis=-1)
+        for jit_compile in (False, True):
+            fused = FusedCyclicalFeatures(periods=list(CYCLICAL_FEATURES.values()), jit_compile=jit_compile)(inputs)
+            np.testing.assert_allclose(fused.numpy(), expected.numpy(), atol=1e-5)
+
+    def test_same_predictions_with_same_weights(self):
+        default_model = build_adapted_model(self.df)
+        performance_model = build_adapted_model(self.df, hyperparams={**PERFORMANCE_MODE})
+        performance_model.set_weights(default_model.get_weights())
+
+        np.testing.assert_allclose(_predict(performance_model, self.inputs), _predict(default_model, self.inputs), atol=1e-4)
+
+    def test_save_and_load(self):
+        model = build_adapted_model(self.df, hyperparams={**PERFORMANCE_MODE})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "model.keras")
+            model.save(path)
+            loaded = tf.keras.models.load_model(path)
+        self.assertTrue(loaded.get_layer('cyclical_features').jit_compile)
+        np.testing.assert_allclose(_predict(loaded, self.inputs), _predict(model, self.inputs), atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,21 @@
 import argparse
-import pandas as pd
-import numpy as np
+import json
 import tensorflow as tf
 from tensorflow.keras import layers
 import os
 from google.cloud import aiplatform
 
 # Import model-building logic from the same package
-from .model import build_model, create_stateful_preprocessing_layers
+from .model import DEFAULT_HYPERPARAMS, PERFORMANCE_MODE, build_model, create_stateful_preprocessing_layers
 from src.common.utils import df2dataset
+from src.common.dataset_io import feature_schema, read_dataset
+from src.common.preprocessing_state import load_or_build_preprocessing_state, save_preprocessing_state
 
 def _parse_args():
     """Parses command-line arguments for the training task."""
     parser = argparse.ArgumentParser()
-    parser.add_argument('--train-data-uri', required=True, type=str, help='GCS path to the training CSV file.')
-    parser.add_argument('--val-data-uri', required=True, type=str, help='GCS path to the validation CSV file.')
+    parser.add_argument('--train-data-uri', required=True, type=str, help='GCS path to the training split (Parquet or CSV).')
+    parser.add_argument('--val-data-uri', required=True, type=str, help='GCS path to the validation split (Parquet or CSV).')
     parser.add_argument('--output-model-path', required=True, type=str, help='GCS path to save the exported model.')
     parser.add_argument('--num-epochs', required=True, type=int, help='Number of training epochs.')
     parser.add_argument('--learning-rate', required=True, type=float, help='Learning rate for the optimizer.')
@@ -24,6 +25,14 @@ def _parse_args():
     parser.add_argument('--project-id', required=True, type=str, help='GCP Project ID.')
     parser.add_argument('--region', required=True, type=str, help='GCP Region for Vertex AI resources.')
     parser.add_argument('--experiment-name', required=True, type=str, help='Name of the experiment for tracking.')
+    parser.add_argument('--hyperparameters-path', default='', type=str,
+                        help='JSON written by the tuner. Its hyperparameters replace the learning rate, batch size and model defaults.')
+    parser.add_argument('--performance-mode', default=False, type=lambda value: value.lower() == 'true',
+                        help="'true' trains with the fused and XLA compiled cyclical features and steps_per_execution.")
+    parser.add_argument('--golden-data-table', default='', type=str, help='URI of the golden data table the splits were created from.')
+    parser.add_argument('--output-preprocessing-state-path', default='', type=str, help='Path to save the preprocessing state artifact of this run.')
+    parser.add_argument('--latest-preprocessing-state-uri', default='', type=str,
+                        help='GCS path of the latest preprocessing state. It is updated with the changed training rows and replaced.')
     return parser.parse_args()
 
 
@@ -44,46 +53,46 @@ def main():
     #    resume=True
     #    ) as experiment_run:
     
-    # 1. Load Data
-    train_df = pd.read_csv(args.train_data_uri)
-    val_df = pd.read_csv(args.val_data_uri)
-
-    # Drop the 'tid' column as it's not a feature for the model
-    if 'tid' in train_df.columns:
-        train_df = train_df.drop(columns=['tid'])
-    if 'tid' in val_df.columns:
-        val_df = val_df.drop(columns=['tid'])
-
-    train_ds = df2dataset(train_df, batch_size=args.batch_size)
-    val_ds = df2dataset(val_df, shuffle=False, batch_size=args.batch_size)
+    model_hyperparams = {**DEFAULT_HYPERPARAMS, 'learning_rate': args.learning_rate, 'batch_size': args.batch_size}
+    if args.hyperparameters_path:
+        with open(args.hyperparameters_path) as f:
+            tuned = json.load(f)
+        print(f"Using the hyperparameters of the '{tuned['strategy']}' search: {tuned['hyperparameters']}")
+        model_hyperparams.update(tuned['hyperparameters'])
+    batch_size = model_hyperparams.pop('batch_size')
+    if args.performance_mode:
+        print(f"Training in performance mode: {PERFORMANCE_MODE}")
+        model_hyperparams.update(PERFORMANCE_MODE)
 
-    # 2. Create and Adapt Preprocessing Layers
+    # 1. Load Data
+    # Only read the model features and the label. The 'tid' column is not a feature for the model.
+    model_columns = [name for name in feature_schema().names if name != 'tid'] + ['i1_true_label_id']
+    # The tid identifies the rows the preprocessing state was built on
+    train_df = read_dataset(args.train_data_uri, columns=['tid'] + model_columns)
+    val_df = read_dataset(args.val_data_uri, columns=model_columns)
+
+    # Materialized input: the features are reshaped once and cached, not mapped per element in every epoch
+    train_ds = df2dataset(train_df, batch_size=batch_size, cache='')
+    val_ds = df2dataset(val_df, shuffle=False, batch_size=batch_size, cache='')
+
+    # 2. Create Preprocessing Layers and set their state
+    # One pass over the unshuffled training rows builds the vocabularies and the normalization
+    # statistics of all four layers, instead of one adapt() scan of train_ds per layer.
+    # With a latest state from a previous run only the rows added, changed or removed since are scanned.
     layer_hyperparams = {'desc_vocab_size': 5000}
     preprocessing_layers = create_stateful_preprocessing_layers(layer_hyperparams)
+    preprocessing_state, state_rows = load_or_build_preprocessing_state(train_df, args.latest_preprocessing_state_uri)
+    preprocessing_state.apply(preprocessing_layers)
 
-    preprocessing_layers['description_text_vectorizer'].adapt(train_ds.map(lambda x, y: x['description']))
-    preprocessing_layers['type_lookup'].adapt(train_ds.map(lambda x, y: x['type']))
-    preprocessing_layers['currency_lookup'].adapt(train_ds.map(lambda x, y: x['currency']))
-
-    df_for_adapt = train_df.copy()
-    df_for_adapt['amount_log'] = np.log1p(np.abs(df_for_adapt['amount']))
-    df_for_adapt['amount_sign'] = (df_for_adapt['amount'] >= 0).astype(np.float32)
-    numeric_features_for_adapt = df_for_adapt[['started_year', 'first_started_year', 'amount_log', 'amount_sign']].values
-    preprocessing_layers['normalizer'].adapt(numeric_features_for_adapt)
+    snapshot = {'golden_data_table': args.golden_data_table, 'train_data_uri': args.train_data_uri}
+    for state_uri in (args.output_preprocessing_state_path, args.latest_preprocessing_state_uri):
+        if state_uri:
+            save_preprocessing_state(state_uri, preprocessing_state, state_rows, snapshot)
 
     # 3. Build and Compile Model
-    model_hyperparams = {
-        'desc_hash_bins': 1000,
-        'cross_bins': 5000,
-        'num_classes': args.num_classes,
-        'desc_embedding_dim': 32,
-        'type_embedding_dim': 4,
-        'currency_embedding_dim': 3,
-        'learning_rate': args.learning_rate
-    }
     model = build_model(
         preprocessing_layers=preprocessing_layers, 
-        hyperparams=model_hyperparams
+        hyperparams={**model_hyperparams, 'num_classes': args.num_classes}
     )
     model.summary()
 
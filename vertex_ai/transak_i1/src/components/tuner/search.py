@@ -0,0 +1,223 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+STRATEGIES = ('none', 'random', 'bayesian', 'hyperband')
+PATIENCE = 3
+HYPERBAND_ETA = 3
+
+# ('log_uniform', low, high) or the list of values to choose from
+SEARCH_SPACE = {
+    'learning_rate': ('log_uniform', 1e-4, 3e-3),
+    'batch_size': [16, 32, 64],
+    'desc_hash_bins': [500, 1000, 2000, 5000],
+    'cross_bins': [1000, 5000, 10000],
+    'desc_embedding_dim': [16, 32, 64],
+    'type_embedding_dim': [2, 4, 8],
+    'currency_embedding_dim': [2, 3, 4],
+}
+
+
+def sample_config(rng: np.random.Generator, search_space: Dict = SEARCH_SPACE) -> Dict:
+    """Draws one configuration from the search space."""
+    config = {}
+    for name, domain in search_space.items():
+        if isinstance(domain, tuple):
+            _, low, high = domain
+            config[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            config[name] = domain[rng.integers(len(domain))]
+    return config
+
+
+def encode_config(config: Dict, search_space: Dict = SEARCH_SPACE) -> np.ndarray:
+    """Maps a configuration to [0, 1] per hyperparameter (log scale, choice index), the input of the surrogate model."""
+    values = []
+    for name, domain in search_space.items():
+        if isinstance(domain, tuple):
+            _, low, high = domain
+            values.append((np.log(config[name]) - np.log(low)) / (np.log(high) - np.log(low)))
+        else:
+            values.append(domain.index(config[name]) / max(len(domain) - 1, 1))
+    return np.asarray(values)
+
+
+# State of a worker process, set once by _init_worker and shared by all trials the worker runs
+_worker = {}
+
+
+def _init_worker(train_data_uri: str, val_data_uri: str, columns: List[str], state_dir: str,
+                 snapshot_dir: str, num_classes: int, intra_op_threads: int):
+    """
+    Loads the splits and the preprocessing state once per worker process. The datasets are
+    loaded from the snapshots written by the tuner, so no trial rebuilds or adapts anything.
+    """
+    import tensorflow as tf
+    from src.common.dataset_io import read_dataset
+    from src.common.preprocessing_state import load_preprocessing_state
+
+    # The workers share the CPUs instead of oversubscribing them
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    _worker.update({
+        'train_df': read_dataset(train_data_uri, columns=columns),
+        'val_df': read_dataset(val_data_uri, columns=columns),
+        'state': load_preprocessing_state(state_dir)[0],
+        'snapshot_dir': snapshot_dir,
+        'num_classes': num_classes,
+    })
+
+
+def run_trial(trial: Dict) -> Dict:
+    """
+    Trains build_model with the trial's hyperparameters for at most trial['epochs'] epochs,
+    stopping early on val_loss.
+
+    Returns:
+        The trial with its best val_loss, the val_accuracy of that epoch and the epochs run.
+    """
+    import tensorflow as tf
+    from src.common.utils import df2dataset
+    from src.components.trainer.model import build_model, create_stateful_preprocessing_layers
+
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(trial['seed'])
+    hyperparams = trial['hyperparameters']
+    preprocessing_layers = create_stateful_preprocessing_layers({'desc_vocab_size': 5000})
+    _worker['state'].apply(preprocessing_layers)
+    model = build_model(preprocessing_layers, {**hyperparams, 'num_classes': _worker['num_classes']})
+
+    # Loaded from the shared snapshots and cached, only the batch size differs between trials
+    train_ds = df2dataset(_worker['train_df'], batch_size=hyperparams['batch_size'], cache='', snapshot_dir=_worker['snapshot_dir'])
+    val_ds = df2dataset(_worker['val_df'], shuffle=False, batch_size=hyperparams['batch_size'], cache='', snapshot_dir=_worker['snapshot_dir'])
+    history = model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=trial['epochs'],
+        callbacks=[tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=PATIENCE)],
+        verbose=0,
+    ).history
+    best_epoch = int(np.argmin(history['val_loss']))
+    result = {
+        **trial,
+        'val_loss': float(history['val_loss'][best_epoch]),
+        'val_accuracy': float(history['val_accuracy'][best_epoch]),
+        'epochs_run': len(history['val_loss']),
+        'seconds': round(time.perf_counter() - start, 1),
+    }
+    print(f"Trial {trial['trial_id']}: val_loss {result['val_loss']:.4f} after {result['epochs_run']} epochs, {hyperparams}")
+    return result
+
+
+class TrialRunner:
+    """Runs batches of trials in parallel worker processes on one machine."""
+
+    def __init__(self, num_workers: int, initargs: tuple, seed: int = 42):
+        self.num_workers = num_workers
+        self.seed = seed
+        self.results = []
+        intra_op_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        # TensorFlow is not fork-safe, so the workers are spawned.
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(*initargs, intra_op_threads),
+        )
+
+    def run(self, configs: List[Dict], epochs: int) -> List[Dict]:
+        """Runs one trial per configuration, returns the results in the order of the configs."""
+        trials = []
+        for config in configs:
+            trial_id = len(self.results) + len(trials)
+            trials.append({'trial_id': trial_id, 'seed': self.seed + trial_id, 'epochs': epochs, 'hyperparameters': config})
+        results = list(self.executor.map(run_trial, trials))
+        self.results.extend(results)
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def random_search(runner: TrialRunner, rng: np.random.Generator, max_trials: int, max_epochs: int) -> List[Dict]:
+    return runner.run([sample_config(rng) for _ in range(max_trials)], max_epochs)
+
+
+def bayesian_search(runner: TrialRunner, rng: np.random.Generator, max_trials: int, max_epochs: int,
+                    num_candidates: int = 1000) -> List[Dict]:
+    """
+    Gaussian process on the encoded configurations of the finished trials. Each batch of
+    runner.num_workers trials takes the sampled candidates with the highest expected improvement
+    of val_loss. The first batch is random.
+    """
+    from scipy.stats import norm
+    from sklearn.gaussian_process import GaussianProcessRegressor
+    from sklearn.gaussian_process.kernels import Matern, WhiteKernel
+
+    results = runner.run([sample_config(rng) for _ in range(min(runner.num_workers, max_trials))], max_epochs)
+    while len(results) < max_trials:
+        x = np.stack([encode_config(result['hyperparameters']) for result in results])
+        y = np.asarray([result['val_loss'] for result in results])
+        gp = GaussianProcessRegressor(kernel=Matern(nu=2.5) + WhiteKernel(), normalize_y=True, random_state=runner.seed)
+        gp.fit(x, y)
+
+        candidates = [sample_config(rng) for _ in range(num_candidates)]
+        mean, std = gp.predict(np.stack([encode_config(config) for config in candidates]), return_std=True)
+        std = np.maximum(std, 1e-9)
+        z = (y.min() - mean) / std
+        expected_improvement = (y.min() - mean) * norm.cdf(z) + std * norm.pdf(z)
+        batch_size = min(runner.num_workers, max_trials - len(results))
+        results += runner.run([candidates[i] for i in np.argsort(-expected_improvement)[:batch_size]], max_epochs)
+    return results
+
+
+def hyperband_brackets(max_epochs: int, eta: int = HYPERBAND_ETA) -> List[List[tuple]]:
+    """
+    The successive halving rounds of Hyperband (Li et al.), as a list of brackets of
+    (number of trials, epochs) rounds: many trials with few epochs down to few with max_epochs.
+    """
+    s_max = int(math.log(max_epochs) / math.log(eta) + 1e-9)
+    brackets = []
+    for s in range(s_max, -1, -1):
+        num_trials = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        brackets.append([
+            (int(num_trials * eta ** -i), int(round(max_epochs * eta ** (i - s))))
+            for i in range(s + 1)
+        ])
+    return brackets
+
+
+def hyperband(runner: TrialRunner, rng: np.random.Generator, max_trials: Optional[int], max_epochs: int,
+              eta: int = HYPERBAND_ETA) -> List[Dict]:
+    """
+    Hyperband: each round of a bracket trains its configurations for more epochs and keeps the
+    best 1/eta by val_loss for the next round. Stops starting brackets after max_trials trials.
+    """
+    results = []
+    for bracket in hyperband_brackets(max_epochs, eta):
+        if max_trials and len(runner.results) >= max_trials:
+            break
+        configs = [sample_config(rng) for _ in range(bracket[0][0])]
+        for round_index, (num_trials, epochs) in enumerate(bracket):
+            round_results = runner.run(configs[:num_trials], epochs)
+            results += round_results
+            if round_index + 1 < len(bracket):
+                ranked = sorted(round_results, key=lambda result: result['val_loss'])
+                configs = [result['hyperparameters'] for result in ranked]
+    return results
+
+
+def best_trial(results: List[Dict]) -> Dict:
+    """The trial with the lowest val_loss."""
+    return min(results, key=lambda result: result['val_loss'])
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import make_transactions
+from src.common.dataset_io import write_dataset
+from src.components.tuner.search import SEARCH_SPACE, encode_config, hyperband_brackets, sample_config
+
+
+class TestSearch(unittest.TestCase):
+
+    def test_sample_config(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            config = sample_config(rng)
+            self.assertTrue(1e-4 <= config['learning_rate'] <= 3e-3)
+            self.assertIn(config['batch_size'], SEARCH_SPACE['batch_size'])
+            encoded = encode_config(config)
+            self.assertEqual(encoded.shape, (len(SEARCH_SPACE),))
+            self.assertTrue(np.all((encoded >= 0) & (encoded <= 1)))
+
+    def test_hyperband_brackets(self):
+        brackets = hyperband_brackets(max_epochs=27, eta=3)
+        self.assertEqual(brackets[0], [(27, 1), (9, 3), (3, 9), (1, 27)])
+        self.assertEqual(brackets[-1], [(4, 27)])
+        self.assertEqual(len(brackets), 4)
+
+    def test_tuner_task(self):
+        df = make_transactions(600)
+        df['i1_true_label_id'] = df['i1_true_label_id'] % 3
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_dataset(df.iloc[:500], os.path.join(tmp_dir, "train"))
+            write_dataset(df.iloc[500:], os.path.join(tmp_dir, "val"))
+            output_path = os.path.join(tmp_dir, "hyperparameters.json")
+            subprocess.run([
+                sys.executable, "-m", "src.components.tuner.task",
+                "--train-data-uri", os.path.join(tmp_dir, "train"),
+                "--val-data-uri", os.path.join(tmp_dir, "val"),
+                "--output-hyperparameters-path", output_path,
+                "--strategy", "random", "--max-trials", "2", "--max-epochs", "2", "--parallel-trials", "2",
+                "--num-classes", "3", "--learning-rate", "0.0002", "--batch-size", "16",
+            ], check=True, capture_output=True)
+            with open(output_path) as f:
+                output = json.load(f)
+
+        self.assertEqual(len(output['trials']), 2)
+        self.assertEqual(output['val_loss'], min(trial['val_loss'] for trial in output['trials']))
+        self.assertEqual(set(output['hyperparameters']), set(SEARCH_SPACE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from src.common.dataset_io import feature_schema, read_dataset
+from src.common.preprocessing_state import load_or_build_preprocessing_state, save_preprocessing_state
+from src.common.utils import df2dataset
+from src.components.trainer.model import DEFAULT_HYPERPARAMS
+from src.components.tuner.search import (
+    STRATEGIES, TrialRunner, bayesian_search, best_trial, hyperband, random_search,
+)
+
+
+def _parse_args():
+    """Parses command-line arguments for the tuning task."""
+    parser = argparse.ArgumentParser(description="Search the hyperparameters of the Wide & Deep model.")
+    parser.add_argument('--train-data-uri', required=True, type=str, help='GCS path to the training split (Parquet or CSV).')
+    parser.add_argument('--val-data-uri', required=True, type=str, help='GCS path to the validation split (Parquet or CSV).')
+    parser.add_argument('--output-hyperparameters-path', required=True, type=str, help='Path to save the best hyperparameters (JSON).')
+    parser.add_argument('--strategy', default='none', choices=STRATEGIES,
+                        help="'none' writes the default hyperparameters without running trials.")
+    parser.add_argument('--max-trials', default=20, type=int, help='Maximum number of trials.')
+    parser.add_argument('--max-epochs', default=27, type=int, help='Maximum epochs per trial (early stopping on val_loss).')
+    parser.add_argument('--parallel-trials', default=4, type=int, help='Number of trials run at the same time, one worker process each.')
+    parser.add_argument('--num-classes', required=True, type=int, help='Number of output classes.')
+    parser.add_argument('--learning-rate', required=True, type=float, help='Default learning rate.')
+    parser.add_argument('--batch-size', required=True, type=int, help='Default batch size.')
+    parser.add_argument('--latest-preprocessing-state-uri', default='', type=str,
+                        help='GCS path of the latest preprocessing state, updated with the changed rows for the trials (read only).')
+    parser.add_argument('--seed', default=42, type=int)
+    return parser.parse_args()
+
+
+def main():
+    """Main entrypoint for the tuning task."""
+    args = _parse_args()
+    defaults = {**DEFAULT_HYPERPARAMS, 'learning_rate': args.learning_rate, 'batch_size': args.batch_size}
+    output = {'strategy': args.strategy, 'hyperparameters': defaults, 'trials': []}
+
+    if args.strategy != 'none':
+        columns = ['tid'] + [name for name in feature_schema().names if name != 'tid'] + ['i1_true_label_id']
+        train_df = read_dataset(args.train_data_uri, columns=columns)
+        val_df = read_dataset(args.val_data_uri, columns=columns)
+
+        with tempfile.TemporaryDirectory() as workspace:
+            # Adapted and materialized once, the trials only load them
+            state_dir = os.path.join(workspace, "preprocessing_state")
+            snapshot_dir = os.path.join(workspace, "snapshots")
+            state, rows = load_or_build_preprocessing_state(train_df, args.latest_preprocessing_state_uri)
+            save_preprocessing_state(state_dir, state, rows, {'train_data_uri': args.train_data_uri})
+            df2dataset(train_df, snapshot_dir=snapshot_dir)
+            df2dataset(val_df, shuffle=False, snapshot_dir=snapshot_dir)
+
+            rng = np.random.default_rng(args.seed)
+            initargs = (args.train_data_uri, args.val_data_uri, columns, state_dir, snapshot_dir, args.num_classes)
+            print(f"Running the '{args.strategy}' search in {args.parallel_trials} worker processes...")
+            with TrialRunner(args.parallel_trials, initargs, seed=args.seed) as runner:
+                if args.strategy == 'random':
+                    random_search(runner, rng, args.max_trials, args.max_epochs)
+                elif args.strategy == 'bayesian':
+                    bayesian_search(runner, rng, args.max_trials, args.max_epochs)
+                else:
+                    hyperband(runner, rng, args.max_trials, args.max_epochs)
+                results = runner.results
+
+        best = best_trial(results)
+        print(f"Best trial {best['trial_id']}: val_loss {best['val_loss']:.4f}, {best['hyperparameters']}")
+        output.update({'hyperparameters': best['hyperparameters'], 'val_loss': best['val_loss'],
+                       'val_accuracy': best['val_accuracy'], 'trials': results})
+
+    os.makedirs(os.path.dirname(args.output_hyperparameters_path) or ".", exist_ok=True)
+    with open(args.output_hyperparameters_path, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Hyperparameters saved to {args.output_hyperparameters_path}: {output['hyperparameters']}")
+
+
+if __name__ == '__main__':
+    main()